@@ -1,30 +1,55 @@
+import os
 import streamlit as st
 import pandas as pd
 st.set_page_config(layout="wide")
 import data_preparation as dp
+import event_store as es
+import instrumentation as ins
+import possession_chains as pc
+import rolling_form as rf
 import visualizations as vz
 
+# set SDA_PERFORMANCE_LOG to a file to collect the timings of all sessions as JSON lines
+ins.configure_log(os.environ.get('SDA_PERFORMANCE_LOG'))
+ins.start_run('app')
+show_diagnostics = st.sidebar.checkbox('Show performance diagnostics', value=False)
+
 
 st.image('https://www.coolisache.ch/wp-content/uploads/2023/02/fa_women_super_league.jpg')
 st.title("FA Women's Super League Analysis")
 st.text('Welcome to this Streamlit app! In this dashboard, the 2018/19 season of the Arsenal WFC and the Chelsea FCW '
         'is analysed.')
 
+# the data is fetched and refreshed by a background worker, a session only reads the current version
+dp.shared.start_refresh(37, 4, ['Chelsea FCW', 'Arsenal WFC'])
+# the whole script run uses the same version, even if a refresh swaps in a new one meanwhile
+catalog = dp.shared.get()
+if not dp.is_season_cached(37, 4):
+    st.info('The data of the 2018/19 season is being prepared, please reload the page in a few minutes.')
+    st.stop()
 
-df_events_18_19_cfc = pd.read_csv('data/events_18_19_cfc.csv')
-df_events_18_19_afc = pd.read_csv('data/events_18_19_afc.csv')
 
-# use rank to give each date a number that increases with the date
-df_events_18_19_cfc['date_number'] = df_events_18_19_cfc['match_date'].rank(method='dense').astype(int)
-df_events_18_19_afc['date_number'] = df_events_18_19_afc['match_date'].rank(method='dense').astype(int)
+with ins.span('load events'):
+    # every view only loads the columns and rows it uses
+    df_pressure_18_19_cfc = catalog.view(37, 4, 'Chelsea FCW', vz.PRESSURE_MAP_PROJECTION)
+    df_pressure_18_19_afc = catalog.view(37, 4, 'Arsenal WFC', vz.PRESSURE_MAP_PROJECTION)
+    df_shots_18_19_cfc = catalog.view(37, 4, 'Chelsea FCW', vz.SHOT_MAP_PROJECTION)
+    df_shots_18_19_afc = catalog.view(37, 4, 'Arsenal WFC', vz.SHOT_MAP_PROJECTION)
 
-df_match_week_cfc_18_19 = dp.generate_match_week_df(df_events_18_19_cfc, 'Chelsea FCW')
-df_match_week_afc_18_19 = dp.generate_match_week_df(df_events_18_19_afc, 'Arsenal WFC')
+    # versions of the events files, used as cache key for the rendered pitch maps
+    version_cfc = catalog.events_version(competition_id=37, season_id=4, team_name='Chelsea FCW')
+    version_afc = catalog.events_version(competition_id=37, season_id=4, team_name='Arsenal WFC')
 
+with ins.span('load match week stats'):
+    # precomputed match week statistics of every team of the 2018/19 season
+    df_match_week_18_19 = catalog.match_week_stats(competition_id=37, season_id=4)
+    # rolling form of every team, new matches are added to it incrementally
+    form_18_19 = catalog.rolling_form(competition_id=37, season_id=4)
 
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Intro", "Match Week Stats (Team individual)",
-                                              "Match Week Stats (Team Comparison)", "Season Stats",
-                                              "Arsenal vs. Chelsea", "Instructions and Data Sources"])
+tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Intro", "Match Week Stats (Team individual)",
+                                                    "Match Week Stats (Team Comparison)", "Season Stats",
+                                                    "Arsenal vs. Chelsea", "Player Comparison",
+                                                    "Instructions and Data Sources"])
 
 
 # TAB 1: INTRO
@@ -52,13 +77,14 @@ with tab2:
             stats_lst = st.multiselect(label='Select the variables',
                                        options=['GoalsScored', 'GoalsConceded', 'Shots', 'ShotOffT', 'ShotsBlocked',
                                                 'ShotsSaved', 'ShotXG', 'Clearances', 'PassLengthSum', 'PassLengthAvg',
-                                                'PassCnt'])
+                                                'PassCnt'] + rf.FORM_METRICS)
         with col2:
-            team_selection = st.selectbox(label='Select the team', options=['Arsenal WFC', 'Chelsea FCW'])
-        if team_selection == 'Arsenal WFC':
-            st.plotly_chart(vz.plot_ind_match_week(df_match_week_afc_18_19, stats_lst), use_container_width=True)
-        if team_selection == 'Chelsea FCW':
-            st.plotly_chart(vz.plot_ind_match_week(df_match_week_cfc_18_19, stats_lst), use_container_width=True)
+            team_selection = st.selectbox(label='Select the team',
+                                          options=df_match_week_18_19.index.unique(level='team_name').tolist())
+        with ins.span('plot match week', team=team_selection):
+            df_team_match_week = df_match_week_18_19.loc[team_selection].join(
+                form_18_19.to_frame(team_selection))
+            st.plotly_chart(vz.plot_ind_match_week(df_team_match_week, stats_lst), use_container_width=True)
 
     with st.expander("**Variable information**", expanded=False):
         st.markdown("Several variables of each match week were aggregated. The variables are described below:")
@@ -68,13 +94,31 @@ with tab2:
 # TAB 3: MATCH WEEK STATS (TEAM COMPARISON)
 with tab3:
     with st.expander("**Team Comparison**", expanded=True):
-        stat = st.selectbox(label='Select the variable', options=['GoalsScored', 'GoalsConceded', 'Shots',
-                                                                  'ShotOffT', 'ShotsBlocked', 'ShotsSaved',
-                                                                  'ShotXG', 'Clearances', 'PassLengthSum',
-                                                                  'PassLengthAvg', 'PassCnt'])
+        col1, col2 = st.columns([2, 2])
+        with col1:
+            stat = st.selectbox(label='Select the variable', options=['GoalsScored', 'GoalsConceded', 'Shots',
+                                                                      'ShotOffT', 'ShotsBlocked', 'ShotsSaved',
+                                                                      'ShotXG', 'Clearances', 'PassLengthSum',
+                                                                      'PassLengthAvg', 'PassCnt'])
+        with col2:
+            comp_teams = st.multiselect(label='Select the teams',
+                                        options=df_match_week_18_19.index.unique(level='team_name').tolist(),
+                                        default=['Chelsea FCW', 'Arsenal WFC'])
+
+        with ins.span('plot team comparison', stat=stat):
+            st.plotly_chart(vz.plot_match_week_team_comp(df_match_week_18_19, stat, comp_teams),
+                            use_container_width=True)
 
-        st.plotly_chart(vz.plot_match_week_team_comp(df_match_week_cfc_18_19, df_match_week_afc_18_19, stat),
-                        use_container_width=True)
+    with st.expander("**Simulated league table**", expanded=False):
+        st.markdown("Each shot of the season is simulated as a goal with the probability of its expected goals (xG). "
+                    "Replaying all matches 100,000 times gives the expected points (xPts) of each team and its "
+                    "chances to win the title or to be relegated.")
+        with ins.span('load season simulation'):
+            simulation_18_19 = catalog.season_simulation(competition_id=37, season_id=4)
+        st.dataframe(simulation_18_19.table.round(3), use_container_width=True)
+        st.dataframe(simulation_18_19.matches[['match_date', 'home_team_name', 'away_team_name', 'home_score',
+                                               'away_score', 'home_xg', 'away_xg', 'home_win', 'draw', 'away_win',
+                                               'most_likely_score']].round(3), use_container_width=True)
 
     with st.expander("**Variable information**", expanded=False):
         st.markdown("Several variables of each match week were aggregated. The variables are described below:")
@@ -83,59 +127,125 @@ with tab3:
 
 # TAB 4: SEASON STATS
 with tab4:
-    tab3_input = st.selectbox('Select the graph:', ['Pressure map', 'Shot map'])
+    tab3_input = st.selectbox('Select the graph:', ['Pressure map', 'Shot map', 'Shot context'])
     if tab3_input == 'Pressure map':
         st.markdown("The pressure maps show the pressure applied in the different areas of the pitch.")
         col1, col2, col3 = st.columns([2, 0.8, 2])
         with col1:
-            fig = vz.create_pressure_maps(df_events_18_19_cfc, 'Chelsea FCW')
-            st.pyplot(fig)
+            st.image(vz.render_figure(vz.create_pressure_maps, version_cfc, df_pressure_18_19_cfc, 'Chelsea FCW'))
         with col2:
             st.markdown("")
         with col3:
-            fig = vz.create_pressure_maps(df_events_18_19_afc, 'Arsenal WFC')
-            st.pyplot(fig)
+            st.image(vz.render_figure(vz.create_pressure_maps, version_afc, df_pressure_18_19_afc, 'Arsenal WFC'))
     if tab3_input == 'Shot map':
         st.markdown("The plots show the attempted shots over the course of the season, whereas the goals are "
                     "highlighted in red.")
         col1, col2 = st.columns([2, 2])
         with col1:
-            st.pyplot(vz.create_shot_map(df_events_18_19_cfc, 'Chelsea FCW'))
+            st.image(vz.render_figure(vz.create_shot_map, version_cfc, df_shots_18_19_cfc, 'Chelsea FCW'))
         with col2:
-            st.pyplot(vz.create_shot_map(df_events_18_19_afc, 'Arsenal WFC'))
+            st.image(vz.render_figure(vz.create_shot_map, version_afc, df_shots_18_19_afc, 'Arsenal WFC'))
+
+    if tab3_input == 'Shot context':
+        st.markdown("The plots show the shots colored by the number of defenders between the shooter and the goal "
+                    "at the moment of the shot, the goals have a red border and the crosses mark the goalkeeper.")
+        with ins.span('load shot features'):
+            df_shot_features = catalog.shot_features(competition_id=37, season_id=4)
+        col1, col2 = st.columns([2, 2])
+        with col1:
+            st.image(vz.render_figure(vz.create_shot_context_map, catalog.version, df_shot_features, 'Chelsea FCW'))
+        with col2:
+            st.image(vz.render_figure(vz.create_shot_context_map, catalog.version, df_shot_features, 'Arsenal WFC'))
+        df_context = df_shot_features[df_shot_features.team_name.isin(['Chelsea FCW', 'Arsenal WFC'])]
+        st.dataframe(df_context.groupby('team_name')[['shot_statsbomb_xg', 'distance', 'angle', 'defenders_in_cone',
+                                                      'nearest_defender_distance', 'goalkeeper_distance']]
+                     .mean().round(2), use_container_width=True)
 
 
 # TAB 5: ARSENAL VS CHELSEA
 with tab5:
+    with ins.span('load match index'):
+        match_index_18_19 = catalog.match_index(competition_id=37, season_id=4)
+    df_fixtures = pd.concat([match_index_18_19.team_matches('Chelsea FCW'),
+                             match_index_18_19.team_matches('Arsenal WFC')]).drop_duplicates('match_id')
+    # the matches between Arsenal and Chelsea are shown first
+    df_fixtures = df_fixtures.assign(
+        derby=df_fixtures.home_team_name.isin(['Chelsea FCW', 'Arsenal WFC']) &
+        df_fixtures.away_team_name.isin(['Chelsea FCW', 'Arsenal WFC'])
+    ).sort_values(['derby', 'match_date'], ascending=[False, True])
+    fixture_labels = {match.match_id: f'{match.home_team_name} ({match.home_score}) - {match.away_team_name} '
+                                      f'({match.away_score}): {pd.Timestamp(match.match_date):%d.%m.%Y}'
+                      for match in df_fixtures.itertuples()}
+
     col1, col2 = st.columns([2, 2])
     with col1:
-        selected_match = st.selectbox('Select the match:', ['Chelsea (0) - Arsenal (5): 14.10.2018 15:00',
-                                                            'Arsenal (1) - Chelsea (2): 13.01.2019 13:30'])
+        selected_match = st.selectbox('Select the match:', list(fixture_labels), format_func=fixture_labels.get)
+    fixture = df_fixtures[df_fixtures.match_id == selected_match].iloc[0]
     with col2:
-        selected_team = st.selectbox('Select the team:', ['Chelsea FCW', 'Arsenal WFC'], key='team_selection')
+        selected_team = st.selectbox('Select the team:', [fixture.home_team_name, fixture.away_team_name],
+                                     key='team_selection')
+
+    pass_map_type = st.radio('Select the graph:', ['Player pass maps', 'Pass network'], horizontal=True)
 
     st.markdown('---')
 
-    if selected_match == 'Chelsea (0) - Arsenal (5): 14.10.2018 15:00':
+    if selected_match == 19736:
         st.markdown("The match between Chelsea and Arsenal took place on the 14th of October 2018 at Kingsmeadow "
                     "Stadium. The match ended with a 5-0 victory for Arsenal. The following plot shows the passes of "
                     "each player of this match.")
-        if selected_team == 'Chelsea FCW':
-            st.pyplot(vz.create_pass_map('first', 'home'))
-        if selected_team == 'Arsenal WFC':
-            st.pyplot(vz.create_pass_map('first', 'away'))
-
-    if selected_match == 'Arsenal (1) - Chelsea (2): 13.01.2019 13:30':
+    elif selected_match == 19785:
         st.markdown("The match between Arsenal and Chelsea took place on the 13th of January 2019 at Meadow Park. "
                     "The following plot shows the passes of each player of this match.")
-        if selected_team == 'Chelsea FCW':
-            st.pyplot(vz.create_pass_map('second', 'away'))
-        if selected_team == 'Arsenal WFC':
-            st.pyplot(vz.create_pass_map('second', 'home'))
+    else:
+        st.markdown("The following plot shows the passes of each player of this match.")
+    # the figures of the match are cached per data version, a match StatsBomb updated is rendered again
+    match_version = f'{catalog.version}-match-{selected_match}'
+    if pass_map_type == 'Player pass maps':
+        st.image(vz.render_figure(vz.create_pass_map, match_version,
+                                  match_index_18_19.events(selected_match), match_index_18_19.lineup(selected_match),
+                                  selected_team))
+    else:
+        opponent = fixture.away_team_name if selected_team == fixture.home_team_name else fixture.home_team_name
+        network = pc.select_network(catalog.pass_networks(competition_id=37, season_id=4), selected_match,
+                                    selected_team)
+        st.image(vz.render_figure(vz.create_pass_network, match_version, network.nodes, network.edges,
+                                  selected_team, opponent))
+        st.markdown("The table ranks the players of the team by the expected goals of the possessions they were "
+                    "involved in over the whole season (xGChain), the same without their own shots and key passes "
+                    "(xGBuildup) and the expected goals of the shots they assisted.")
+        df_xg_chain = catalog.player_xg_chain(competition_id=37, season_id=4)
+        st.dataframe(df_xg_chain[df_xg_chain['team_name'] == selected_team].round(2), use_container_width=True)
 
 
-# TAB 6: INSTRUCTIONS AND DATA SOURCES
+# TAB 6: PLAYER COMPARISON
 with tab6:
+    with ins.span('load player stats'):
+        df_player_match_18_19 = catalog.player_match_stats(competition_id=37, season_id=4)
+    min_minutes = st.slider('Minimum minutes played', min_value=0, max_value=900, value=270, step=90)
+    df_players_18_19 = dp.get_player_season_stats(df_player_match_18_19, min_minutes)
+    player_labels = {player_id: f'{player.player_name} ({vz.get_short_name(player.team_name)})'
+                     for player_id, player in df_players_18_19.iterrows()}
+    col1, col2 = st.columns([2, 2])
+    with col1:
+        comp_players = st.multiselect(label='Select the players', options=list(player_labels),
+                                      format_func=player_labels.get, default=list(player_labels)[:2])
+    with col2:
+        player_stats = st.multiselect(label='Select the variables',
+                                      options=['PassesPer90', 'PassCompletion', 'PressuresPer90', 'ShotsPer90',
+                                               'GoalsPer90', 'ShotXGPer90', 'Minutes'],
+                                      default=['PassesPer90', 'PassCompletion', 'PressuresPer90', 'ShotsPer90',
+                                               'ShotXGPer90'])
+    if comp_players and len(player_stats) >= 3:
+        with ins.span('plot player comparison'):
+            st.plotly_chart(vz.plot_player_comparison(df_players_18_19, comp_players, player_stats),
+                            use_container_width=True)
+    else:
+        st.markdown('Select at least one player and three variables.')
+    st.dataframe(df_players_18_19.loc[comp_players].set_index('player_name').round(2), use_container_width=True)
+
+
+# TAB 7: INSTRUCTIONS AND DATA SOURCES
+with tab7:
     st.markdown("The data is sourced from [StatsBomb](https://statsbomb.com/) and accessed using the "
                 "StatsBomb API for which a function is implemented in the "
                 "[mplsoccer](https://mplsoccer.readthedocs.io/en/latest/index.html) Python library. StatsBomb is a "
@@ -147,3 +257,27 @@ with tab6:
 
     st.markdown("To run this dashboard locally, navigate to the directory the file is located in the terminal and run "
                 "the command `streamlit run app.py`.")
+
+
+# PERFORMANCE DIAGNOSTICS
+run_summary = ins.finish_run()
+if show_diagnostics:
+    with st.sidebar:
+        st.markdown(f"**Script run:** {run_summary['seconds']:.3f}s (data version {catalog.version})")
+        df_spans = pd.DataFrame(run_summary['spans'], columns=['name', 'depth', 'offset', 'seconds'])
+        df_spans['name'] = ['  ' * depth + name for depth, name in zip(df_spans['depth'], df_spans['name'])]
+        st.dataframe(df_spans[['name', 'seconds']].round(4), use_container_width=True)
+        if run_summary['counters']:
+            st.table(pd.Series(run_summary['counters'], name='count'))
+        # memory of the frames this session uses, the frames are shared between the sessions by the catalog
+        df_memory = es.get_memory_usage({
+            'match week stats': df_match_week_18_19,
+            'pressure map Chelsea': df_pressure_18_19_cfc, 'pressure map Arsenal': df_pressure_18_19_afc,
+            'shot map Chelsea': df_shots_18_19_cfc, 'shot map Arsenal': df_shots_18_19_afc,
+            'match index events': match_index_18_19.df_events, 'match index lineups': match_index_18_19.df_lineups})
+        st.markdown(f"**Session memory:** {df_memory['MB'].sum():.1f} MB "
+                    f"(catalog: {catalog.memory_usage()['MB'].sum():.1f} MB)")
+        st.dataframe(df_memory.round(2), use_container_width=True)
+        run_summary['memory_mb'] = df_memory['MB'].round(3).to_dict()
+        st.download_button('Download diagnostics (JSON)', ins.to_json(run_summary), file_name='diagnostics.json',
+                           mime='application/json')
@@ -0,0 +1,106 @@
+''' Benchmarks the ingestion, aggregation and rendering on synthetic StatsBomb events at several scales. The
+    ingestion through data_preparation.load_data covers the migration of a team events csv and the reads of the
+    parquet store, fetching from StatsBomb is not benchmarked as it depends on the network.
+
+    Run from the src folder, e.g.: python benchmark.py --scales 1 10 100 --output bench.json '''
+import argparse
+import json
+import os.path
+import tempfile
+import time
+import warnings
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+import data_preparation as dp
+import event_store as es
+import freeze_frames as ff
+import match_cache as mc
+import spatial_bins as sb
+import synthetic_events as se
+import visualizations as vz
+
+
+def timed(results, scale, stage, func, repeat=1):
+    ''' Runs func repeat times and records the best wall time of the stage. Returns the result of the last run. '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    results.append({'scale': scale, 'stage': stage, 'seconds': min(timings)})
+    print(f"{scale:>5}x  {stage:<32} {min(timings):9.3f}s")
+    return result
+
+
+def run_scale(scale, folder, render=True, repeat=1):
+    results = []
+    df_matches, df_events = timed(results, scale, 'generate events', lambda: se.generate_season_events(scale))
+    team_name = 'Chelsea FCW'
+    print(f"{scale:>5}x  {len(df_events):,} events, {len(df_matches):,} matches")
+
+    # ingestion: csv baseline against the parquet store
+    csv_file = os.path.join(folder, f'events_{scale}.csv')
+    parquet_file = os.path.join(folder, f'events_{scale}.parquet')
+    timed(results, scale, 'write csv', lambda: df_events.to_csv(csv_file, index=False))
+    timed(results, scale, 'read csv', lambda: pd.read_csv(csv_file, low_memory=False), repeat)
+    timed(results, scale, 'write parquet', lambda: es.write_events(df_events, parquet_file))
+    timed(results, scale, 'read parquet', lambda: es.read_events(parquet_file), repeat)
+    timed(results, scale, 'read parquet (x, y, type, team)',
+          lambda: es.read_events(parquet_file, columns=['x', 'y', 'type_name', 'team_name']), repeat)
+
+    # ingestion of the team events through load_data: the csv of a previous run is migrated once, later runs
+    # read the parquet file
+    team_file = os.path.join(folder, f'events_{scale}_team.parquet')
+    df_events.to_csv(os.path.splitext(team_file)[0] + '.csv', index=False)
+    timed(results, scale, 'load_data (migrate csv)', lambda: dp.load_data(team_file, 37, 4, team_name))
+    timed(results, scale, 'load_data (parquet)', lambda: dp.load_data(team_file, 37, 4, team_name), repeat)
+
+    # aggregation
+    df_calendar = timed(results, scale, 'match calendar', lambda: mc.get_match_calendar(df_matches), repeat)
+    timed(results, scale, 'match week stats (all teams)', lambda: dp.get_match_week_stats(df_events, df_calendar),
+          repeat)
+    timed(results, scale, 'match week stats (one team)',
+          lambda: dp.get_match_week_stats(df_events, df_calendar, team_names=[team_name]), repeat)
+    pressure = df_events[df_events['type_name'] == 'Pressure']
+    timed(results, scale, 'pressure bins (all teams)',
+          lambda: sb.bin_events(pressure, sb.positional_grid('full'), normalize=True), repeat)
+    df_freeze = se.generate_freeze_frames(df_events)
+    df_shot_features = timed(results, scale, 'shot features', lambda: ff.get_shot_features(df_events, df_freeze),
+                             repeat)
+
+    # rendering of a single team season
+    if render:
+        df_team = df_events[df_events['match_id'].isin(df_matches['match_id'][
+            (df_matches['home_team_name'] == team_name) | (df_matches['away_team_name'] == team_name)])]
+        timed(results, scale, 'render pressure map',
+              lambda: plt.close(vz.create_pressure_maps(df_team, team_name)), repeat)
+        timed(results, scale, 'render shot map', lambda: plt.close(vz.create_shot_map(df_team, team_name)), repeat)
+        timed(results, scale, 'render shot context map',
+              lambda: plt.close(vz.create_shot_context_map(df_shot_features, team_name)), repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='scales relative to one team season')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per stage, the best run is reported')
+    parser.add_argument('--no-render', action='store_true', help='skip the figure rendering')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for scale in args.scales:
+            results.extend(run_scale(scale, folder, render=not args.no_render, repeat=args.repeat))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+''' Builds the materialized match week and player statistics of every season of a competition in the match cache,
+    without touching the network. The match files are aggregated one chunk at a time, so the memory stays the same
+    however many seasons and teams are in the cache.
+
+    Run from the src folder, e.g.: python build_stats.py --competition 37 --chunk-rows 50000 '''
+import argparse
+import time
+import data_preparation as dp
+import match_cache as mc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--competition', type=int, default=37)
+    parser.add_argument('--season', type=int, nargs='*', help='season ids, all cached seasons if omitted')
+    parser.add_argument('--folder', default='./data/matches')
+    parser.add_argument('--chunk-rows', type=int, default=100_000, help='maximum number of events per chunk')
+    args = parser.parse_args()
+
+    manifest = mc.read_manifest(args.folder)
+    seasons = sorted({entry['season_id'] for entry in manifest.values() if entry['competition_id'] == args.competition})
+    for season_id in (args.season or seasons):
+        start = time.perf_counter()
+        rows = dp.materialize_cached_season(args.competition, season_id, args.folder, args.chunk_rows)
+        print(f"Season {season_id}: aggregated {rows} events in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,27 @@
+import copy
+import hashlib
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import os.path
 import os
-from collections import defaultdict
+import re
+import threading
+from collections import namedtuple
 import streamlit as st
 from mplsoccer import Sbopen
+import event_dataset as ed
+import event_store as es
+import instrumentation as ins
+import event_fetcher as ef
+import freeze_frames as ff
+import match_cache as mc
+import match_index as mi
+import match_simulation as ms
+import possession_chains as pc
+import rolling_form as rf
+import spatial_bins as sb
+import visualizations as vz
 
 
 def get_team_matches(parser, competition_id, season_id, team_name):
@@ -13,10 +31,11 @@ def get_team_matches(parser, competition_id, season_id, team_name):
     return df_team
 
 
-def get_events_data(parser, match_files):
-    # Get the events data based on the match ids
-    df_match_files = pd.concat([parser.event(file)[0] for file in match_files])
-    return df_match_files
+def get_events_data(parser, match_files, folder='./data/matches', columns=None):
+    # Get the events data based on the match ids, each match is fetched concurrently and stored in the folder
+    files = ef.fetch_events(parser, match_files, folder)
+    df_match_files = pd.concat([es.read_events(file, columns=columns) for file in files])
+    return es.apply_schema(df_match_files)
 
 
 def add_match_date(df_events, df_season):
@@ -31,121 +50,868 @@ def add_match_date(df_events, df_season):
 
 folder_name = "data"
 
-# Create the folder "data" if not exists
-if not os.path.exists(folder_name):
-    os.makedirs(folder_name)
-else:
-    print(f"Folder '{folder_name}' already exists.")
+# Team events files of previous runs, other teams are stored as events_<competition>_<season>_<team>.parquet
+team_files_dct = {
+    (37, 4, 'Chelsea FCW'): './data/events_18_19_cfc.parquet',
+    (37, 4, 'Arsenal WFC'): './data/events_18_19_afc.parquet',
+}
+
+
+def get_team_file(competition_id, season_id, team_name):
+    team_file = team_files_dct.get((competition_id, season_id, team_name))
+    if team_file is None:
+        team_slug = team_name.lower().replace(' ', '_')
+        team_file = f'./{folder_name}/events_{competition_id}_{season_id}_{team_slug}.parquet'
+    return team_file
+
+
+def get_version_file(file, version):
+    ''' Returns the path of a derived file (team events, materialized tables) of the data version, e.g.
+        ./data/match_week_stats.<version>.parquet. Each version writes files of its own, so a refresh never
+        rewrites the files a catalog of the previous version still reads. '''
+    if version is None:
+        return file
+    root, ext = os.path.splitext(file)
+    return f'{root}.{version}{ext}'
+
+
+def remove_version_files(versions, folder=folder_name):
+    ''' Removes the derived files of all data versions but the given ones. '''
+    for entry in os.scandir(folder):
+        parts = entry.name.split('.')
+        if entry.is_file() and len(parts) == 3 and parts[2] == 'parquet' and \
+                re.fullmatch(r'[0-9a-f]{12}|empty', parts[1]) and parts[1] not in versions:
+            os.remove(entry.path)
+
+
+def update_team_events(parser, file, df_team, fetched_match_ids, folder='./data/matches', source_file=None):
+    ''' Adds the events of the new or re-fetched matches of the team to the team events file.
+        The events of all other matches are kept as they are. They are read from source_file if given, e.g. the
+        file of the previous data version, and the file is then written as a new file. '''
+    source_file = file if source_file is None else source_file
+    if os.path.isfile(source_file):
+        df_events = es.read_events(source_file)
+        df_events = df_events[~df_events['match_id'].isin(fetched_match_ids)]
+        known_match_ids = set(df_events['match_id'].unique())
+    else:
+        df_events = None
+        known_match_ids = set()
+
+    new_match_ids = [match_id for match_id in df_team['match_id'] if match_id not in known_match_ids]
+    if len(new_match_ids) > 0:
+        print(f"Adding {len(new_match_ids)} matches to {file}")
+        df_new = add_match_date(get_events_data(parser, new_match_ids, folder), df_team)
+        df_events = df_new if df_events is None else pd.concat([df_events, df_new], ignore_index=True)
+    elif source_file == file or df_events is None:
+        return
+    es.write_events(df_events, file)
+
+
+def update_data(file, competition_id, season_id, team_name, refresh=False):
+    ''' Makes sure the events file of the team exists. The events are fetched from StatsBomb if the file does not
+        exist yet or refresh is set. '''
+    csv_file = os.path.splitext(file)[0] + '.csv'
+    if not os.path.isfile(file) and os.path.isfile(csv_file):
+        # migrate the events csv of a previous run to the parquet store
+        es.migrate_csv(csv_file, file)
+    if refresh or not os.path.isfile(file):
+        print(f"Updating {file} with the data from Statsbomb")
+        # Create the folder "data" if not exists
+        os.makedirs(folder_name, exist_ok=True)
+        parser = Sbopen()
+        # only the matches that are not in the match cache yet (or were updated) are fetched
+        df_season, fetched_match_ids = mc.refresh_matches(parser, competition_id=competition_id,
+                                                          season_id=season_id)
+        ed.sync()
+        df_team = df_season[(df_season['home_team_name'] == team_name) | (df_season['away_team_name'] == team_name)]
+        update_team_events(parser, file, df_team, fetched_match_ids)
 
-# Instantiate a parser object
-parser = Sbopen()
 
-cfc_files_lst = ['./data/events_18_19_cfc.csv']
-afc_files_lst = ['./data/events_18_19_afc.csv']
-season_id_lst = [4]
+def load_data(file, competition_id, season_id, team_name, refresh=False):
+    ''' Returns all events of the team. '''
+    update_data(file, competition_id, season_id, team_name, refresh=refresh)
+    return es.read_events(file)
 
 
-@st.cache_data
-def load_data(file, season_id, team_name, df_name_prefix, df_events_prefix, extension=".csv"):
-    if not os.path.isfile(file):
-        print(f"{file} does not exist in directory.. start loading the data from Statsbomb")
-        parser = Sbopen()
-        folder, file_name = os.path.split(file)
-        file_name_without_extension, _ = os.path.splitext(file_name)
-        result = file_name_without_extension.split("_")[-3:]
-        season_team = "_".join(result)
-        df = get_team_matches(parser, competition_id=37, season_id=season_id, team_name=team_name)
-        df_name = df_events_prefix + season_team
-        df_events = get_events_data(parser, match_files=df['match_id'].to_list())
-        df_events = add_match_date(df_events, df)
-        csv_name = df_name[len(df_events_prefix):]
-        df_events.to_csv("./data/events_" + csv_name + extension, index=False)
-        df_name = df_name_prefix + file.split('/')[-1].split('.')[0]
-        globals()[df_name] = df_events
+####################################################################################
+# CREATE DATAFRAME WITH DATA GROUPED BY MATCH WEEK
+####################################################################################
+
+
+# Each statistic is declared as (name, filter, column, reduction, side):
+#   filter    - callable returning a boolean mask over the events
+#   column    - the column that is reduced (None counts the matching events)
+#   reduction - 'count', 'sum' or 'mean'
+#   side      - 'for' uses the team's own events, 'against' the events of the opponent
+MatchWeekStat = namedtuple('MatchWeekStat', ['name', 'filter', 'column', 'reduction', 'side'])
+
+
+def is_event(variable):
+    ''' Returns a filter that matches events with the given outcome_name or type_name. '''
+    return lambda df: (df['outcome_name'] == variable) | (df['type_name'] == variable)
+
+
+def is_type(event_type):
+    ''' Returns a filter that matches events with the given type_name. '''
+    return lambda df: df['type_name'] == event_type
+
+
+MATCH_WEEK_STATS = [
+    MatchWeekStat('GoalsScored', is_event('Goal'), None, 'count', 'for'),
+    MatchWeekStat('GoalsConceded', is_event('Goal'), None, 'count', 'against'),
+    MatchWeekStat('Shots', is_event('Shot'), None, 'count', 'for'),
+    MatchWeekStat('ShotOffT', is_event('Off T'), None, 'count', 'for'),
+    MatchWeekStat('ShotsBlocked', is_event('Blocked'), None, 'count', 'for'),
+    MatchWeekStat('ShotsSaved', is_event('Saved'), None, 'count', 'for'),
+    MatchWeekStat('ShotXG', is_type('Shot'), 'shot_statsbomb_xg', 'sum', 'for'),
+    MatchWeekStat('Substitutions', is_event('Substitution'), None, 'count', 'for'),
+    MatchWeekStat('Offsides', is_event('Offside'), None, 'count', 'for'),
+    MatchWeekStat('Clearances', is_event('Clearance'), None, 'count', 'for'),
+    MatchWeekStat('PassLengthSum', is_type('Pass'), 'pass_length', 'sum', 'for'),
+    MatchWeekStat('PassLengthAvg', is_type('Pass'), 'pass_length', 'mean', 'for'),
+    MatchWeekStat('PassCnt', is_type('Pass'), 'pass_length', 'count', 'for'),
+]
+
+# The statistics of each match the rolling form metrics are updated with, see rolling_form
+FORM_STATS = [
+    MatchWeekStat('GoalsScored', is_event('Goal'), None, 'count', 'for'),
+    MatchWeekStat('GoalsConceded', is_event('Goal'), None, 'count', 'against'),
+    MatchWeekStat('Shots', is_event('Shot'), None, 'count', 'for'),
+    MatchWeekStat('ShotsAgainst', is_event('Shot'), None, 'count', 'against'),
+    MatchWeekStat('ShotXG', is_type('Shot'), 'shot_statsbomb_xg', 'sum', 'for'),
+    MatchWeekStat('ShotXGAgainst', is_type('Shot'), 'shot_statsbomb_xg', 'sum', 'against'),
+]
+
+# The columns the match week statistics are computed from, match_date is added from the match list
+MATCH_WEEK_PROJECTION = es.Projection('match_week_stats', ['match_id', 'team_name', 'type_name', 'outcome_name',
+                                                           'shot_statsbomb_xg', 'pass_length'], None)
+
+
+def get_stat_values(df, stats=None):
+    ''' Returns the sum and count of every statistic per (team_name, match_id). The values of several parts of the
+        events can simply be added up, see StreamingAggregates. '''
+    stats = MATCH_WEEK_STATS if stats is None else stats
+
+    # one value column and one count column per statistic, nan/0 where the filter does not match
+    values = {}
+    for stat in stats:
+        mask = stat.filter(df).fillna(False).to_numpy(dtype=bool)
+        if stat.column is None:
+            values[stat.name + '_sum'] = mask.astype(np.int64)
+            values[stat.name + '_cnt'] = mask.astype(np.int64)
+        else:
+            column = pd.to_numeric(df[stat.column]).to_numpy(dtype=np.float64)
+            selected = mask & ~np.isnan(column)
+            values[stat.name + '_sum'] = np.where(selected, column, 0.0)
+            values[stat.name + '_cnt'] = selected.astype(np.int64)
+    df_values = pd.DataFrame(values, index=df.index)
+    df_values['match_id'] = df['match_id'].to_numpy()
+    df_values['team_name'] = df['team_name'].to_numpy()
+    return df_values.groupby(['team_name', 'match_id'], sort=False).sum()
+
+
+def reduce_stats(own, stats=None):
+    ''' Returns the statistics of the sums and counts of get_stat_values; the values against a team are the match
+        totals minus the team's own values. '''
+    stats = MATCH_WEEK_STATS if stats is None else stats
+    match_totals = own.groupby(level='match_id').transform('sum')
+    against = match_totals - own
+
+    columns = {}
+    for stat in stats:
+        side = own if stat.side == 'for' else against
+        total, cnt = side[stat.name + '_sum'], side[stat.name + '_cnt']
+        if stat.reduction == 'count':
+            columns[stat.name] = cnt
+        elif stat.reduction == 'sum':
+            columns[stat.name] = total
+        elif stat.reduction == 'mean':
+            columns[stat.name] = total / cnt.where(cnt > 0)
+        else:
+            raise ValueError(f"Unknown reduction '{stat.reduction}' for statistic '{stat.name}'")
+    return pd.DataFrame(columns)
+
+
+def get_match_stats(df, stats=None):
+    ''' Returns a DataFrame indexed by (team_name, match_id) with one column per statistic.
+        All statistics are reduced in a single groupby over (team_name, match_id). '''
+    return reduce_stats(get_stat_values(df, stats), stats)
+
+
+def to_match_week_stats(df_stats, df_calendar, team_names=None):
+    ''' Replaces the match id of the statistics with the match number of each team from the match calendar, see
+        match_cache.get_match_calendar. Matches that are not in the calendar are left out. '''
+    df_stats = df_stats.join(df_calendar['match_number'].rename('MatchWeek'), how='inner').reset_index()
+    if team_names is not None:
+        df_stats = df_stats[df_stats['team_name'].isin(team_names)]
+    df_stats = df_stats.drop(columns='match_id').set_index(['team_name', 'MatchWeek']).sort_index()
+    return df_stats
+
+
+def get_match_week_stats(df, df_calendar, team_names=None, stats=None):
+    ''' Returns a DataFrame indexed by (team_name, MatchWeek) with one column per statistic, MatchWeek is the
+        match number of the team in the match calendar. '''
+    return to_match_week_stats(get_match_stats(df, stats), df_calendar, team_names)
 
 
-# Load Chelsea FCW events data
-for file, season_id in zip(cfc_files_lst, season_id_lst):
-    load_data(file, season_id, 'Chelsea FCW', "df_", "df_events_")
+@st.cache_data
+def generate_match_week_df(df, df_calendar, team_name):
+    df = get_match_week_stats(df, df_calendar, team_names=[team_name]).loc[team_name]
+    return df
+
 
-# Load Arsenal WFC events data
-for file, season_id in zip(afc_files_lst, season_id_lst):
-    load_data(file, season_id, 'Arsenal WFC', "df_", "df_events_")
+def update_rolling_form(form, df_events, df_calendar):
+    ''' Adds the matches of the events to the rolling form, in the order of the match calendar. Matches that are
+        already part of the form are skipped, so only the events of the new matches need to be passed. MatchWeek is
+        the match number of the team in the calendar like in the match week statistics, so the form joins them
+        even if a match of the team has no events. '''
+    df_match_stats = get_match_stats(df_events, FORM_STATS)
+    df_match_stats = df_match_stats.join(df_calendar['match_number'].rename('MatchWeek'), how='inner')
+    match_ids = set(df_match_stats.index.unique(level='match_id'))
+    match_order = df_calendar.reset_index().sort_values(['match_date', 'match_id'])['match_id'].unique()
+    for match_id in match_order:
+        if match_id in match_ids and match_id not in form.match_ids:
+            form.update(df_match_stats.xs(match_id, level='match_id', drop_level=False))
+    return form
+
+
+def can_update_rolling_form(form, df_calendar, match_ids):
+    ''' Returns whether the matches can be added to the rolling form incrementally: none of them is part of the
+        form yet and all of them were played after the matches of the form. Otherwise the season is recomputed. '''
+    match_ids = set(match_ids)
+    order = df_calendar.reset_index().sort_values(['match_date', 'match_id'])['match_id'].unique()
+    position = {match_id: i for i, match_id in enumerate(order)}
+    if match_ids & form.match_ids or any(match_id not in position for match_id in match_ids | form.match_ids):
+        return False
+    if len(match_ids) == 0 or len(form.match_ids) == 0:
+        return True
+    return min(position[match_id] for match_id in match_ids) > max(position[match_id] for match_id in form.match_ids)
 
 
 ####################################################################################
-# CREATE DATAFRAME WITH DATA GROUPED BY MATCH WEEK
+# STREAMING AGGREGATION
 ####################################################################################
 
 
-def get_match_week_stat(df, team_name, variable):
-    ''' Returns a list with the specified outcome count for each match week.
-        If the outcome_name does not occur, the value 0 is added as value to the match_week. '''
-    match_weeks = range(1, df["date_number"].max() + 1)
-    dct = defaultdict(int)
-    for match_week in match_weeks:
-        dct[match_week-1] = df[(df["date_number"] == match_week) &
-                             (df["team_name"] == team_name) &
-                             ((df["outcome_name"] == variable) | (df["type_name"] == variable))].shape[0]
-    df = pd.DataFrame.from_dict(dict(dct), orient='index', columns=[variable])
-    return df[variable].tolist()
-
-
-def get_match_week_stat_op(df, team_name, variable):
-    ''' Returns a list with the specified outcome count for each match week for the opposing team.
-        If the outcome_name does not occur, the value 0 is added as value to the match_week. '''
-    match_weeks = range(df["date_number"].min(), df["date_number"].max() + 1)
-    dct = defaultdict(int)
-    for match_week in match_weeks:
-        dct[match_week-1] = df[(df["date_number"] == match_week) &
-                             (df["team_name"] != team_name) & ((df["outcome_name"] == variable) | (df["type_name"] == variable))].shape[0]
-    df = pd.DataFrame.from_dict(dict(dct), orient='index', columns=[variable])
-    return df[variable].tolist()
-
-
-def get_match_week_stat_nested_calc(df, team_name, event_type, var_type, calc):
-    if calc == 'count':
-        return df[(df['type_name'] == event_type) &
-                  (df['team_name'] == team_name)].groupby('date_number').count()[var_type].tolist()
-    elif calc == 'sum':
-        return df[(df['type_name'] == event_type) &
-                  (df['team_name'] == team_name)].groupby('date_number').sum()[var_type].tolist()
-    elif calc == 'mean':
-        return df[(df['type_name'] == event_type) &
-                  (df['team_name'] == team_name)].groupby('date_number').mean()[var_type].tolist()
+class StreamingAggregates:
+    ''' The match week statistics and spatial bins of events that are added chunk by chunk, so only one chunk of
+        events needs to be in memory. The partial state consists of the sums and counts per (team_name, match_id)
+        and the event counts per cell, both of which can be added up, so a match may be split across chunks and
+        the aggregates of several workers can be merged. The matches are numbered from the match calendar when
+        the statistics are reduced. bins are the (type_name, grid) of the spatial bins. '''
+
+    def __init__(self, stats=None, bins=()):
+        self.stats = MATCH_WEEK_STATS if stats is None else stats
+        self.grids = {(type_name, grid.name): grid for type_name, grid in bins}
+        self.own = None
+        self.bin_counts = {}
+        self.rows = 0
+
+    @property
+    def columns(self):
+        ''' The columns the chunks must have. '''
+        columns = MATCH_WEEK_PROJECTION.columns
+        return columns + ['x', 'y'] if self.grids else columns
+
+    def add(self, df):
+        ''' Adds a chunk of events. '''
+        self.rows += len(df)
+        self.merge_state(get_stat_values(df, self.stats), {key: self.count_bins(df, *key) for key in self.grids})
+
+    def count_bins(self, df, type_name, grid_name):
+        binned = sb.bin_events(df[df['type_name'] == type_name], self.grids[(type_name, grid_name)])
+        return pd.DataFrame(binned.statistic, index=binned.keys['team_name'].astype(str))
+
+    def merge(self, other):
+        ''' Adds the state of another StreamingAggregates with the same statistics and bins. '''
+        self.rows += other.rows
+        if other.own is not None:
+            self.merge_state(other.own, other.bin_counts)
+        return self
+
+    def merge_state(self, own, bin_counts):
+        self.own = own if self.own is None else pd.concat([self.own, own]).groupby(level=[0, 1], sort=False).sum()
+        for key, counts in bin_counts.items():
+            self.bin_counts[key] = counts if key not in self.bin_counts else \
+                self.bin_counts[key].add(counts, fill_value=0)
+
+    def match_week_stats(self, df_calendar, team_names=None):
+        ''' Returns the same statistics as get_match_week_stats over all events added so far. '''
+        own = self.own.sort_index(level='match_id', kind='stable')
+        return to_match_week_stats(reduce_stats(own, self.stats), df_calendar, team_names)
+
+    def spatial_bins(self, type_name, grid, normalize=True):
+        ''' Returns the same BinnedEvents as spatial_bins.bin_events grouped by team_name. '''
+        counts = self.bin_counts.get((type_name, grid.name), pd.DataFrame(np.zeros((0, sb.get_cell_count(grid)))))
+        counts = counts.groupby(level=0, sort=False).sum()
+        statistic = counts.to_numpy(dtype=np.float64)
+        if normalize:
+            totals = statistic.sum(axis=1, keepdims=True)
+            statistic = np.divide(statistic, totals, out=np.zeros(statistic.shape), where=totals > 0)
+        return sb.BinnedEvents(grid, pd.DataFrame({'team_name': counts.index}), statistic)
+
+
+def iter_match_chunks(files, columns=None, chunk_rows=100_000):
+    ''' Yields the events of the match files one chunk at a time, a chunk never spans two matches. '''
+    for file in files:
+        yield from es.iter_events(file, columns=columns, chunk_rows=chunk_rows)
+
+
+def aggregate_match_files(files, aggregates=None, chunk_rows=100_000):
+    ''' Adds the events of the match files to the aggregates chunk by chunk and returns the aggregates. '''
+    aggregates = StreamingAggregates() if aggregates is None else aggregates
+    for df_chunk in iter_match_chunks(files, aggregates.columns, chunk_rows):
+        aggregates.add(df_chunk)
+    return aggregates
 
 
-@st.cache_data
-def generate_match_week_df(df, team_name):
-    goals_lst = get_match_week_stat(df, team_name, 'Goal')
-    goals_conceded_lst = get_match_week_stat_op(df, team_name, 'Goal')
-    shots_lst = get_match_week_stat(df, team_name, 'Shot')
-    off_target_lst = get_match_week_stat(df, team_name, 'Off T')
-    shot_blocked_lst = get_match_week_stat(df, team_name, 'Blocked')
-    shots_saved_lst = get_match_week_stat(df, team_name, 'Saved')
-    xg_lst = df.groupby('date_number').sum()['shot_statsbomb_xg'].to_list()
-    subs_lst = get_match_week_stat(df, team_name, 'Substitution')
-    offs_lst = get_match_week_stat(df, team_name, 'Offside')
-    clear_lst = get_match_week_stat(df, team_name, 'Clearance')
-    pass_length_lst = get_match_week_stat_nested_calc(df, team_name, 'Pass', 'pass_length', 'sum')
-    pass_length_avg_lst = get_match_week_stat_nested_calc(df, team_name, 'Pass', 'pass_length', 'mean')
-    pass_cnt_lst = get_match_week_stat_nested_calc(df, team_name, 'Pass', 'pass_length', 'count')
-    matches_numbered = df['date_number'].to_list()
-
-    df = pd.DataFrame(list(zip(goals_lst, goals_conceded_lst, shots_lst, off_target_lst, shot_blocked_lst,
-                               shots_saved_lst, xg_lst, subs_lst, offs_lst, clear_lst, pass_length_lst,
-                               pass_length_avg_lst, pass_cnt_lst)),
-                      columns=['GoalsScored', 'GoalsConceded', 'Shots', 'ShotOffT', 'ShotsBlocked', 'ShotsSaved',
-                               'ShotXG', 'Substitutions', 'Offsides', 'Clearances', 'PassLengthSum', 'PassLengthAvg',
-                               'PassCnt'])
-
-    df = df.reset_index()
-    df.rename(columns={'index': 'MatchWeek'}, inplace=True)
-    df = df.set_index('MatchWeek')
-    df.index = df.index + 1
+####################################################################################
+# LEAGUE-WIDE MATCH WEEK STATISTICS
+####################################################################################
+
+match_week_stats_file = './data/match_week_stats.parquet'
+
+
+# The columns of the events of the MatchIndex: the columns of the lineups and of every dataset and figure that is
+# computed from the season's events (rolling form, pass maps, pass networks, xG chains, shot features, season
+# simulation and the pitch maps of the export)
+MATCH_INDEX_COLUMNS = list(dict.fromkeys(
+    mi.LINEUP_COLUMNS + MATCH_WEEK_PROJECTION.columns + vz.PASS_MAP_COLUMNS + pc.PASS_NETWORK_COLUMNS +
+    pc.XG_CHAIN_COLUMNS + ff.SHOT_COLUMNS + ms.SHOT_COLUMNS + vz.PRESSURE_MAP_PROJECTION.columns +
+    vz.SHOT_MAP_PROJECTION.columns))
+
+
+def fetch_uncached_season(competition_id, season_id, folder='./data/matches'):
+    ''' Fetches the season if it is not in the match cache yet and returns its cached matches. '''
+    df_matches = mc.get_season_matches(competition_id, season_id, folder)
+    if len(df_matches) == 0:
+        os.makedirs(folder_name, exist_ok=True)
+        mc.refresh_matches(Sbopen(), competition_id=competition_id, season_id=season_id, folder=folder)
+        ed.sync(folder)
+        df_matches = mc.get_season_matches(competition_id, season_id, folder)
+    return df_matches
+
+
+def read_season_events(competition_id, season_id, folder='./data/matches', types=None, columns=None):
+    ''' Returns the events of all cached matches of the season, read from disk only. Only the partitions of the
+        season are read from the events dataset, optionally only the given event types and columns. '''
+    df_matches = mc.get_season_matches(competition_id, season_id, folder)
+    partitioned = set(ed.list_partitions(competition_id, season_id)['match_id'])
+    if not set(df_matches['match_id']) <= partitioned:
+        # matches that were cached before the dataset existed
+        ed.sync(folder)
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + ['match_id']))
+    df_events = ed.events(competition=competition_id, season=season_id, match=df_matches['match_id'].to_list(),
+                          types=types, columns=columns)
+    return add_match_date(df_events, df_matches), df_matches
+
+
+# The key columns of the rows of a season in the materialized tables
+SEASON_KEYS = ['competition_id', 'season_id']
+
+
+def is_keyed_by_competition(file):
+    ''' Returns whether the materialized table exists and has the competition_id key, tables written before the
+        key was added hold seasons of unknown competitions. '''
+    return os.path.isfile(file) and 'competition_id' in pq.read_schema(file).names
+
+
+def write_season_table(df_stats, competition_id, season_id, file):
+    ''' Replaces the rows of the season of the competition in the materialized table, rows of other seasons and
+        competitions are kept. '''
+    df_stats = df_stats.copy()
+    df_stats.insert(0, 'competition_id', competition_id)
+    df_stats.insert(1, 'season_id', season_id)
+    if is_keyed_by_competition(file):
+        df_existing = pd.read_parquet(file)
+        df_existing = df_existing[(df_existing['competition_id'] != competition_id) |
+                                  (df_existing['season_id'] != season_id)]
+        df_stats = pd.concat([df_existing, df_stats], ignore_index=True)
+    df_stats['team_name'] = df_stats['team_name'].astype(str)
+    es.replace_file(file, lambda tmp_file: df_stats.to_parquet(tmp_file, engine='pyarrow', index=False))
+
+
+def is_season_materialized(competition_id, season_id, file):
+    if not is_keyed_by_competition(file):
+        return False
+    df_keys = pd.read_parquet(file, columns=SEASON_KEYS)
+    return bool(((df_keys['competition_id'] == competition_id) & (df_keys['season_id'] == season_id)).any())
+
+
+def read_season_table(competition_id, season_id, file):
+    ''' Returns the rows of the season of the competition in the materialized table, without the key columns. '''
+    df = pd.read_parquet(file, filters=[('competition_id', '==', competition_id), ('season_id', '==', season_id)])
+    return df.drop(columns=SEASON_KEYS)
+
+
+def fetch_season_files(parser, competition_id, season_id, folder='./data/matches'):
+    ''' Fetches the missing or updated matches of the season and returns the match list and the match files. '''
+    df_season, _ = mc.refresh_matches(parser, competition_id=competition_id, season_id=season_id, folder=folder)
+    ed.sync(folder)
+    return df_season, ef.fetch_events(parser, df_season['match_id'].to_list(), folder)
+
+
+def build_match_week_stats(parser, competition_id, season_id, file=match_week_stats_file):
+    ''' Computes the match week statistics of every team of the season and stores them in the materialized table
+        keyed by (competition_id, season_id, team_name, MatchWeek). The match files are aggregated one chunk at a
+        time, so the memory does not grow with the number of matches. Rows of other seasons are kept. '''
+    print(f"Building the match week statistics of season {season_id} of competition {competition_id}")
+    df_season, files = fetch_season_files(parser, competition_id, season_id)
+    df_stats = aggregate_match_files(files).match_week_stats(mc.get_match_calendar(df_season))
+    write_season_table(df_stats.reset_index(), competition_id, season_id, file)
+
+
+def load_match_week_stats(season_id, competition_id=37, file=match_week_stats_file):
+    ''' Returns the precomputed match week statistics of all teams of the season, indexed by
+        (team_name, MatchWeek). The table is built first if the season is not materialized yet, from the match
+        cache if the season is cached, so e.g. the query service never fetches on a request. '''
+    if not is_season_materialized(competition_id, season_id, file):
+        if len(mc.get_season_matches(competition_id, season_id)) > 0:
+            materialize_cached_season(competition_id, season_id, match_week_file=file, player_file=None)
+        else:
+            os.makedirs(folder_name, exist_ok=True)
+            build_match_week_stats(Sbopen(), competition_id, season_id, file)
+    df = read_season_table(competition_id, season_id, file)
+    df = df.set_index(['team_name', 'MatchWeek']).sort_index()
     return df
 
 
+####################################################################################
+# PLAYER MATCH STATISTICS
+####################################################################################
+
+player_match_stats_file = './data/player_match_stats.parquet'
+
+# The columns the player statistics are computed from, match_date is added from the match list
+PLAYER_MATCH_PROJECTION = es.Projection('player_match_stats', ['match_id', 'index', 'team_name', 'player_id',
+                                                               'player_name', 'position_id', 'type_name',
+                                                               'outcome_name', 'minute', 'shot_statsbomb_xg',
+                                                               'substitution_replacement_id'], None)
+
+PLAYER_STATS = ['Minutes', 'Passes', 'PassesCompleted', 'PassCompletion', 'Pressures', 'Shots', 'Goals', 'ShotXG']
+
+
+def get_player_match_stats(df):
+    ''' Returns the statistics of every player in every match of the events, one row per (match_id, player_id).
+        The minutes are taken from the substitutions and the last minute of the match, all event counts are
+        reduced in a single groupby over (match_id, player_id). '''
+    df_players = mi.get_lineups(df)
+    match_end = df.groupby('match_id', observed=True)['minute'].max()
+    end = match_end.reindex(df_players['match_id']).to_numpy(dtype=np.float64)
+    df_players['Minutes'] = np.minimum(df_players['off'].fillna(np.inf).to_numpy(dtype=np.float64), end) - \
+        df_players['on'].fillna(0).to_numpy(dtype=np.float64)
+
+    type_name = df['type_name'].to_numpy(dtype=object)
+    is_pass = type_name == 'Pass'
+    is_shot = type_name == 'Shot'
+    df_values = pd.DataFrame({
+        'match_id': df['match_id'].to_numpy(),
+        'player_id': df['player_id'].to_numpy(),
+        'Passes': is_pass,
+        'PassesCompleted': is_pass & df['outcome_name'].isnull().to_numpy(),
+        'Pressures': type_name == 'Pressure',
+        'Shots': is_shot,
+        'Goals': is_shot & (df['outcome_name'] == 'Goal').to_numpy(),
+        'ShotXG': np.where(is_shot, df['shot_statsbomb_xg'].to_numpy(dtype=np.float64, na_value=0.0), 0.0),
+    }).dropna(subset=['player_id'])
+    df_counts = df_values.groupby(['match_id', 'player_id'], sort=False).sum()
+
+    df_stats = df_players.join(df_counts, on=['match_id', 'player_id'])
+    counts = ['Passes', 'PassesCompleted', 'Pressures', 'Shots', 'Goals']
+    df_stats[counts] = df_stats[counts].fillna(0).astype(np.int64)
+    df_stats['ShotXG'] = df_stats['ShotXG'].fillna(0.0)
+    df_stats['PassCompletion'] = df_stats['PassesCompleted'] / df_stats['Passes'].where(df_stats['Passes'] > 0)
+    df_stats = df_stats.merge(df.drop_duplicates('match_id')[['match_id', 'match_date']], on='match_id')
+    return df_stats[['match_id', 'match_date', 'team_name', 'player_id', 'player_name', 'position_id', 'start'] +
+                    PLAYER_STATS]
+
+
+def get_player_season_stats(df_player_match_stats, min_minutes=0):
+    ''' Returns the season totals of every player with the counts per 90 minutes, indexed by player_id. '''
+    df = df_player_match_stats.groupby('player_id').agg(
+        player_name=('player_name', 'last'), team_name=('team_name', 'last'), Matches=('match_id', 'nunique'),
+        Starts=('start', 'sum'), Minutes=('Minutes', 'sum'), Passes=('Passes', 'sum'),
+        PassesCompleted=('PassesCompleted', 'sum'), Pressures=('Pressures', 'sum'), Shots=('Shots', 'sum'),
+        Goals=('Goals', 'sum'), ShotXG=('ShotXG', 'sum'))
+    df = df[df['Minutes'] >= min_minutes]
+    df['PassCompletion'] = df['PassesCompleted'] / df['Passes'].where(df['Passes'] > 0)
+    per_90 = 90 / df['Minutes'].where(df['Minutes'] > 0)
+    for stat in ['Passes', 'Pressures', 'Shots', 'Goals', 'ShotXG']:
+        df[stat + 'Per90'] = df[stat] * per_90
+    return df.sort_values('Minutes', ascending=False)
+
+
+def read_player_match_stats(files, df_matches):
+    ''' Returns the player statistics of the match files, the files are read one match at a time. '''
+    return pd.concat([get_player_match_stats(add_match_date(es.read_events(file, PLAYER_MATCH_PROJECTION.columns),
+                                                            df_matches)) for file in files], ignore_index=True)
+
+
+def build_player_match_stats(parser, competition_id, season_id, file=player_match_stats_file):
+    ''' Computes the statistics of every player in every match of the season and stores them in the
+        materialized table keyed by (competition_id, season_id, match_id, player_id). The matches are read one at
+        a time. Rows of other seasons are kept. '''
+    print(f"Building the player match statistics of season {season_id} of competition {competition_id}")
+    df_season, files = fetch_season_files(parser, competition_id, season_id)
+    write_season_table(read_player_match_stats(files, df_season), competition_id, season_id, file)
+
+
+def load_player_match_stats(season_id, competition_id=37, file=player_match_stats_file):
+    ''' Returns the precomputed statistics of every player in every match of the season. The table is built
+        first if the season is not materialized yet, from the match cache if the season is cached. '''
+    if not is_season_materialized(competition_id, season_id, file):
+        if len(mc.get_season_matches(competition_id, season_id)) > 0:
+            materialize_cached_season(competition_id, season_id, match_week_file=None, player_file=file)
+        else:
+            os.makedirs(folder_name, exist_ok=True)
+            build_player_match_stats(Sbopen(), competition_id, season_id, file)
+    return read_season_table(competition_id, season_id, file).reset_index(drop=True)
+
+
+def get_cached_match_files(df_matches, folder='./data/matches'):
+    ''' Returns the files of the matches that are in the match cache. '''
+    return [file for file in (ef.get_match_file(folder, match_id) for match_id in df_matches['match_id'])
+            if os.path.isfile(file)]
+
+
+def materialize_cached_season(competition_id, season_id, folder='./data/matches', chunk_rows=100_000,
+                              match_week_file=match_week_stats_file, player_file=player_match_stats_file):
+    ''' Builds both materialized tables of the season from the match cache only, one chunk of events at a time.
+        A table whose file is None is not built. '''
+    df_matches = mc.get_season_matches(competition_id, season_id, folder)
+    files = get_cached_match_files(df_matches, folder)
+    rows = 0
+    if match_week_file is not None:
+        aggregates = aggregate_match_files(files, chunk_rows=chunk_rows)
+        df_stats = aggregates.match_week_stats(mc.get_match_calendar(df_matches))
+        write_season_table(df_stats.reset_index(), competition_id, season_id, match_week_file)
+        rows = aggregates.rows
+    if player_file is not None:
+        write_season_table(read_player_match_stats(files, df_matches), competition_id, season_id, player_file)
+    return rows
+
+
+####################################################################################
+# DATA CATALOG
+####################################################################################
+
+
+class DataCatalog:
+    ''' Resolves the datasets by (competition_id, season_id, team_name) on first access and keeps them in memory.
+        Creating the catalog does not touch the disk or the network. A catalog holds one version of the data, the
+        returned DataFrames are shared, so callers must not modify them in place. '''
+
+    def __init__(self, version=None):
+        self.version = version
+        self._datasets = {}
+        self._loaders = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _get(self, key, load):
+        ''' Returns the dataset of the key, which is loaded with load(catalog) on first access. '''
+        # one lock per dataset, so a dataset is loaded once while datasets can depend on each other
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._datasets:
+                ins.count('catalog.miss')
+                with ins.span(f'catalog.load {key[0]}', key=str(key[1:])):
+                    self._datasets[key] = load(self)
+                # only loaders that succeeded are replayed by rebuild
+                with self._lock:
+                    self._loaders.setdefault(key, load)
+            else:
+                ins.count('catalog.hit')
+            return self._datasets[key]
+
+    def rebuild(self, version, fetched_match_ids=()):
+        ''' Returns a new catalog of the given version with all datasets of this catalog loaded again. The rolling
+            forms are carried over and only updated with the fetched matches. A dataset that fails to load is left
+            out of the new catalog, it is loaded again on its next access. '''
+        with self._lock:
+            loaders = dict(self._loaders)
+            datasets = dict(self._datasets)
+        catalog = DataCatalog(version)
+        for key, load in loaders.items():
+            try:
+                if key[0] == 'rolling_form' and key in datasets:
+                    catalog._get(key, lambda new_catalog, key=key, load=load: new_catalog._update_rolling_form(
+                        datasets[key], key[1], key[2], fetched_match_ids, load))
+                    # the new catalog keeps the loader of the whole season for the next rebuild
+                    with catalog._lock:
+                        catalog._loaders[key] = load
+                else:
+                    catalog._get(key, load)
+            except Exception as e:
+                print(f"Dropping {' '.join(str(part) for part in key)} from data version {version} ({e})")
+        return catalog
+
+    def _update_rolling_form(self, form, competition_id, season_id, match_ids, load):
+        ''' Returns a copy of the rolling form of a previous version with the matches added, the form of the
+            previous version is still in use. The form is loaded with load if it cannot be updated incrementally,
+            e.g. because StatsBomb updated a match that is already part of it. '''
+        df_calendar = self.match_calendar(competition_id, season_id)
+        if not can_update_rolling_form(form, df_calendar, match_ids):
+            return load(self)
+        match_index = self.match_index(competition_id, season_id)
+        frames = [match_index.events(match_id) for match_id in match_ids if match_id in match_index.event_ranges.index]
+        df_events = pd.concat(frames) if frames else match_index.df_events.iloc[:0]
+        return update_rolling_form(copy.deepcopy(form), df_events, df_calendar)
+
+    def events(self, competition_id, season_id, team_name):
+        ''' Returns all events of the team, prefer view for the columns a consumer actually uses. '''
+        return self._get(('events', competition_id, season_id, team_name),
+                         lambda catalog: es.read_events(catalog.team_file(competition_id, season_id, team_name)))
+
+    def team_file(self, competition_id, season_id, team_name):
+        ''' Returns the events file of the team of the data version. The file is written from the match cache if
+            it does not exist yet, the season is fetched first if it is not cached. '''
+        def load(catalog):
+            file = get_version_file(get_team_file(competition_id, season_id, team_name), catalog.version)
+            if not os.path.isfile(file):
+                df_matches = fetch_uncached_season(competition_id, season_id)
+                df_team = df_matches[(df_matches['home_team_name'] == team_name) |
+                                     (df_matches['away_team_name'] == team_name)]
+                update_team_events(Sbopen(), file, df_team, ())
+            return file
+        return self._get(('team_file', competition_id, season_id, team_name), load)
+
+    def view(self, competition_id, season_id, team_name, projection):
+        ''' Returns the compact frame of the team's events with only the columns and rows of the projection. '''
+        return self._get(('view', competition_id, season_id, team_name, projection.name),
+                         lambda catalog: es.read_projection(catalog.team_file(competition_id, season_id, team_name),
+                                                            projection))
+
+    def events_version(self, competition_id, season_id, team_name):
+        ''' Returns the version of the team's events, used as cache key for the rendered figures. '''
+        return es.get_version(self.team_file(competition_id, season_id, team_name))
+
+    def memory_usage(self):
+        ''' Returns the memory usage of all DataFrames held by the catalog. '''
+        with self._lock:
+            datasets = dict(self._datasets)
+        frames = {}
+        for key, dataset in datasets.items():
+            name = ' '.join(str(part) for part in key)
+            if isinstance(dataset, pd.DataFrame):
+                frames[name] = dataset
+            elif isinstance(dataset, mi.MatchIndex):
+                frames[name + ' events'] = dataset.df_events
+                frames[name + ' lineups'] = dataset.df_lineups
+            elif isinstance(dataset, pc.PassNetwork):
+                frames[name + ' nodes'] = dataset.nodes
+                frames[name + ' edges'] = dataset.edges
+            elif isinstance(dataset, ms.SimulationResult):
+                frames[name + ' matches'] = dataset.matches
+                frames[name + ' table'] = dataset.table
+        return es.get_memory_usage(frames)
+
+    def match_index(self, competition_id, season_id):
+        ''' Returns the MatchIndex over all cached matches of the season with the MATCH_INDEX_COLUMNS of the
+            events. The season is fetched first if it is not in the match cache yet. '''
+        def load(catalog):
+            fetch_uncached_season(competition_id, season_id)
+            return mi.MatchIndex(*read_season_events(competition_id, season_id, columns=MATCH_INDEX_COLUMNS))
+        return self._get(('match_index', competition_id, season_id), load)
+
+    def spatial_bins(self, competition_id, season_id, type_name, grid, normalize=True):
+        ''' Returns the binned locations of the events of the given type for every team of the season, e.g. the
+            pressure map of every team in a single computation. The match files are binned one chunk at a time, so
+            the events of the season are never loaded at once. '''
+        def load(catalog):
+            df_matches = fetch_uncached_season(competition_id, season_id)
+            aggregates = aggregate_match_files(get_cached_match_files(df_matches),
+                                               StreamingAggregates(stats=[], bins=[(type_name, grid)]))
+            return aggregates.spatial_bins(type_name, grid, normalize)
+        return self._get(('spatial_bins', competition_id, season_id, type_name, grid.name, normalize), load)
+
+    def match_calendar(self, competition_id, season_id):
+        ''' Returns the match calendar of the cached matches of the season, see match_cache.get_match_calendar. '''
+        return self._get(('match_calendar', competition_id, season_id),
+                         lambda catalog: mc.get_season_calendar(competition_id, season_id))
+
+    def rolling_form(self, competition_id, season_id, window=5):
+        ''' Returns the rolling form of all teams of the season. '''
+        def load(catalog):
+            # the match index fetches the season first if it is not in the match cache yet
+            df_events = catalog.match_index(competition_id, season_id).df_events
+            return update_rolling_form(rf.RollingForm(window), df_events,
+                                       catalog.match_calendar(competition_id, season_id))
+        return self._get(('rolling_form', competition_id, season_id, window), load)
+
+    def related_events(self, competition_id, season_id):
+        ''' Returns the related events (e.g. key pass -> shot) of the matches of the season. '''
+        return self._get(('related_events', competition_id, season_id),
+                         lambda catalog: mc.read_related_events(
+                             catalog.match_index(competition_id, season_id).matches['match_id']))
+
+    def freeze_frames(self, competition_id, season_id):
+        ''' Returns the player locations at every shot of the season. '''
+        return self._get(('freeze_frames', competition_id, season_id),
+                         lambda catalog: mc.read_freeze_frames(
+                             catalog.match_index(competition_id, season_id).matches['match_id']))
+
+    def shot_features(self, competition_id, season_id):
+        ''' Returns every shot of the season with the features of its freeze frame, see freeze_frames. '''
+        return self._get(('shot_features', competition_id, season_id),
+                         lambda catalog: ff.get_shot_features(catalog.match_index(competition_id, season_id).df_events,
+                                                              catalog.freeze_frames(competition_id, season_id)))
+
+    def pass_networks(self, competition_id, season_id):
+        ''' Returns the pass networks of every team in every match of the season. '''
+        return self._get(('pass_networks', competition_id, season_id),
+                         lambda catalog: pc.get_pass_networks(catalog.match_index(competition_id, season_id).df_events))
+
+    def player_xg_chain(self, competition_id, season_id):
+        ''' Returns the xGChain, xGBuildup and assisted xG of every player of the season. '''
+        def load(catalog):
+            return pc.get_player_xg_chain(catalog.match_index(competition_id, season_id).df_events,
+                                          catalog.related_events(competition_id, season_id))
+        return self._get(('player_xg_chain', competition_id, season_id), load)
+
+    def season_simulation(self, competition_id, season_id, iterations=100_000):
+        ''' Returns the Monte Carlo simulation of the season from the xG of the shots, see match_simulation. '''
+        def load(catalog):
+            match_index = catalog.match_index(competition_id, season_id)
+            return ms.simulate_season(match_index.df_events, match_index.matches, iterations=iterations)
+        return self._get(('season_simulation', competition_id, season_id, iterations), load)
+
+    def player_match_stats(self, competition_id, season_id):
+        return self._get(('player_match_stats', competition_id, season_id),
+                         lambda catalog: load_player_match_stats(
+                             season_id, competition_id, get_version_file(player_match_stats_file, catalog.version)))
+
+    def match_week_stats(self, competition_id, season_id):
+        return self._get(('match_week_stats', competition_id, season_id),
+                         lambda catalog: load_match_week_stats(
+                             season_id, competition_id, get_version_file(match_week_stats_file, catalog.version)))
+
+
+####################################################################################
+# SHARED DATA & BACKGROUND REFRESH
+####################################################################################
+
+
+def get_data_version(folder='./data/matches'):
+    ''' Returns the version of the cached data, which changes whenever a match is fetched or updated. '''
+    file = os.path.join(folder, mc.MANIFEST_FILE)
+    if not os.path.isfile(file):
+        return 'empty'
+    with open(file, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def is_season_cached(competition_id, season_id):
+    ''' Returns whether the season is in the match cache, the catalog writes the derived files of the season from
+        the cache without fetching. '''
+    return len(mc.get_season_matches(competition_id, season_id)) > 0
+
+
+def is_data_available(competition_id, season_id, team_names, version):
+    ''' Returns whether everything the dashboard shows for the season is on disk for the data version, so that no
+        request has to fetch from StatsBomb or write the derived files. '''
+    if not is_season_cached(competition_id, season_id):
+        return False
+    if not all(os.path.isfile(get_version_file(get_team_file(competition_id, season_id, team_name), version))
+               for team_name in team_names):
+        return False
+    return all(is_season_materialized(competition_id, season_id, get_version_file(file, version))
+               for file in (match_week_stats_file, player_match_stats_file))
+
+
+class SharedCatalog:
+    ''' Holds the current DataCatalog of the process, which is shared by all sessions. A refresh fetches the
+        new matches and builds the next version in the background, the version is then swapped in at once:
+        a session keeps the catalog it got at the start of its script run, so it never sees a mix of versions. '''
+
+    def __init__(self):
+        self._current = None
+        self._lock = threading.Lock()
+        self._workers = {}
+        # the matches fetched since the current version was swapped in
+        self._fetched_match_ids = set()
+
+    def get(self):
+        with self._lock:
+            if self._current is None:
+                self._current = DataCatalog(get_data_version())
+            return self._current
+
+    def swap(self, catalog):
+        with self._lock:
+            self._current = catalog
+
+    def refresh(self, parser, competition_id, season_id, team_names):
+        ''' Fetches the new or updated matches of the season and swaps in the next version if the cached data
+            changed since the current version. Returns whether a new version was swapped in. '''
+        os.makedirs(folder_name, exist_ok=True)
+        df_season, fetched_match_ids = mc.refresh_matches(parser, competition_id=competition_id, season_id=season_id)
+        ed.sync()
+        current = self.get()
+        version = get_data_version()
+        # matches fetched by a refresh whose version was not swapped in are added to the next version as well
+        self._fetched_match_ids.update(fetched_match_ids)
+        if version == current.version and is_data_available(competition_id, season_id, team_names, version):
+            return False
+
+        # the next version writes derived files of its own, the files of the current version are left as they are
+        for team_name in team_names:
+            df_team = df_season[(df_season['home_team_name'] == team_name) | (df_season['away_team_name'] == team_name)]
+            file = get_team_file(competition_id, season_id, team_name)
+            update_team_events(parser, get_version_file(file, version), df_team, self._fetched_match_ids,
+                               source_file=get_version_file(file, current.version))
+        # the matches were fetched above, the tables are built from the match cache without fetching again
+        materialize_cached_season(competition_id, season_id,
+                                  match_week_file=get_version_file(match_week_stats_file, version),
+                                  player_file=get_version_file(player_match_stats_file, version))
+        # the datasets the sessions used so far are loaded for the next version before it is swapped in
+        self.swap(current.rebuild(version, self._fetched_match_ids))
+        self._fetched_match_ids = set()
+        # the sessions that started before the swap may still read the files of the previous version
+        remove_version_files({version, current.version})
+        print(f"Swapped in data version {version}")
+        return True
+
+    def start_refresh(self, competition_id, season_id, team_names, interval=6 * 60 * 60):
+        ''' Starts the background refresh of the season, once per process. '''
+        key = (competition_id, season_id, tuple(team_names))
+        with self._lock:
+            if key not in self._workers:
+                self._workers[key] = RefreshWorker(self, competition_id, season_id, team_names, interval)
+                self._workers[key].start()
+            return self._workers[key]
+
+
+class RefreshWorker(threading.Thread):
+    ''' Refreshes a season right away and then every interval seconds, off the request path. '''
+
+    def __init__(self, shared, competition_id, season_id, team_names, interval):
+        super().__init__(name=f'refresh-{competition_id}-{season_id}', daemon=True)
+        self.shared = shared
+        self.competition_id = competition_id
+        self.season_id = season_id
+        self.team_names = list(team_names)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.shared.refresh(Sbopen(), self.competition_id, self.season_id, self.team_names)
+            except Exception as e:
+                # the sessions keep using the current version, the next refresh tries again
+                print(f"Refreshing season {self.season_id} of competition {self.competition_id} failed ({e})")
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+shared = SharedCatalog()
+
+
 ####################################################################################
 # VARIABLE DESCRIPTIONS
 ####################################################################################
@@ -164,7 +930,16 @@ def get_variable_descriptions():
         ('Clearances', 'Number of clearances'),
         ('PassLengthSum', 'Sum of pass lengths'),
         ('PassLengthAvg', 'Average pass length'),
-        ('PassCnt', 'Number of passes')
+        ('PassCnt', 'Number of passes'),
+        ('RollingXGFor', 'Expected goals per match over the last five matches'),
+        ('RollingXGAgainst', 'Expected goals conceded per match over the last five matches'),
+        ('RollingGoalsFor', 'Goals scored per match over the last five matches'),
+        ('RollingGoalsAgainst', 'Goals conceded per match over the last five matches'),
+        ('RollingGoalDiff', 'Goal difference per match over the last five matches'),
+        ('RollingShots', 'Shots per match over the last five matches'),
+        ('RollingShotQuality', 'Expected goals per shot over the last five matches'),
+        ('FormEWM', 'Exponentially weighted average of the points per match'),
+        ('XGDiffEWM', 'Exponentially weighted average of the expected goal difference per match')
     ]
     df = pd.DataFrame(var_list, columns=['Variable', 'Description'])
     return df
@@ -0,0 +1,191 @@
+''' Events dataset partitioned by competition, season, team and match, e.g.
+
+        ./data/events/competition_id=37/season_id=4/team_name=Chelsea%20FCW/match_id=19736.parquet
+
+    Each file holds the events of one team in one match. A query only lists the directories that match its
+    competition, season and team filters and only reads the requested columns and event types of the files.
+
+    Run from the src folder to add competitions to the dataset, e.g.: python event_dataset.py --competition 37 '''
+import argparse
+import os.path
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+import pandas as pd
+import pyarrow.parquet as pq
+import event_fetcher as ef
+import event_store as es
+import match_cache as mc
+
+
+dataset_folder = './data/events'
+
+PARTITION_KEYS = ['competition_id', 'season_id', 'team_name', 'match_id']
+
+
+####################################################################################
+# PARTITIONS
+####################################################################################
+
+
+def get_partition_file(folder, competition_id, season_id, team_name, match_id):
+    return os.path.join(folder, f'competition_id={competition_id}', f'season_id={season_id}',
+                        f'team_name={quote(str(team_name))}', f'match_id={match_id}.parquet')
+
+
+def as_set(values):
+    ''' Returns the filter values as a set of strings, None matches every value. '''
+    if values is None:
+        return None
+    if isinstance(values, (str, int)):
+        values = [values]
+    return {str(value) for value in values}
+
+
+def scan(folder, key, values):
+    ''' Returns the (value, path) of the key=value entries of the folder that pass the filter values. '''
+    if not os.path.isdir(folder):
+        return []
+    entries = []
+    for entry in os.scandir(folder):
+        name, _, value = entry.name.partition('=')
+        if name != key or entry.name.endswith('.tmp'):
+            continue
+        value = unquote(value[:-len('.parquet')] if value.endswith('.parquet') else value)
+        if values is None or value in values:
+            entries.append((value, entry.path))
+    return entries
+
+
+def list_partitions(competition=None, season=None, team=None, match=None, folder=dataset_folder):
+    ''' Returns one row per partition file that passes the filters. Directories of other competitions, seasons
+        and teams are skipped without being listed. '''
+    rows = []
+    for competition_id, competition_path in scan(folder, 'competition_id', as_set(competition)):
+        for season_id, season_path in scan(competition_path, 'season_id', as_set(season)):
+            for team_name, team_path in scan(season_path, 'team_name', as_set(team)):
+                for match_id, path in scan(team_path, 'match_id', as_set(match)):
+                    rows.append((int(competition_id), int(season_id), team_name, int(match_id), path))
+    return pd.DataFrame(rows, columns=PARTITION_KEYS + ['path'])
+
+
+def write_match(df_events, competition_id, season_id, folder=dataset_folder):
+    ''' Writes the events of one match as one partition per team. '''
+    for team_name, df_team in df_events.groupby('team_name', observed=True):
+        file = get_partition_file(folder, competition_id, season_id, team_name, df_team['match_id'].iloc[0])
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        es.write_events(df_team, file)
+
+
+####################################################################################
+# QUERY
+####################################################################################
+
+
+def read_partition(path, columns=None, types=None):
+    filters = [('type_name', 'in', list(types))] if types is not None else None
+    read_columns = None if columns is None else [column for column in columns if column not in PARTITION_KEYS[:2]]
+    return es.read_events(path, columns=read_columns, filters=filters)
+
+
+def get_empty_events(columns=None, folder=dataset_folder):
+    ''' Returns an empty events DataFrame with the columns and types of the events of the dataset, read from the
+        schema of the first partition that is found. The columns of the event schema are used if the dataset is
+        empty. '''
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        files = sorted(name for name in filenames if name.endswith('.parquet'))
+        if files:
+            df = pq.read_schema(os.path.join(dirpath, files[0])).empty_table().to_pandas()
+            df = df.assign(**{key: pd.Series(dtype='int64') for key in PARTITION_KEYS[:2]})
+            break
+    else:
+        df = pd.DataFrame(columns=list(dict.fromkeys(PARTITION_KEYS[:2] + es.CATEGORICAL_COLUMNS +
+                                                     list(es.NUMERIC_COLUMNS))))
+    return es.apply_schema(df if columns is None else df.reindex(columns=columns))
+
+
+def events(competition=None, season=None, team=None, match=None, types=None, columns=None,
+           folder=dataset_folder, max_workers=4):
+    ''' Returns the events that pass the filters, e.g. events(competition=37, season=4, team='Chelsea FCW',
+        types=['Shot'], columns=['x', 'y', 'shot_statsbomb_xg']). Each filter takes a single value or a list.
+        team selects the events of that team, not of its opponents. competition_id and season_id are added
+        from the partition if columns is not given or contains them. '''
+    df_partitions = list_partitions(competition, season, team, match, folder)
+    if columns is not None and types is not None:
+        # the type filter is applied in memory as well, so it must be read
+        read_columns = list(dict.fromkeys(list(columns) + ['type_name']))
+    else:
+        read_columns = columns
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(lambda path: read_partition(path, read_columns, types), df_partitions['path']))
+
+    for frame, partition in zip(frames, df_partitions.itertuples()):
+        for key in PARTITION_KEYS[:2]:
+            if columns is None or key in columns:
+                frame[key] = getattr(partition, key)
+    if len(frames) == 0:
+        # no partition passes the filters, the empty result still has the columns of the events
+        return get_empty_events(columns, folder)
+    df = pd.concat(frames, ignore_index=True)
+    if types is not None:
+        df = df[df['type_name'].isin(types)]
+    if columns is not None:
+        df = df[list(columns)]
+    return es.apply_schema(df.reset_index(drop=True))
+
+
+####################################################################################
+# SYNC WITH THE MATCH CACHE
+####################################################################################
+
+
+def sync(matches_folder='./data/matches', folder=dataset_folder):
+    ''' Partitions the matches of the match cache that are not in the dataset yet or were fetched again since
+        they were partitioned, and removes the partitions of matches that left the cache. '''
+    manifest = mc.read_manifest(matches_folder)
+    df_partitions = list_partitions(folder=folder)
+    partition_mtimes = {match_id: min(os.stat(path).st_mtime_ns for path in df['path'])
+                        for match_id, df in df_partitions.groupby('match_id')}
+
+    for match_id, entry in manifest.items():
+        file = ef.get_match_file(matches_folder, match_id)
+        if not os.path.isfile(file):
+            continue
+        if match_id in partition_mtimes and partition_mtimes[match_id] >= os.stat(file).st_mtime_ns:
+            continue
+        for path in df_partitions.loc[df_partitions['match_id'] == match_id, 'path']:
+            os.remove(path)
+        write_match(es.read_events(file), entry['competition_id'], entry['season_id'], folder)
+
+    for path in df_partitions.loc[~df_partitions['match_id'].isin(manifest), 'path']:
+        os.remove(path)
+
+
+def ingest(parser, competition_id, season_id, matches_folder='./data/matches', folder=dataset_folder):
+    ''' Fetches the missing or updated matches of the season and adds them to the dataset. '''
+    mc.refresh_matches(parser, competition_id=competition_id, season_id=season_id, folder=matches_folder)
+    sync(matches_folder, folder)
+
+
+def main():
+    from mplsoccer import Sbopen
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--competition', type=int, nargs='*', help='competition ids, all competitions if omitted')
+    parser.add_argument('--season', type=int, nargs='*', help='season ids, all seasons if omitted')
+    args = parser.parse_args()
+
+    sb_parser = Sbopen()
+    df_competitions = sb_parser.competition()
+    if args.competition:
+        df_competitions = df_competitions[df_competitions['competition_id'].isin(args.competition)]
+    if args.season:
+        df_competitions = df_competitions[df_competitions['season_id'].isin(args.season)]
+    for competition in df_competitions.itertuples():
+        print(f"Adding {competition.competition_name} {competition.season_name}")
+        ingest(sb_parser, competition.competition_id, competition.season_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os.path
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import event_store as es
+
+
+def get_match_file(folder, match_id):
+    ''' Returns the path of the parquet file that stores the events of a single match. '''
+    return os.path.join(folder, f'{match_id}.parquet')
+
+
+def get_related_file(folder, match_id):
+    ''' Returns the path of the parquet file with the related events (e.g. key pass -> shot) of a single match. '''
+    return os.path.join(folder, f'{match_id}_related.parquet')
+
+
+def get_freeze_file(folder, match_id):
+    ''' Returns the path of the parquet file with the shot freeze frames of a single match. '''
+    return os.path.join(folder, f'{match_id}_freeze.parquet')
+
+
+def get_match_files(folder, match_id):
+    return [get_match_file(folder, match_id), get_related_file(folder, match_id), get_freeze_file(folder, match_id)]
+
+
+def fetch_match_events(parser, match_id, retries=3, backoff=1.0):
+    ''' Fetches the events, related events and freeze frames of a single match. Failed requests are retried
+        with exponential backoff. '''
+    for attempt in range(retries + 1):
+        try:
+            return parser.event(match_id)[:3]
+        except (OSError, ValueError) as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"Fetching match {match_id} failed ({e}).. retry in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def print_progress(done, total, match_id):
+    print(f"Fetched match {match_id} ({done}/{total})")
+
+
+def fetch_events(parser, match_ids, folder, max_workers=4, retries=3, backoff=1.0, progress=print_progress):
+    ''' Fetches the events of the matches with a bounded pool of workers and writes every match to its own
+        parquet file in the folder as soon as it is fetched. Matches that already have a file are skipped,
+        so an interrupted load resumes where it stopped. Returns the list of match files. '''
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    files = [get_match_file(folder, match_id) for match_id in match_ids]
+    missing = [match_id for match_id, file in zip(match_ids, files) if not os.path.isfile(file)]
+    total = len(missing)
+    if total == 0:
+        return files
+
+    def fetch_and_write(match_id):
+        frames = fetch_match_events(parser, match_id, retries=retries, backoff=backoff)
+        # the events file is written last, so a match with an events file is complete. A match without related
+        # events or freeze frames has no file for them.
+        for df, file in reversed(list(zip(frames, get_match_files(folder, match_id)))):
+            if df is None:
+                continue
+            # written atomically, so an interrupted write never leaves a partial match file
+            es.write_events(df, file)
+        return match_id
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch_and_write, match_id) for match_id in missing]
+        for done, future in enumerate(as_completed(futures), start=1):
+            match_id = future.result()
+            if progress is not None:
+                progress(done, total, match_id)
+    return files
@@ -0,0 +1,290 @@
+''' Embedded SQL over the local event files, executed in process by DuckDB. These views are always available:
+
+        events   - the events dataset (see event_dataset), one row per event with competition_id and season_id
+        matches  - the cached matches of the manifest (see match_cache), one row per match
+        calendar - the match calendar of the cached matches, one row per team and match as
+                   match_cache.get_match_calendar
+
+    Filters on competition_id and season_id only read the files of those partitions and only the columns a query
+    uses are read, so ad hoc queries over many seasons run vectorized on all cores instead of scanning a frame.
+    Frames that are already in memory are queried with query_frames, which does not touch the files, e.g.
+
+        query_frames("SELECT x, y FROM df WHERE type_name = 'Shot' AND team_name = $team", {'team': team}, df=df)
+
+    Run from the src folder, e.g.: python event_query.py "SELECT season_id, count(*) FROM events GROUP BY ALL"
+                               or: python event_query.py --saved match_week_stats competition_id=37 season_id=4 '''
+import argparse
+import os.path
+import threading
+from collections import namedtuple
+import duckdb
+import pandas as pd
+import event_dataset as ed
+import event_store as es
+import instrumentation as ins
+import match_cache as mc
+
+
+####################################################################################
+# CONNECTION
+####################################################################################
+
+
+def get_events_glob(folder=ed.dataset_folder):
+    ''' Returns the glob of all partition files of the dataset, see event_dataset.get_partition_file. '''
+    return os.path.join(folder, 'competition_id=*', 'season_id=*', 'team_name=*', 'match_id=*.parquet')
+
+
+def read_matches(matches_folder='./data/matches'):
+    ''' Returns the cached matches of all competitions and seasons from the manifest. '''
+    matches = [dict(entry, match_id=match_id) for match_id, entry in mc.read_manifest(matches_folder).items()]
+    df_matches = pd.DataFrame(matches, columns=['competition_id', 'season_id', 'match_id', 'match_date',
+                                                'match_week', 'home_team_name', 'away_team_name', 'home_score',
+                                                'away_score'])
+    df_matches['match_date'] = pd.to_datetime(df_matches['match_date'])
+    return df_matches
+
+
+# The same rows as match_cache.get_match_calendar, the matches of every season are numbered separately
+CALENDAR_SQL = '''
+SELECT row_number() OVER (PARTITION BY competition_id, season_id, team_name ORDER BY match_date, match_id)
+           AS match_number, *
+FROM (
+    SELECT competition_id, season_id, home_team_name AS team_name, match_id, match_date, match_week, true AS home,
+           away_team_name AS opponent_name, home_score AS goals_for, away_score AS goals_against
+    FROM matches
+    UNION ALL
+    SELECT competition_id, season_id, away_team_name, match_id, match_date, match_week, false, home_team_name,
+           away_score, home_score
+    FROM matches
+)
+'''
+
+
+def connect(folder=ed.dataset_folder, matches_folder='./data/matches', threads=None):
+    ''' Returns a new in-memory DuckDB connection with the events, matches and calendar views. The events view
+        lists the partition files on every query, so partitions that are added later are part of the next query.
+        threads limits the number of threads, all cores are used if it is not given. '''
+    connection = duckdb.connect()
+    if threads is not None:
+        connection.execute(f'SET threads = {int(threads)}')
+    # the files only have the columns of the events they hold, e.g. no shot columns for a team without shots
+    connection.execute(f"CREATE VIEW events AS SELECT * FROM read_parquet('{get_events_glob(folder)}', "
+                       f"hive_partitioning = true, hive_types = {{'competition_id': INTEGER, "
+                       f"'season_id': INTEGER}}, union_by_name = true)")
+    df_matches = read_matches(matches_folder)
+    connection.execute('CREATE TABLE matches AS SELECT * FROM df_matches')
+    connection.execute(f'CREATE VIEW calendar AS {CALENDAR_SQL}')
+    return connection
+
+
+def get_manifest_version(matches_folder='./data/matches'):
+    file = os.path.join(matches_folder, mc.MANIFEST_FILE)
+    return es.get_version(file) if os.path.isfile(file) else 'empty'
+
+
+_connection = None
+_connection_version = None
+_connection_lock = threading.Lock()
+_frame_connection = None
+
+
+def get_connection():
+    ''' Returns the connection of the process, which is created again whenever the match cache changes. '''
+    global _connection, _connection_version
+    with _connection_lock:
+        version = get_manifest_version()
+        if _connection is None or version != _connection_version:
+            _connection, _connection_version = connect(), version
+        return _connection
+
+
+def get_frame_connection():
+    ''' Returns the connection of the process for queries over in-memory frames only, it has no views. '''
+    global _frame_connection
+    with _connection_lock:
+        if _frame_connection is None:
+            _frame_connection = duckdb.connect()
+        return _frame_connection
+
+
+@ins.timed('sql.query')
+def query(sql, params=None, connection=None, **frames):
+    ''' Runs the SQL with the named $parameters of params and returns the result as a DataFrame. The frames
+        given as keyword arguments can be queried as tables of that name. Every query runs on its own cursor,
+        so queries can run concurrently from several threads. '''
+    cursor = (connection or get_connection()).cursor()
+    try:
+        for name, df in frames.items():
+            cursor.register(name, df)
+        return cursor.execute(sql, params).df()
+    finally:
+        cursor.close()
+
+
+def query_frames(sql, params=None, **frames):
+    ''' Runs the SQL over the frames given as keyword arguments only, e.g. in the visualizations. Neither the
+        events dataset nor the match cache need to exist. '''
+    return query(sql, params, get_frame_connection(), **frames)
+
+
+####################################################################################
+# SAVED QUERIES
+####################################################################################
+
+# A saved query is run by name with the given $parameters, see run_saved
+SavedQuery = namedtuple('SavedQuery', ['name', 'sql', 'params', 'description'])
+
+
+# The same statistics as data_preparation.MATCH_WEEK_STATS: the values of each team per match, the values against
+# a team are the match totals minus the team's own values and MatchWeek is the match number of the calendar
+MATCH_WEEK_STATS_SQL = '''
+WITH own AS (
+    SELECT team_name, match_id,
+           count(*) FILTER (outcome_name = 'Goal' OR type_name = 'Goal') AS goals,
+           count(*) FILTER (outcome_name = 'Shot' OR type_name = 'Shot') AS shots,
+           count(*) FILTER (outcome_name = 'Off T' OR type_name = 'Off T') AS shots_off_target,
+           count(*) FILTER (outcome_name = 'Blocked' OR type_name = 'Blocked') AS shots_blocked,
+           count(*) FILTER (outcome_name = 'Saved' OR type_name = 'Saved') AS shots_saved,
+           coalesce(sum(shot_statsbomb_xg::DOUBLE) FILTER (type_name = 'Shot'), 0) AS xg,
+           count(*) FILTER (outcome_name = 'Substitution' OR type_name = 'Substitution') AS substitutions,
+           count(*) FILTER (outcome_name = 'Offside' OR type_name = 'Offside') AS offsides,
+           count(*) FILTER (outcome_name = 'Clearance' OR type_name = 'Clearance') AS clearances,
+           coalesce(sum(pass_length::DOUBLE) FILTER (type_name = 'Pass'), 0) AS pass_length_sum,
+           avg(pass_length::DOUBLE) FILTER (type_name = 'Pass') AS pass_length_avg,
+           count(pass_length) FILTER (type_name = 'Pass') AS passes
+    FROM events
+    WHERE competition_id = $competition_id AND season_id = $season_id
+    GROUP BY team_name, match_id
+)
+SELECT own.team_name,
+       calendar.match_number AS MatchWeek,
+       goals AS GoalsScored,
+       (sum(goals) OVER (PARTITION BY own.match_id) - goals)::BIGINT AS GoalsConceded,
+       shots AS Shots,
+       shots_off_target AS ShotOffT,
+       shots_blocked AS ShotsBlocked,
+       shots_saved AS ShotsSaved,
+       xg AS ShotXG,
+       substitutions AS Substitutions,
+       offsides AS Offsides,
+       clearances AS Clearances,
+       pass_length_sum AS PassLengthSum,
+       pass_length_avg AS PassLengthAvg,
+       passes AS PassCnt
+FROM own JOIN calendar USING (team_name, match_id)
+ORDER BY own.team_name, MatchWeek
+'''
+
+SEASON_TABLE_SQL = '''
+WITH xg AS (
+    -- the shots of penalty shootouts (period 5) are left out
+    SELECT match_id, team_name, sum(shot_statsbomb_xg::DOUBLE) AS xg
+    FROM events
+    WHERE type_name = 'Shot' AND period < 5
+    GROUP BY match_id, team_name
+)
+SELECT competition_id, season_id, calendar.team_name,
+       count(*) AS Matches,
+       sum(CASE WHEN goals_for > goals_against THEN 3 WHEN goals_for = goals_against THEN 1 ELSE 0 END) AS Pts,
+       sum(goals_for) AS GF,
+       sum(goals_against) AS GA,
+       sum(coalesce(xg_for.xg, 0)) AS xGF,
+       sum(coalesce(xg_against.xg, 0)) AS xGA
+FROM calendar
+LEFT JOIN xg AS xg_for ON xg_for.match_id = calendar.match_id AND xg_for.team_name = calendar.team_name
+LEFT JOIN xg AS xg_against ON xg_against.match_id = calendar.match_id AND xg_against.team_name = calendar.opponent_name
+GROUP BY competition_id, season_id, calendar.team_name
+ORDER BY competition_id, season_id, Pts DESC, GF - GA DESC
+'''
+
+PLAYER_SEASON_SQL = '''
+SELECT competition_id, season_id, player_id::BIGINT AS player_id, last(player_name) AS player_name,
+       last(team_name) AS team_name,
+       count(DISTINCT match_id) AS Matches,
+       count(*) FILTER (type_name = 'Pass') AS Passes,
+       count(*) FILTER (type_name = 'Pass' AND outcome_name IS NULL) AS PassesCompleted,
+       count(*) FILTER (type_name = 'Pressure') AS Pressures,
+       count(*) FILTER (type_name = 'Shot') AS Shots,
+       count(*) FILTER (type_name = 'Shot' AND outcome_name = 'Goal') AS Goals,
+       coalesce(sum(shot_statsbomb_xg::DOUBLE) FILTER (type_name = 'Shot'), 0) AS ShotXG
+FROM events
+WHERE competition_id = $competition_id AND player_id IS NOT NULL
+GROUP BY competition_id, season_id, player_id
+ORDER BY season_id, ShotXG DESC
+'''
+
+SAVED_QUERIES = {saved.name: saved for saved in [
+    SavedQuery('match_week_stats', MATCH_WEEK_STATS_SQL, ['competition_id', 'season_id'],
+               'The match week statistics of every team of the season, as data_preparation.get_match_week_stats'),
+    SavedQuery('season_table', SEASON_TABLE_SQL, [],
+               'Points, goals and xG of every team in every cached season'),
+    SavedQuery('player_seasons', PLAYER_SEASON_SQL, ['competition_id'],
+               'The event counts and xG of every player in every season of the competition'),
+]}
+
+
+def run_saved(name, connection=None, **params):
+    ''' Runs the saved query with the given parameters, e.g. run_saved('match_week_stats', competition_id=37,
+        season_id=4). '''
+    if name not in SAVED_QUERIES:
+        raise ValueError(f"Unknown saved query '{name}', use one of {', '.join(SAVED_QUERIES)}")
+    saved = SAVED_QUERIES[name]
+    missing = set(saved.params) - set(params)
+    if missing:
+        raise ValueError(f"Saved query '{name}' needs the parameter(s) {', '.join(sorted(missing))}")
+    return query(saved.sql, {param: params[param] for param in saved.params}, connection)
+
+
+def get_match_week_stats(competition_id, season_id, connection=None):
+    ''' Returns the match week statistics of the season indexed by (team_name, MatchWeek), like
+        data_preparation.load_match_week_stats but computed from the events dataset on every call. '''
+    df = run_saved('match_week_stats', connection, competition_id=competition_id, season_id=season_id)
+    return df.set_index(['team_name', 'MatchWeek'])
+
+
+####################################################################################
+# COMMAND LINE
+####################################################################################
+
+
+def parse_param(text):
+    name, _, value = text.partition('=')
+    return name, int(value) if value.lstrip('-').isdigit() else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sql', nargs='?', help='the query to run')
+    parser.add_argument('--saved', help='run the saved query of this name instead')
+    parser.add_argument('params', nargs='*', metavar='NAME=VALUE', help='parameters of the query')
+    parser.add_argument('--list', action='store_true', help='list the saved queries')
+    parser.add_argument('--threads', type=int, help='number of threads, all cores if omitted')
+    parser.add_argument('--output', help='write the result to this csv or parquet file instead of printing it')
+    args = parser.parse_args()
+
+    if args.list:
+        for saved in SAVED_QUERIES.values():
+            print(f"{saved.name}({', '.join(saved.params)}): {saved.description}")
+        return
+    # with --saved the first positional argument is a parameter, not a query
+    params = dict(parse_param(text) for text in ([args.sql] if args.saved and args.sql else []) + args.params)
+    connection = connect(threads=args.threads)
+    if args.saved:
+        df = run_saved(args.saved, connection, **params)
+    elif args.sql:
+        df = query(args.sql, params or None, connection)
+    else:
+        parser.error('give a query or --saved NAME')
+
+    if args.output is None:
+        with pd.option_context('display.max_rows', 100, 'display.width', 200):
+            print(df)
+    elif args.output.endswith('.parquet'):
+        df.to_parquet(args.output, index=False)
+    else:
+        df.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os.path
+import os
+import tempfile
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+####################################################################################
+# EVENT SCHEMA
+####################################################################################
+
+# Low cardinality string columns that are stored as categoricals
+CATEGORICAL_COLUMNS = ['type_name', 'team_name', 'outcome_name', 'sub_type_name', 'play_pattern_name',
+                       'possession_team_name', 'position_name', 'body_part_name', 'technique_name']
+
+# Compact numeric types for the columns used by the analysis
+NUMERIC_COLUMNS = {
+    'match_id': 'int32',
+    'index': 'int32',
+    'period': 'int8',
+    'minute': 'int16',
+    'second': 'int8',
+    'possession': 'int16',
+    'match_week': 'int8',
+    'type_id': 'int16',
+    'team_id': 'int32',
+    'player_id': 'float32',
+    'position_id': 'float32',
+    'outcome_id': 'float32',
+    'sub_type_id': 'float32',
+    'x': 'float32',
+    'y': 'float32',
+    'end_x': 'float32',
+    'end_y': 'float32',
+    'end_z': 'float32',
+    'duration': 'float32',
+    'pass_length': 'float32',
+    'pass_angle': 'float32',
+    'pass_recipient_id': 'float32',
+    'shot_statsbomb_xg': 'float32',
+    'substitution_replacement_id': 'float32',
+}
+
+
+def apply_schema(df):
+    ''' Casts the known columns of an events DataFrame to categoricals and compact numeric types.
+        Integer columns that contain missing values are stored as float32 instead. '''
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column, dtype in NUMERIC_COLUMNS.items():
+        if column in df.columns:
+            if dtype.startswith('int') and df[column].isna().any():
+                dtype = 'float32'
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+####################################################################################
+# READ & WRITE EVENTS
+####################################################################################
+
+
+def replace_file(file, write):
+    ''' Calls write(tmp_file) with a temporary file of its own next to the file and then replaces the file at once.
+        Concurrent writers of the same file (e.g. the background refresh and a request) never share a temporary
+        file, the last replace wins. '''
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(file) or '.', prefix=os.path.basename(file) + '.',
+                                    suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_file)
+        os.replace(tmp_file, file)
+    except BaseException:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def write_events(df, file):
+    ''' Writes the events with the explicit schema to a parquet file. The file is replaced at once, so a
+        concurrent reader sees either the old or the new events. '''
+    df = apply_schema(df).reset_index(drop=True)
+    replace_file(file, lambda tmp_file: df.to_parquet(tmp_file, engine='pyarrow', index=False))
+
+
+def migrate_csv(csv_file, file):
+    ''' Converts a previously written events csv into the parquet store. '''
+    print(f"Migrating {csv_file} to {file}")
+    df = pd.read_csv(csv_file, low_memory=False)
+    write_events(df, file)
+
+
+def read_events(file, columns=None, filters=None):
+    ''' Reads the events from a parquet file. Only the given columns are read if columns is specified, columns
+        that are not in the file (e.g. shot columns of a match without shots) are returned as missing values.
+        The filters are pushed down to the parquet reader, see read_projection.
+        If the parquet file does not exist yet but a csv with the same name does, the csv is migrated first. '''
+    csv_file = os.path.splitext(file)[0] + '.csv'
+    if not os.path.isfile(file) and os.path.isfile(csv_file):
+        migrate_csv(csv_file, file)
+    if columns is None:
+        return pd.read_parquet(file, engine='pyarrow', filters=filters)
+    file_columns = set(pq.read_schema(file).names)
+    df = pd.read_parquet(file, engine='pyarrow', filters=filters,
+                         columns=[column for column in columns if column in file_columns])
+    return df.reindex(columns=columns)
+
+
+def iter_events(file, columns=None, chunk_rows=100_000):
+    ''' Yields the events of a parquet or csv file in chunks of at most chunk_rows rows, so only one chunk is
+        held in memory at a time. Columns that are not in the file are returned as missing values. '''
+    if file.endswith('.csv'):
+        for df in pd.read_csv(file, chunksize=chunk_rows, low_memory=False):
+            yield apply_schema(df if columns is None else df.reindex(columns=columns))
+        return
+    parquet_file = pq.ParquetFile(file)
+    read_columns = None if columns is None else [column for column in columns
+                                                 if column in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=read_columns):
+        df = batch.to_pandas()
+        yield df if columns is None else df.reindex(columns=columns)
+
+
+def get_version(file):
+    ''' Returns a cheap version string of an events file that changes whenever the file is rewritten. '''
+    stat = os.stat(file)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+####################################################################################
+# PROJECTIONS
+####################################################################################
+
+# A projection declares the columns a consumer uses and the rows it needs, given as parquet style filters
+# [(column, op, value), ...] with op one of '==', '!=', 'in' and 'not in'. The filter columns are only read,
+# they are not part of the projected frame unless they are listed in columns as well.
+Projection = namedtuple('Projection', ['name', 'columns', 'filters'])
+
+
+def filter_rows(df, filters):
+    ''' Returns a boolean mask of the rows of df that match all filters of a projection. '''
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters or []:
+        if op == '==':
+            mask &= (df[column] == value).to_numpy(dtype=bool)
+        elif op == '!=':
+            mask &= (df[column] != value).to_numpy(dtype=bool)
+        elif op == 'in':
+            mask &= df[column].isin(value).to_numpy(dtype=bool)
+        elif op == 'not in':
+            mask &= ~df[column].isin(value).to_numpy(dtype=bool)
+        else:
+            raise ValueError(f"Unknown filter operator '{op}'")
+    return mask
+
+
+def compact(df):
+    ''' Applies the event schema and stores the remaining columns compactly: strings with few distinct values as
+        categoricals and numbers with the smallest float/integer type that holds them. '''
+    df = apply_schema(df)
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].cat.remove_unused_categories()
+        elif column in NUMERIC_COLUMNS:
+            continue
+        elif df[column].dtype == object and df[column].nunique() < 0.5 * len(df):
+            df[column] = df[column].astype('category')
+        elif pd.api.types.is_float_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='float')
+        elif pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def project(df, projection):
+    ''' Returns the compact frame of the projection from an events DataFrame that is already in memory. '''
+    df = df.loc[filter_rows(df, projection.filters), list(projection.columns)]
+    return compact(df.reset_index(drop=True))
+
+
+def read_projection(file, projection):
+    ''' Reads the compact frame of the projection from a parquet file. Only the projected and filter columns are
+        read and the row filters are pushed down to the parquet reader. '''
+    filter_columns = [column for column, _, _ in projection.filters or []]
+    columns = list(dict.fromkeys(list(projection.columns) + filter_columns))
+    filters = [(column, op, list(value) if op in ('in', 'not in') else value)
+               for column, op, value in projection.filters] if projection.filters else None
+    df = read_events(file, columns=columns, filters=filters)
+    # the parquet filters skip row groups and pages, the exact filter is applied in memory
+    return project(df, projection)
+
+
+def get_memory_usage(frames):
+    ''' Returns the rows, columns and deep memory usage in MB of the given {name: DataFrame} frames. '''
+    rows = [(name, len(df), len(df.columns), df.memory_usage(deep=True).sum() / 2 ** 20)
+            for name, df in frames.items()]
+    return pd.DataFrame(rows, columns=['frame', 'rows', 'columns', 'MB']).set_index('frame')
@@ -0,0 +1,233 @@
+''' Renders every figure of a season headless: the pressure map, shot map, shot context map, match week and
+    form chart of each team and the pass map and pass network of each team in each match. The figures are
+    rendered across a process pool and figures whose inputs did not change since the last export are skipped.
+    manifest.json in the output folder lists every figure with the version of its inputs.
+
+    Run from the src folder, e.g.: python export_figures.py --competition 37 --season 4 --format png svg '''
+import argparse
+import hashlib
+import json
+import os.path
+import os
+import time
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import data_preparation as dp
+import event_store as es
+import match_cache as mc
+import possession_chains as pc
+import rolling_form as rf
+import visualizations as vz
+
+
+export_folder = './data/export'
+MANIFEST_FILE = 'manifest.json'
+
+# One figure to export, rendered once and saved in each of the formats to the path of the same position:
+# team_name and match_id are None for figures that do not depend on them
+ExportJob = namedtuple('ExportJob', ['figure', 'competition_id', 'season_id', 'team_name', 'match_id', 'formats',
+                                     'paths', 'inputs'])
+
+TEAM_FIGURES = ['pressure_map', 'shot_map', 'shot_context', 'match_week', 'form']
+MATCH_FIGURES = ['pass_map', 'pass_network']
+
+# The catalog datasets each figure is created from, they are loaded before the workers start
+FIGURE_DATASETS = {
+    'pressure_map': ['match_index'],
+    'shot_map': ['match_index'],
+    'shot_context': ['shot_features'],
+    'match_week': ['match_week_stats'],
+    'form': ['rolling_form'],
+    'pass_map': ['match_index'],
+    'pass_network': ['match_index', 'pass_networks'],
+}
+
+
+def get_inputs_version(df_matches):
+    ''' Returns a version of the matches that changes whenever StatsBomb updates one of them. '''
+    content = json.dumps(sorted(zip(df_matches['match_id'].astype(int), df_matches['last_updated'].astype(str))))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def get_season_matches(competition_id, season_id, folder='./data/matches'):
+    ''' Returns the cached matches of the season with the time StatsBomb last updated them. '''
+    manifest = mc.read_manifest(folder)
+    df_matches = mc.get_season_matches(competition_id, season_id, folder)
+    return df_matches.assign(last_updated=[manifest[match_id]['last_updated'] for match_id in df_matches['match_id']])
+
+
+def get_jobs(competition_id, season_id, formats, folder=export_folder):
+    ''' Returns the export jobs of all figures of the season. '''
+    df_matches = get_season_matches(competition_id, season_id)
+    season_folder = os.path.join(folder, f'{competition_id}_{season_id}')
+    # the team figures use the matches of the whole season (e.g. the match week numbers), the match figures only
+    # the match itself
+    season_inputs = get_inputs_version(df_matches)
+    teams = sorted(set(df_matches['home_team_name']) | set(df_matches['away_team_name']))
+
+    jobs = []
+    for team_name in teams:
+        slug = team_name.lower().replace(' ', '_')
+        for figure in TEAM_FIGURES:
+            figure_formats = ['html'] if figure in ('match_week', 'form') else formats
+            paths = [os.path.join(season_folder, 'teams', slug, f'{figure}.{fmt}') for fmt in figure_formats]
+            jobs.append(ExportJob(figure, competition_id, season_id, team_name, None, figure_formats, paths,
+                                  season_inputs))
+    for match in df_matches.itertuples():
+        match_inputs = get_inputs_version(df_matches[df_matches['match_id'] == match.match_id])
+        for team_name in (match.home_team_name, match.away_team_name):
+            slug = team_name.lower().replace(' ', '_')
+            for figure in MATCH_FIGURES:
+                paths = [os.path.join(season_folder, 'matches', str(match.match_id), f'{figure}_{slug}.{fmt}')
+                         for fmt in formats]
+                jobs.append(ExportJob(figure, competition_id, season_id, team_name, int(match.match_id), formats,
+                                      paths, match_inputs))
+    return jobs
+
+
+####################################################################################
+# RENDERING
+####################################################################################
+
+
+def create_figure(job):
+    ''' Creates the figure of the job from the data catalog of the worker process. '''
+    competition_id, season_id, team_name = job.competition_id, job.season_id, job.team_name
+    catalog = dp.shared.get()
+    if job.figure == 'match_week':
+        df_team = catalog.match_week_stats(competition_id, season_id).loc[team_name]
+        return vz.plot_ind_match_week(df_team, [stat.name for stat in dp.MATCH_WEEK_STATS])
+    if job.figure == 'form':
+        df_form = catalog.rolling_form(competition_id, season_id).to_frame(team_name)
+        return vz.plot_ind_match_week(df_form, rf.FORM_METRICS)
+
+    match_index = catalog.match_index(competition_id, season_id)
+    if job.figure == 'pressure_map':
+        return vz.create_pressure_maps(match_index.df_events, team_name)
+    if job.figure == 'shot_map':
+        return vz.create_shot_map(match_index.df_events, team_name)
+    if job.figure == 'shot_context':
+        return vz.create_shot_context_map(catalog.shot_features(competition_id, season_id), team_name)
+    if job.figure == 'pass_map':
+        return vz.create_pass_map(match_index.events(job.match_id), match_index.lineup(job.match_id), team_name)
+    if job.figure == 'pass_network':
+        lineup = match_index.lineup(job.match_id)
+        opponent = [name for name in lineup['team_name'].unique() if name != team_name][0]
+        network = pc.select_network(catalog.pass_networks(competition_id, season_id), job.match_id, team_name)
+        return vz.create_pass_network(network.nodes, network.edges, team_name, opponent)
+    raise ValueError(f"Unknown figure '{job.figure}'")
+
+
+def load_datasets(jobs):
+    ''' Loads every catalog dataset the figures of the jobs are created from, so the forked workers share them
+        instead of each worker loading (or building) them again. '''
+    catalog = dp.shared.get()
+    for competition_id, season_id, figure in sorted({(job.competition_id, job.season_id, job.figure)
+                                                     for job in jobs}):
+        for dataset in FIGURE_DATASETS[figure]:
+            getattr(catalog, dataset)(competition_id, season_id)
+
+
+def render_job(job):
+    ''' Creates the figure of the job once and saves it in each format to its path. Returns the job and the
+        render time in seconds. '''
+    warnings.simplefilter('ignore')
+    start = time.perf_counter()
+    fig = create_figure(job)
+    for fmt, path in zip(job.formats, job.paths):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == 'html':
+            es.replace_file(path, lambda tmp_file: fig.write_html(tmp_file, include_plotlyjs='cdn'))
+        else:
+            es.replace_file(path, lambda tmp_file: fig.savefig(tmp_file, format=fmt, bbox_inches='tight', dpi=200))
+    if 'html' not in job.formats:
+        plt.close(fig)
+    return job, time.perf_counter() - start
+
+
+####################################################################################
+# EXPORT
+####################################################################################
+
+
+def read_manifest(folder):
+    file = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.isfile(file):
+        return {}
+    with open(file, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(folder, manifest):
+    file = os.path.join(folder, MANIFEST_FILE)
+    def write(tmp_file):
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(manifest.items())), f, indent=2)
+    es.replace_file(file, write)
+
+
+def is_up_to_date(job, manifest, folder):
+    for path in job.paths:
+        entry = manifest.get(os.path.relpath(path, folder))
+        if entry is None or entry['inputs'] != job.inputs or not os.path.isfile(path):
+            return False
+    return True
+
+
+def export(jobs, folder=export_folder, max_workers=None, force=False):
+    ''' Renders the jobs whose outputs are missing or whose inputs changed across a pool of max_workers
+        processes (one per core by default) and updates the manifest after every figure. '''
+    os.makedirs(folder, exist_ok=True)
+    manifest = read_manifest(folder)
+    pending = [job for job in jobs if force or not is_up_to_date(job, manifest, folder)]
+    print(f"{len(jobs) - len(pending)} of {len(jobs)} figures are up to date, rendering {len(pending)}")
+    if len(pending) == 0:
+        return manifest
+
+    start = time.perf_counter()
+    load_datasets(pending)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(render_job, job) for job in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            job, seconds = future.result()
+            for fmt, path in zip(job.formats, job.paths):
+                manifest[os.path.relpath(path, folder)] = {
+                    'figure': job.figure, 'competition_id': job.competition_id, 'season_id': job.season_id,
+                    'team_name': job.team_name, 'match_id': job.match_id, 'format': fmt, 'inputs': job.inputs,
+                    'rendered_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seconds': round(seconds, 3)}
+            print(f"Rendered {', '.join(job.paths)} in {seconds:.1f}s ({done}/{len(pending)})")
+            # an interrupted export keeps the figures rendered so far
+            write_manifest(folder, manifest)
+    print(f"Rendered {len(pending)} figures in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--competition', type=int, default=37)
+    parser.add_argument('--season', type=int, nargs='+', default=[4])
+    parser.add_argument('--format', nargs='+', default=['png'], choices=['png', 'svg'],
+                        help='formats of the matplotlib figures, the match week charts are exported as html')
+    parser.add_argument('--figures', nargs='+', choices=TEAM_FIGURES + MATCH_FIGURES,
+                        help='only export these figures')
+    parser.add_argument('--output', default=export_folder)
+    parser.add_argument('--workers', type=int, help='number of processes, defaults to the number of cores')
+    parser.add_argument('--force', action='store_true', help='render all figures, even if they are up to date')
+    args = parser.parse_args()
+
+    jobs = []
+    for season_id in args.season:
+        # the season is fetched once, the datasets of the figures are loaded by export before the workers start
+        dp.shared.get().match_index(args.competition, season_id)
+        jobs.extend(get_jobs(args.competition, season_id, args.format, args.output))
+    if args.figures:
+        jobs = [job for job in jobs if job.figure in args.figures]
+    export(jobs, args.output, max_workers=args.workers, force=args.force)
+
+
+if __name__ == '__main__':
+    main()
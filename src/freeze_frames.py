@@ -0,0 +1,150 @@
+''' Spatial queries on the StatsBomb shot freeze frames, i.e. the locations of the players at the moment of each
+    shot. All freeze frames of a season are indexed at once and every query answers a batch of shots with array
+    operations, there is no loop over the shots. The coordinates are StatsBomb yards (120 x 80) with the shooting
+    team attacking the goal at x = 120. '''
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+GOAL_X = 120.0
+LEFT_POST_Y = 36.0
+RIGHT_POST_Y = 44.0
+
+GOALKEEPER_POSITION_ID = 1
+
+# The columns of the events the shot features are computed from
+SHOT_COLUMNS = ['match_id', 'id', 'index', 'team_name', 'player_name', 'type_name', 'x', 'y', 'shot_statsbomb_xg',
+                'outcome_name']
+
+# The frames are stacked along a third axis this far apart, so a single KD-tree never matches players of
+# different frames (the pitch diagonal is about 144 yards)
+FRAME_SPACING = 1000.0
+
+SHOT_FEATURES = ['distance', 'angle', 'defenders_in_cone', 'goalkeeper_in_cone', 'nearest_defender_distance',
+                 'defenders_within_radius', 'goalkeeper_x', 'goalkeeper_y', 'goalkeeper_distance']
+
+
+def get_shot_geometry(x, y):
+    ''' Returns the distance to the centre of the goal and the angle (in degrees) between the posts. '''
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    distance = np.hypot(GOAL_X - x, (LEFT_POST_Y + RIGHT_POST_Y) / 2 - y)
+    angle = np.abs(np.arctan2(RIGHT_POST_Y - y, GOAL_X - x) - np.arctan2(LEFT_POST_Y - y, GOAL_X - x))
+    return distance, np.degrees(angle)
+
+
+def in_cone(shot_x, shot_y, x, y):
+    ''' Returns whether the points lie in the triangle between the shot location and the two posts. '''
+    def side(ax, ay, bx, by):
+        return (bx - ax) * (y - ay) - (by - ay) * (x - ax)
+    d1 = side(shot_x, shot_y, GOAL_X, LEFT_POST_Y)
+    d2 = side(GOAL_X, LEFT_POST_Y, GOAL_X, RIGHT_POST_Y)
+    d3 = side(GOAL_X, RIGHT_POST_Y, shot_x, shot_y)
+    has_neg = (d1 < 0) | (d2 < 0) | (d3 < 0)
+    has_pos = (d1 > 0) | (d2 > 0) | (d3 > 0)
+    return ~(has_neg & has_pos)
+
+
+class FreezeFrameIndex:
+    ''' The freeze frames of many shots, as returned by mplsoccer's Sbopen.event (one row per player and shot,
+        id is the id of the shot). The players are stored frame by frame in flat arrays and the outfield
+        defenders are indexed in a KD-tree, so a query over thousands of shots takes a few array operations. '''
+
+    def __init__(self, df_freeze):
+        df_freeze = df_freeze.sort_values(['id', 'event_freeze_id'], kind='stable')
+        shot_ids = df_freeze['id'].to_numpy(dtype=object)
+        self.shot_ids, self.frame = np.unique(shot_ids, return_inverse=True)
+        self.x = df_freeze['x'].to_numpy(dtype=np.float64)
+        self.y = df_freeze['y'].to_numpy(dtype=np.float64)
+        self.defender = ~df_freeze['teammate'].to_numpy(dtype=bool)
+        self.goalkeeper = self.defender & (df_freeze['position_id'].to_numpy(dtype=np.float64, na_value=np.nan) ==
+                                           GOALKEEPER_POSITION_ID)
+        outfield = self.defender & ~self.goalkeeper
+        self.tree = cKDTree(np.column_stack([self.x[outfield], self.y[outfield],
+                                             self.frame[outfield] * FRAME_SPACING]))
+
+    def __len__(self):
+        return len(self.shot_ids)
+
+    def get_frames(self, shot_ids):
+        ''' Returns the frame number of each shot, -1 for shots without a freeze frame. '''
+        shot_ids = np.asarray(shot_ids, dtype=object)
+        if len(self) == 0:
+            return np.full(len(shot_ids), -1)
+        positions = np.minimum(np.searchsorted(self.shot_ids, shot_ids), len(self) - 1)
+        return np.where(self.shot_ids[positions] == shot_ids, positions, -1)
+
+    def _query_points(self, frames, x, y):
+        return np.column_stack([x, y, frames * FRAME_SPACING])
+
+    def nearest_defender_distance(self, shot_ids, x, y):
+        ''' Returns the distance of the nearest outfield defender to each shot location. '''
+        frames = self.get_frames(shot_ids)
+        distance = np.full(len(frames), np.nan)
+        if self.tree.n == 0:
+            return distance
+        found = frames >= 0
+        result, _ = self.tree.query(self._query_points(frames[found], np.asarray(x)[found], np.asarray(y)[found]),
+                                    distance_upper_bound=FRAME_SPACING / 2)
+        distance[found] = np.where(np.isinf(result), np.nan, result)
+        return distance
+
+    def defenders_within(self, shot_ids, x, y, radius=5.0):
+        ''' Returns the number of outfield defenders within the radius (in yards) of each shot location. '''
+        frames = self.get_frames(shot_ids)
+        counts = np.full(len(frames), np.nan)
+        found = frames >= 0
+        if self.tree.n == 0:
+            counts[found] = 0
+            return counts
+        counts[found] = self.tree.query_ball_point(
+            self._query_points(frames[found], np.asarray(x)[found], np.asarray(y)[found]), radius,
+            return_length=True)
+        return counts
+
+    def defenders_in_cone(self, shot_ids, x, y):
+        ''' Returns the number of outfield defenders and whether the goalkeeper is between each shot location
+            and the posts. '''
+        frames = self.get_frames(shot_ids)
+        found = frames >= 0
+        # the shot location of every player's frame
+        shot_x, shot_y = np.full(len(self), np.nan), np.full(len(self), np.nan)
+        shot_x[frames[found]] = np.asarray(x, dtype=np.float64)[found]
+        shot_y[frames[found]] = np.asarray(y, dtype=np.float64)[found]
+        inside = in_cone(shot_x[self.frame], shot_y[self.frame], self.x, self.y) & \
+            ~np.isnan(shot_x[self.frame])
+
+        # the last element holds the value of the shots without a frame (frame -1)
+        defenders = np.append(np.bincount(self.frame[inside & self.defender & ~self.goalkeeper], minlength=len(self)),
+                              np.nan)
+        goalkeeper = np.append(np.bincount(self.frame[inside & self.goalkeeper], minlength=len(self)) > 0, np.nan)
+        return defenders[frames], goalkeeper[frames]
+
+    def goalkeeper_position(self, shot_ids):
+        ''' Returns the x and y of the goalkeeper of the defending team, NaN if the keeper is not in the frame. '''
+        # the last element stays NaN for the shots without a frame (frame -1)
+        gk_x, gk_y = np.full(len(self) + 1, np.nan), np.full(len(self) + 1, np.nan)
+        gk_x[self.frame[self.goalkeeper]] = self.x[self.goalkeeper]
+        gk_y[self.frame[self.goalkeeper]] = self.y[self.goalkeeper]
+        frames = self.get_frames(shot_ids)
+        return gk_x[frames], gk_y[frames]
+
+
+def get_shot_features(df_events, df_freeze, radius=5.0):
+    ''' Returns one row per shot of the events with its location, xG and outcome and the features of its freeze
+        frame. Shots without a freeze frame have NaN features. '''
+    df_shots = df_events.loc[df_events['type_name'] == 'Shot', ['match_id', 'id', 'index', 'team_name',
+                                                                 'player_name', 'x', 'y', 'shot_statsbomb_xg',
+                                                                 'outcome_name']].reset_index(drop=True)
+    for column in ['team_name', 'player_name', 'outcome_name']:
+        df_shots[column] = df_shots[column].astype(object)
+    index = FreezeFrameIndex(df_freeze)
+    shot_ids = df_shots['id'].to_numpy(dtype=object)
+    x, y = df_shots['x'].to_numpy(dtype=np.float64), df_shots['y'].to_numpy(dtype=np.float64)
+
+    df_shots['distance'], df_shots['angle'] = get_shot_geometry(x, y)
+    df_shots['defenders_in_cone'], df_shots['goalkeeper_in_cone'] = index.defenders_in_cone(shot_ids, x, y)
+    df_shots['nearest_defender_distance'] = index.nearest_defender_distance(shot_ids, x, y)
+    df_shots['defenders_within_radius'] = index.defenders_within(shot_ids, x, y, radius)
+    df_shots['goalkeeper_x'], df_shots['goalkeeper_y'] = index.goalkeeper_position(shot_ids)
+    df_shots['goalkeeper_distance'] = np.hypot(df_shots['goalkeeper_x'] - x, df_shots['goalkeeper_y'] - y)
+    return df_shots
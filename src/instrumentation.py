@@ -0,0 +1,94 @@
+import json
+import logging
+import os.path
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+logger = logging.getLogger('sda.performance')
+
+# Each Streamlit session runs its script in its own thread, so the spans are recorded per thread. Threads that
+# never start a run, such as the refresh and export workers, record nothing
+_local = threading.local()
+
+
+def configure_log(file):
+    ''' Appends the summary of every run as one JSON line to the file. Does nothing if file is None. '''
+    if file is None or any(getattr(handler, 'baseFilename', None) == os.path.abspath(file)
+                           for handler in logger.handlers):
+        return
+    handler = logging.FileHandler(file, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def start_run(name='run'):
+    ''' Starts recording the spans of a new script run in the current thread. '''
+    _local.run = {'name': name, 'start': time.time(), 'perf_start': time.perf_counter(), 'spans': [], 'counters': {}}
+    _local.depth = 0
+
+
+def get_run():
+    ''' Returns the run of the current thread, or None if no run was started. '''
+    return getattr(_local, 'run', None)
+
+
+@contextmanager
+def span(name, **attrs):
+    ''' Records the wall time of the block as a span of the current run. Spans can be nested. Does nothing if no
+        run is active in the thread. '''
+    run = get_run()
+    if run is None:
+        yield
+        return
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        run['spans'].append({'name': name, 'depth': depth, 'offset': start - run['perf_start'],
+                             'seconds': time.perf_counter() - start, **attrs})
+
+
+def timed(name=None):
+    ''' Decorator that records every call of the function as a span. '''
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    ''' Increments a counter of the current run, e.g. cache hits and misses. Does nothing if no run is active. '''
+    run = get_run()
+    if run is None:
+        return
+    counters = run['counters']
+    counters[name] = counters.get(name, 0) + value
+
+
+def to_json(summary):
+    return json.dumps(summary, default=str)
+
+
+def finish_run():
+    ''' Returns the summary of the current run and writes it as one JSON line to the performance logger. The run
+        ends, so the thread records nothing until the next start_run. Returns None if no run is active. '''
+    run = get_run()
+    if run is None:
+        return None
+    _local.run = None
+    summary = {'name': run['name'], 'start': run['start'], 'seconds': time.time() - run['start'],
+               'spans': sorted(run['spans'], key=lambda s: s['offset']), 'counters': dict(run['counters'])}
+    logger.info(to_json(summary))
+    return summary
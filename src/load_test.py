@@ -0,0 +1,91 @@
+''' Load test of the query service: sends the requests from a number of concurrent clients, each with its own
+    keep-alive connection, and reports the throughput, the latency percentiles and the status codes. With
+    --revalidate the clients send the ETag of their previous response, as a caching consumer would.
+
+    Start the service first, then run from the src folder, e.g.: python load_test.py --requests 5000 --clients 16 '''
+import argparse
+import http.client
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+import numpy as np
+
+
+DEFAULT_PATHS = [
+    '/version',
+    '/variables',
+    '/competitions/37/seasons/4/teams',
+    '/competitions/37/seasons/4/calendar?team=Chelsea%20FCW',
+    '/competitions/37/seasons/4/match-week-stats',
+    '/competitions/37/seasons/4/match-week-stats?team=Chelsea%20FCW&stat=ShotXG,GoalsScored',
+    '/competitions/37/seasons/4/form?team=Arsenal%20WFC',
+    '/competitions/37/seasons/4/bins?type=Pressure&grid=positional_full',
+    '/competitions/37/seasons/4/simulation',
+]
+
+
+def run_client(url, paths, requests, revalidate, results):
+    ''' Sends the requests over one connection and appends (status, seconds) of each request to results. '''
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    etags = {}
+    for i in range(requests):
+        path = paths[i % len(paths)]
+        headers = {'If-None-Match': etags[path]} if revalidate and path in etags else {}
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('ETag'):
+                etags[path] = response.getheader('ETag')
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        results.append((status, time.perf_counter() - start))
+    connection.close()
+
+
+def load_test(base_url, paths, requests=2000, clients=8, revalidate=False):
+    ''' Sends the requests spread over the clients and returns the summary of the run. '''
+    url = urlsplit(base_url)
+    results = []
+    threads = [threading.Thread(target=run_client, args=(url, paths, requests // clients + (i < requests % clients),
+                                                         revalidate, results))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies = np.array([latency for _, latency in results]) * 1000
+    return {
+        'requests': len(results),
+        'clients': clients,
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(results) / seconds, 1),
+        'latency_ms': {f'p{q}': round(float(np.percentile(latencies, q)), 2) for q in (50, 90, 99)},
+        'status': dict(Counter(str(status) for status, _ in results)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8502')
+    parser.add_argument('--path', nargs='+', default=DEFAULT_PATHS, help='paths to request in turn')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--revalidate', action='store_true', help='send If-None-Match with the last ETag')
+    args = parser.parse_args()
+
+    summary = load_test(args.url, args.path, args.requests, args.clients, args.revalidate)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
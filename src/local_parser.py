@@ -0,0 +1,40 @@
+import os.path
+import time
+from collections import defaultdict
+from mplsoccer import Sblocal
+
+
+class LocalSbopen:
+    ''' Stand-in for mplsoccer's Sbopen that serves StatsBomb JSON files from a local folder.
+        The folder uses the layout of the StatsBomb open-data repository (matches/, events/, lineups/).
+        latency adds a delay in seconds to each request and failures lets the first n requests of each
+        match raise a ConnectionError, which allows to exercise the fetch pipeline without network. '''
+
+    def __init__(self, folder, latency=0.0, failures=0):
+        self.folder = folder
+        self.latency = latency
+        self.failures = failures
+        self.requests = defaultdict(int)
+        self.parser = Sblocal()
+
+    def _request(self, key):
+        time.sleep(self.latency)
+        self.requests[key] += 1
+        if self.requests[key] <= self.failures:
+            raise ConnectionError(f"Simulated connection error for {key}")
+
+    def event(self, match_id):
+        self._request(('event', match_id))
+        return self.parser.event(os.path.join(self.folder, 'events', f'{match_id}.json'))
+
+    def lineup(self, match_id):
+        self._request(('lineup', match_id))
+        return self.parser.lineup(os.path.join(self.folder, 'lineups', f'{match_id}.json'))
+
+    def match(self, competition_id, season_id):
+        self._request(('match', competition_id, season_id))
+        return self.parser.match(os.path.join(self.folder, 'matches', str(competition_id), f'{season_id}.json'))
+
+    def competition(self):
+        self._request(('competition',))
+        return self.parser.competition(os.path.join(self.folder, 'competitions.json'))
@@ -0,0 +1,125 @@
+import json
+import os.path
+import os
+import pandas as pd
+import event_fetcher as ef
+import event_store as es
+
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def read_manifest(folder):
+    ''' Returns the manifest of the cached matches as a dict keyed by match_id. '''
+    file = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.isfile(file):
+        return {}
+    with open(file, encoding='utf-8') as f:
+        return {int(match_id): entry for match_id, entry in json.load(f).items()}
+
+
+def write_manifest(folder, manifest):
+    file = os.path.join(folder, MANIFEST_FILE)
+    def write(tmp_file):
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({str(match_id): entry for match_id, entry in sorted(manifest.items())}, f, indent=2)
+    es.replace_file(file, write)
+
+
+def get_stale_matches(df_season, manifest):
+    ''' Returns the ids of the matches that are not in the manifest or were updated by StatsBomb since they
+        were fetched. '''
+    stale = []
+    for match_id, last_updated in zip(df_season['match_id'], df_season['last_updated'].astype(str)):
+        entry = manifest.get(int(match_id))
+        if entry is None or entry['last_updated'] != last_updated:
+            stale.append(int(match_id))
+    return stale
+
+
+def refresh_matches(parser, competition_id, season_id, folder='./data/matches'):
+    ''' Diffs the matches of the season against the manifest and fetches only the missing or updated matches.
+        Returns the matches of the season and the ids of the matches that were fetched. '''
+    df_season = parser.match(competition_id=competition_id, season_id=season_id)
+    if 'match_status' in df_season.columns:
+        df_season = df_season[df_season['match_status'] == 'available']
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    manifest = read_manifest(folder)
+    stale = get_stale_matches(df_season, manifest)
+
+    # matches that were updated since they were fetched are removed so that they are fetched again
+    for match_id in stale:
+        for file in ef.get_match_files(folder, match_id):
+            if match_id in manifest and os.path.isfile(file):
+                os.remove(file)
+
+    ef.fetch_events(parser, stale, folder)
+
+    df_stale = df_season[df_season['match_id'].isin(stale)]
+    for match in df_stale.itertuples():
+        manifest[int(match.match_id)] = {'competition_id': competition_id, 'season_id': season_id,
+                                         'last_updated': str(match.last_updated),
+                                         'match_date': str(pd.Timestamp(match.match_date).date()),
+                                         'match_week': int(match.match_week),
+                                         'home_team_name': match.home_team_name,
+                                         'away_team_name': match.away_team_name,
+                                         'home_score': int(match.home_score), 'away_score': int(match.away_score)}
+    write_manifest(folder, manifest)
+    return df_season, stale
+
+
+def read_related_events(match_ids, folder='./data/matches'):
+    ''' Returns the related events of the cached matches. Matches that were cached without them are skipped. '''
+    files = [ef.get_related_file(folder, match_id) for match_id in match_ids]
+    frames = [es.read_events(file) for file in files if os.path.isfile(file)]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=['match_id', 'id', 'index', 'type_name', 'id_related', 'index_related',
+                                     'type_name_related'])
+    return es.apply_schema(pd.concat(frames, ignore_index=True))
+
+
+def read_freeze_frames(match_ids, folder='./data/matches'):
+    ''' Returns the shot freeze frames of the cached matches. Matches that were cached without them are skipped. '''
+    files = [ef.get_freeze_file(folder, match_id) for match_id in match_ids]
+    frames = [es.read_events(file) for file in files if os.path.isfile(file)]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=['teammate', 'match_id', 'id', 'x', 'y', 'player_id', 'player_name',
+                                     'position_id', 'position_name', 'event_freeze_id'])
+    return es.apply_schema(pd.concat(frames, ignore_index=True))
+
+
+def get_season_matches(competition_id, season_id, folder='./data/matches'):
+    ''' Returns the cached matches of the season from the manifest, without touching the network. '''
+    manifest = read_manifest(folder)
+    matches = [dict(entry, match_id=match_id) for match_id, entry in manifest.items()
+               if entry['competition_id'] == competition_id and entry['season_id'] == season_id]
+    df_matches = pd.DataFrame(matches, columns=['match_id', 'match_date', 'match_week', 'home_team_name',
+                                                'away_team_name', 'home_score', 'away_score'])
+    return df_matches.sort_values(['match_date', 'match_id'], ignore_index=True)
+
+
+def get_match_calendar(df_matches):
+    ''' Returns the calendar of the matches with one row per team and match, indexed by (team_name, match_id):
+        the match number of the team (its matches numbered by date), StatsBomb's match week and date, whether the
+        team played at home, the opponent and the score. df_matches is a match list such as parser.match or
+        get_season_matches. '''
+    columns = ['match_id', 'match_date', 'match_week']
+    df_home = df_matches[columns].assign(team_name=df_matches['home_team_name'], home=True,
+                                         opponent_name=df_matches['away_team_name'],
+                                         goals_for=df_matches['home_score'], goals_against=df_matches['away_score'])
+    df_away = df_matches[columns].assign(team_name=df_matches['away_team_name'], home=False,
+                                         opponent_name=df_matches['home_team_name'],
+                                         goals_for=df_matches['away_score'], goals_against=df_matches['home_score'])
+    df_calendar = pd.concat([df_home, df_away], ignore_index=True)
+    df_calendar['match_date'] = pd.to_datetime(df_calendar['match_date'])
+    df_calendar['team_name'] = df_calendar['team_name'].astype(str)
+    df_calendar = df_calendar.sort_values(['team_name', 'match_date', 'match_id'], ignore_index=True)
+    df_calendar.insert(0, 'match_number', df_calendar.groupby('team_name').cumcount() + 1)
+    return df_calendar.set_index(['team_name', 'match_id'])
+
+
+def get_season_calendar(competition_id, season_id, folder='./data/matches'):
+    ''' Returns the calendar of the cached matches of the season, see get_match_calendar. '''
+    return get_match_calendar(get_season_matches(competition_id, season_id, folder))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+
+def get_row_ranges(match_ids):
+    ''' Returns a DataFrame indexed by match_id with the start and stop row of each match in a frame that is
+        sorted by match_id. '''
+    match_ids = np.asarray(match_ids)
+    if len(match_ids) == 0:
+        return pd.DataFrame({'start': [], 'stop': []}, dtype=np.int64, index=pd.Index(match_ids, name='match_id'))
+    starts = np.flatnonzero(np.r_[True, match_ids[1:] != match_ids[:-1]])
+    stops = np.r_[starts[1:], len(match_ids)]
+    return pd.DataFrame({'start': starts, 'stop': stops}, index=pd.Index(match_ids[starts], name='match_id'))
+
+
+# The columns of the events the index and the lineups are computed from
+LINEUP_COLUMNS = ['match_id', 'index', 'player_id', 'player_name', 'team_name', 'position_id', 'type_name',
+                  'substitution_replacement_id', 'minute']
+
+
+def get_lineups(df_events):
+    ''' Returns the players that took part in each match with their team, first position and the minutes they
+        were subbed on/off, computed for all matches with grouped operations. The first position is the position
+        of the player's first event, i.e. the position they started in. '''
+    df_players = (df_events[['match_id', 'index', 'player_id', 'player_name', 'team_name', 'position_id']]
+                  .dropna(subset=['player_id'])
+                  .sort_values(['match_id', 'index'], kind='stable'))
+    df_players = df_players.groupby(['match_id', 'player_id'], as_index=False, observed=True).agg(
+        player_name=('player_name', 'first'), team_name=('team_name', 'first'), position_id=('position_id', 'first'))
+
+    df_subs = df_events.loc[df_events['type_name'] == 'Substitution',
+                            ['match_id', 'player_id', 'substitution_replacement_id', 'minute']]
+    time_off = df_subs[['match_id', 'player_id', 'minute']].rename(columns={'minute': 'off'})
+    time_on = df_subs[['match_id', 'substitution_replacement_id', 'minute']].rename(
+        columns={'substitution_replacement_id': 'player_id', 'minute': 'on'})
+    df_players = df_players.merge(time_on, on=['match_id', 'player_id'], how='left')
+    df_players = df_players.merge(time_off, on=['match_id', 'player_id'], how='left')
+    df_players['team_name'] = df_players['team_name'].astype(str)
+    df_players['start'] = df_players['on'].isnull()
+    return df_players.sort_values('match_id', kind='stable', ignore_index=True)
+
+
+class MatchIndex:
+    ''' Index over the events of a season that maps each match_id to its event row range and lineup.
+        The events are sorted once by match, so looking up a match is a slice instead of a boolean filter. '''
+
+    def __init__(self, df_events, df_matches):
+        self.df_events = df_events.sort_values(['match_id', 'index'], kind='stable', ignore_index=True)
+        self.df_lineups = get_lineups(self.df_events)
+        self.event_ranges = get_row_ranges(self.df_events['match_id'].to_numpy())
+        self.lineup_ranges = get_row_ranges(self.df_lineups['match_id'].to_numpy())
+        self.matches = df_matches[df_matches['match_id'].isin(self.event_ranges.index)].reset_index(drop=True)
+
+    def events(self, match_id):
+        start, stop = self.event_ranges.loc[match_id]
+        return self.df_events.iloc[start:stop]
+
+    def lineup(self, match_id):
+        start, stop = self.lineup_ranges.loc[match_id]
+        return self.df_lineups.iloc[start:stop]
+
+    def team_matches(self, team_name):
+        mask = (self.matches['home_team_name'] == team_name) | (self.matches['away_team_name'] == team_name)
+        return self.matches[mask]
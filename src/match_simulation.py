@@ -0,0 +1,181 @@
+''' Monte Carlo simulation of matches and league tables from the xG of the shots. Every shot is a Bernoulli trial
+    with its xG as probability. A batch of iterations is simulated at once: one random number per shot and
+    iteration, the goals of each team in each match are the differences of the cumulative sums at the match
+    boundaries and the league tables of all iterations of the batch are ranked together. The counts of the
+    batches (and of the shards of a process pool) are simply added up. '''
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+# Scorelines above this number of goals per team are counted as this number of goals
+MAX_GOALS = 10
+
+# The columns of the events the shots are taken from
+SHOT_COLUMNS = ['match_id', 'team_name', 'type_name', 'period', 'shot_statsbomb_xg']
+
+# Random numbers drawn per batch, bounds the memory of a batch to a few ten MB
+BATCH_ELEMENTS = 4_000_000
+
+# The shots of the season as flat arrays, sorted by match and team: the shots of side 0 (home) or 1 (away) of
+# match m are xg[bounds[2 * m + side]:bounds[2 * m + side + 1]]
+SeasonShots = namedtuple('SeasonShots', ['xg', 'bounds', 'df_matches', 'teams', 'home', 'away'])
+
+# The counts of a number of iterations: scorelines[m, h, a] and positions[t, p] count how often match m ended
+# h:a (capped at MAX_GOALS) and team t finished at position p (0 is first), home_wins and draws count the outcomes
+# of the matches, the goals and points are sums over the iterations
+SimulationCounts = namedtuple('SimulationCounts', ['iterations', 'scorelines', 'home_wins', 'draws', 'home_goals',
+                                                   'away_goals', 'positions', 'points', 'goals_for',
+                                                   'goals_against'])
+
+# The results: one row per match, one row per team and the probability of every team for every position
+SimulationResult = namedtuple('SimulationResult', ['matches', 'table', 'positions', 'iterations'])
+
+
+def get_season_shots(df_events, df_matches):
+    ''' Returns the shots of the matches as SeasonShots. Shots of penalty shootouts (period 5) are left out,
+        matches without any events are not simulated. '''
+    df_matches = df_matches[df_matches['match_id'].isin(df_events['match_id'].unique())].reset_index(drop=True)
+    teams = sorted(set(df_matches['home_team_name']) | set(df_matches['away_team_name']))
+    team_codes = {team_name: code for code, team_name in enumerate(teams)}
+
+    df_shots = df_events.loc[(df_events['type_name'] == 'Shot') & (df_events['period'] != 5),
+                             ['match_id', 'team_name', 'shot_statsbomb_xg']]
+    match_positions = pd.Series(np.arange(len(df_matches)), index=df_matches['match_id'])
+    position = match_positions.reindex(df_shots['match_id']).to_numpy()
+    home = df_matches['home_team_name'].to_numpy(dtype=object)[np.nan_to_num(position, nan=0).astype(int)]
+    keep = ~np.isnan(position)
+    side = (df_shots['team_name'].to_numpy(dtype=object) != home).astype(int)
+    group = (position[keep] * 2 + side[keep]).astype(int)
+
+    order = np.argsort(group, kind='stable')
+    xg = df_shots['shot_statsbomb_xg'].to_numpy(dtype=np.float64, na_value=0.0)[keep][order]
+    bounds = np.searchsorted(group[order], np.arange(2 * len(df_matches) + 1))
+    return SeasonShots(xg.astype(np.float32), bounds, df_matches, teams,
+                       df_matches['home_team_name'].map(team_codes).to_numpy(),
+                       df_matches['away_team_name'].map(team_codes).to_numpy())
+
+
+def get_points(goals, goals_against):
+    return np.where(goals > goals_against, 3, np.where(goals == goals_against, 1, 0))
+
+
+def simulate_batch(shots, iterations, rng):
+    ''' Returns the goals of both teams of every match in every iteration as arrays of shape
+        (iterations, matches). '''
+    scored = rng.random((iterations, len(shots.xg)), dtype=np.float32) < shots.xg
+    cumulative = np.zeros((iterations, len(shots.xg) + 1), dtype=np.int32)
+    np.cumsum(scored, axis=1, out=cumulative[:, 1:])
+    # the home shots of a match end where its away shots start
+    home_goals = cumulative[:, shots.bounds[1::2]] - cumulative[:, shots.bounds[:-1:2]]
+    away_goals = cumulative[:, shots.bounds[2::2]] - cumulative[:, shots.bounds[1::2]]
+    return home_goals, away_goals
+
+
+def count_iterations(shots, iterations, seed=None, batch_size=None):
+    ''' Simulates the given number of iterations of the season and returns their SimulationCounts. '''
+    rng = np.random.default_rng(seed)
+    n_matches, n_teams = len(shots.df_matches), len(shots.teams)
+    batch_size = batch_size or max(1, BATCH_ELEMENTS // max(len(shots.xg), 1))
+
+    scorelines = np.zeros(n_matches * (MAX_GOALS + 1) ** 2, dtype=np.int64)
+    home_wins, draws = np.zeros(n_matches, dtype=np.int64), np.zeros(n_matches, dtype=np.int64)
+    match_home_goals, match_away_goals = np.zeros(n_matches, dtype=np.int64), np.zeros(n_matches, dtype=np.int64)
+    positions = np.zeros(n_teams * n_teams, dtype=np.int64)
+    points, goals_for, goals_against = np.zeros(n_teams), np.zeros(n_teams), np.zeros(n_teams)
+    # incidence matrices of shape (matches, teams) to sum the values of the matches per team
+    home = np.zeros((n_matches, n_teams))
+    home[np.arange(n_matches), shots.home] = 1
+    away = np.zeros((n_matches, n_teams))
+    away[np.arange(n_matches), shots.away] = 1
+
+    done = 0
+    while done < iterations:
+        size = min(batch_size, iterations - done)
+        home_goals, away_goals = simulate_batch(shots, size, rng)
+        match_codes = np.arange(n_matches) * (MAX_GOALS + 1) ** 2 + \
+            np.minimum(home_goals, MAX_GOALS) * (MAX_GOALS + 1) + np.minimum(away_goals, MAX_GOALS)
+        scorelines += np.bincount(match_codes.ravel(), minlength=len(scorelines))
+        home_wins += (home_goals > away_goals).sum(axis=0)
+        draws += (home_goals == away_goals).sum(axis=0)
+        match_home_goals += home_goals.sum(axis=0)
+        match_away_goals += away_goals.sum(axis=0)
+
+        team_points = get_points(home_goals, away_goals) @ home + get_points(away_goals, home_goals) @ away
+        team_goals_for = home_goals @ home + away_goals @ away
+        team_goals_against = away_goals @ home + home_goals @ away
+        points += team_points.sum(axis=0)
+        goals_for += team_goals_for.sum(axis=0)
+        goals_against += team_goals_against.sum(axis=0)
+
+        # the table is ranked by points, goal difference and goals scored, remaining ties are broken at random
+        score = team_points * 1e6 + (team_goals_for - team_goals_against + 1000) * 1e2 + \
+            np.minimum(team_goals_for, 99) + rng.random(team_points.shape)
+        ranks = np.argsort(np.argsort(-score, axis=1), axis=1)
+        positions += np.bincount((np.arange(n_teams) * n_teams + ranks).ravel(), minlength=len(positions))
+        done += size
+
+    return SimulationCounts(iterations, scorelines.reshape(n_matches, MAX_GOALS + 1, MAX_GOALS + 1), home_wins,
+                            draws, match_home_goals, match_away_goals, positions.reshape(n_teams, n_teams), points,
+                            goals_for, goals_against)
+
+
+def merge_counts(counts):
+    ''' Adds up the SimulationCounts of several shards. '''
+    return SimulationCounts(*[sum(values) for values in zip(*counts)])
+
+
+def get_result(shots, counts, relegation_places=1):
+    ''' Returns the SimulationResult of the counts. '''
+    iterations = counts.iterations
+    most_likely = counts.scorelines.reshape(len(counts.scorelines), -1).argmax(axis=1)
+
+    df_matches = shots.df_matches[['match_id', 'match_date', 'home_team_name', 'away_team_name', 'home_score',
+                                   'away_score']].copy()
+    df_matches['home_xg'] = [shots.xg[start:stop].sum() for start, stop in zip(shots.bounds[:-1:2],
+                                                                                shots.bounds[1::2])]
+    df_matches['away_xg'] = [shots.xg[start:stop].sum() for start, stop in zip(shots.bounds[1::2],
+                                                                                shots.bounds[2::2])]
+    df_matches['home_win'] = counts.home_wins / iterations
+    df_matches['draw'] = counts.draws / iterations
+    df_matches['away_win'] = 1 - df_matches['home_win'] - df_matches['draw']
+    df_matches['most_likely_score'] = [f'{h}-{a}' for h, a in zip(most_likely // (MAX_GOALS + 1),
+                                                                   most_likely % (MAX_GOALS + 1))]
+    df_matches['expected_home_goals'] = counts.home_goals / iterations
+    df_matches['expected_away_goals'] = counts.away_goals / iterations
+
+    positions = pd.DataFrame(counts.positions / iterations, index=pd.Index(shots.teams, name='team_name'),
+                             columns=np.arange(1, len(shots.teams) + 1))
+    df_table = pd.DataFrame({
+        'xPts': counts.points / iterations,
+        'xGF': counts.goals_for / iterations,
+        'xGA': counts.goals_against / iterations,
+        'AvgPosition': (positions * positions.columns).sum(axis=1).to_numpy(),
+        'Title': positions[1].to_numpy(),
+        'Relegation': positions.iloc[:, len(shots.teams) - relegation_places:].sum(axis=1).to_numpy(),
+    }, index=positions.index)
+    # the points the teams actually got in the simulated matches
+    home_points = get_points(df_matches['home_score'], df_matches['away_score'])
+    away_points = get_points(df_matches['away_score'], df_matches['home_score'])
+    df_table.insert(0, 'Pts', pd.concat([pd.Series(home_points, index=df_matches['home_team_name']),
+                                         pd.Series(away_points, index=df_matches['away_team_name'])])
+                    .groupby(level=0).sum().reindex(df_table.index, fill_value=0))
+    df_table = df_table.sort_values(['xPts', 'Title'], ascending=False)
+    return SimulationResult(df_matches, df_table, positions.loc[df_table.index], iterations)
+
+
+def simulate_season(df_events, df_matches, iterations=100_000, seed=0, processes=None, relegation_places=1):
+    ''' Simulates the season iterations times from the shots of the events and returns the SimulationResult.
+        df_matches has one row per match with the teams and the score, e.g. MatchIndex.matches. With processes
+        the iterations are split into shards that are simulated in a process pool, every shard with its own
+        independent random stream, so the result only depends on the seed and the number of shards. '''
+    shots = get_season_shots(df_events, df_matches)
+    if processes is None or processes <= 1:
+        counts = count_iterations(shots, iterations, np.random.SeedSequence(seed))
+    else:
+        sizes = [len(shard) for shard in np.array_split(np.arange(iterations), processes)]
+        seeds = np.random.SeedSequence(seed).spawn(processes)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            counts = merge_counts(executor.map(count_iterations, [shots] * processes, sizes, seeds))
+    return get_result(shots, counts, relegation_places)
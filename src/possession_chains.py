@@ -0,0 +1,178 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+
+# The pass network of the teams of one or more matches: nodes has one row per (match_id, team_name, player_id)
+# with the average location and number of passes of the player, edges one row per (match_id, team_name,
+# player_id, recipient_id) with the number of completed passes between the two players.
+PassNetwork = namedtuple('PassNetwork', ['nodes', 'edges'])
+
+RECEIPT_TYPES = ['Ball Receipt', 'Ball Receipt*']
+
+# The columns of the events the pass networks and the xG attribution are computed from
+PASS_NETWORK_COLUMNS = ['match_id', 'team_name', 'player_id', 'player_name', 'type_name', 'outcome_name',
+                        'sub_type_name', 'pass_recipient_id', 'x', 'y']
+XG_CHAIN_COLUMNS = ['match_id', 'index', 'id', 'possession', 'possession_team_name', 'team_name', 'player_id',
+                    'player_name', 'type_name', 'outcome_name', 'shot_statsbomb_xg', 'pass_assisted_shot_id', 'x',
+                    'duration']
+
+
+def get_event_keys(match_ids, indices):
+    ''' Returns a single int64 key per (match_id, index) pair, which allows fast lookups with np.isin. '''
+    return np.asarray(match_ids, dtype=np.int64) * 2 ** 24 + np.asarray(indices, dtype=np.int64)
+
+
+def get_in_possession(df_events):
+    ''' Returns a mask of the events of the team in possession. '''
+    return df_events['team_name'].to_numpy(dtype=object) == df_events['possession_team_name'].to_numpy(dtype=object)
+
+
+def sort_events(df_events):
+    if df_events[['match_id', 'index']].apply(lambda column: column.is_monotonic_increasing).all():
+        return df_events
+    return df_events.sort_values(['match_id', 'index'], kind='stable', ignore_index=True)
+
+
+####################################################################################
+# POSSESSION CHAINS
+####################################################################################
+
+
+def get_chain_ids(df_events):
+    ''' Returns the chain number of each event. A chain is a StatsBomb possession, so the events of a match
+        with the same possession number belong to the same chain. '''
+    return df_events.groupby(['match_id', 'possession'], sort=False).ngroup().to_numpy()
+
+
+def get_chains(df_events):
+    ''' Returns one row per possession chain of all matches with its team, length, start and end location,
+        shots, xG and goals. The events must be sorted by match and index (as in MatchIndex.df_events). '''
+    df_events = sort_events(df_events)
+    own = get_in_possession(df_events)
+    is_shot = own & (df_events['type_name'] == 'Shot').to_numpy()
+    xg = np.where(is_shot, df_events['shot_statsbomb_xg'].to_numpy(dtype=np.float64, na_value=np.nan), 0.0)
+    # the start and end location are the first and last location of an event of the team in possession
+    x = np.where(own, df_events['x'].to_numpy(dtype=np.float64, na_value=np.nan), np.nan)
+
+    df = pd.DataFrame({
+        'chain_id': get_chain_ids(df_events),
+        'match_id': df_events['match_id'].to_numpy(),
+        'possession': df_events['possession'].to_numpy(),
+        'team_name': df_events['possession_team_name'].to_numpy(dtype=object),
+        'index': df_events['index'].to_numpy(),
+        'x': x,
+        'duration': df_events['duration'].to_numpy(dtype=np.float64, na_value=np.nan),
+        'passes': own & (df_events['type_name'] == 'Pass').to_numpy(),
+        'shots': is_shot,
+        'xg': np.nan_to_num(xg),
+        'goals': is_shot & (df_events['outcome_name'] == 'Goal').to_numpy(),
+    })
+    df_chains = df.groupby('chain_id', sort=True).agg(
+        match_id=('match_id', 'first'), possession=('possession', 'first'), team_name=('team_name', 'first'),
+        start_index=('index', 'min'), end_index=('index', 'max'), events=('index', 'size'),
+        start_x=('x', 'first'), end_x=('x', 'last'), duration=('duration', 'sum'),
+        passes=('passes', 'sum'), shots=('shots', 'sum'), xg=('xg', 'sum'), goals=('goals', 'sum'))
+    return df_chains
+
+
+####################################################################################
+# XG ATTRIBUTION
+####################################################################################
+
+
+def get_shot_assists(df_events, df_related=None):
+    ''' Returns the key passes with the shot they assisted: one row per (match_id, pass index) with the shot
+        index and its xG. The links are taken from the related events if given, otherwise from the
+        pass_assisted_shot_id column. '''
+    shots = df_events.loc[df_events['type_name'] == 'Shot', ['match_id', 'index', 'shot_statsbomb_xg']]
+    if df_related is not None and len(df_related) > 0:
+        links = df_related.loc[(df_related['type_name'] == 'Pass') & (df_related['type_name_related'] == 'Shot'),
+                               ['match_id', 'index', 'index_related']]
+    elif 'pass_assisted_shot_id' in df_events.columns:
+        passes = df_events.loc[df_events['pass_assisted_shot_id'].notnull(),
+                               ['match_id', 'index', 'pass_assisted_shot_id']]
+        links = passes.merge(df_events[['match_id', 'id', 'index']], left_on=['match_id', 'pass_assisted_shot_id'],
+                             right_on=['match_id', 'id'], suffixes=('', '_related'))[['match_id', 'index',
+                                                                                    'index_related']]
+    else:
+        links = pd.DataFrame(columns=['match_id', 'index', 'index_related'])
+    links = links.astype({'match_id': np.int64, 'index': np.int64, 'index_related': np.int64})
+    shots = shots.astype({'match_id': np.int64, 'index': np.int64})
+    df = links.merge(shots.rename(columns={'index': 'index_related', 'shot_statsbomb_xg': 'xg'}),
+                     on=['match_id', 'index_related'])
+    return df.drop_duplicates(['match_id', 'index'])
+
+
+def get_player_xg_chain(df_events, df_related=None):
+    ''' Returns per player the xG of the chains they were involved in (xGChain), the same without the shots and
+        key passes of the player (xGBuildup) and the xG of the shots they assisted (xGAssisted). A player is
+        involved in a chain if they have an event for the team in possession. '''
+    df_events = sort_events(df_events)
+    df_chains = get_chains(df_events)
+    df_assists = get_shot_assists(df_events, df_related)
+
+    own = get_in_possession(df_events)
+    is_key_pass = np.isin(get_event_keys(df_events['match_id'], df_events['index']),
+                          get_event_keys(df_assists['match_id'], df_assists['index']))
+    rows = own & df_events['player_id'].notnull().to_numpy()
+    df = pd.DataFrame({
+        'chain_id': get_chain_ids(df_events)[rows],
+        'player_id': df_events['player_id'].to_numpy()[rows],
+        'player_name': df_events['player_name'].to_numpy(dtype=object)[rows],
+        'team_name': df_events['team_name'].to_numpy(dtype=object)[rows],
+        'shot_or_key_pass': ((df_events['type_name'] == 'Shot').to_numpy() | is_key_pass)[rows],
+    })
+
+    # one row per player and chain
+    df = df.groupby(['chain_id', 'player_id'], sort=False).agg(
+        player_name=('player_name', 'first'), team_name=('team_name', 'first'),
+        shot_or_key_pass=('shot_or_key_pass', 'any')).reset_index()
+    df['xg'] = df_chains['xg'].to_numpy()[df['chain_id'].to_numpy()]
+    df['buildup_xg'] = np.where(df['shot_or_key_pass'], 0.0, df['xg'])
+
+    df_players = df.groupby('player_id').agg(player_name=('player_name', 'first'), team_name=('team_name', 'first'),
+                                             chains=('chain_id', 'size'), xGChain=('xg', 'sum'),
+                                             xGBuildup=('buildup_xg', 'sum'))
+    passer = df_assists.merge(df_events[['match_id', 'index', 'player_id']].astype({'match_id': np.int64,
+                                                                                     'index': np.int64}),
+                              on=['match_id', 'index'])
+    df_players['xGAssisted'] = passer.groupby('player_id')['xg'].sum().reindex(df_players.index, fill_value=0.0)
+    return df_players.sort_values('xGChain', ascending=False)
+
+
+####################################################################################
+# PASS NETWORKS
+####################################################################################
+
+
+def get_pass_networks(df_events, exclude_sub_types=('Throw-in', 'Corner', 'Free Kick', 'Kick Off', 'Goal Kick')):
+    ''' Returns the pass networks of every team of every match in the events. The edges count the completed
+        passes between two players (set pieces excluded) and the nodes are placed at the average location of
+        the player's passes and ball receipts. '''
+    is_pass = (df_events['type_name'] == 'Pass').to_numpy()
+    completed = is_pass & df_events['outcome_name'].isnull().to_numpy() & \
+        df_events['pass_recipient_id'].notnull().to_numpy() & \
+        ~df_events['sub_type_name'].isin(exclude_sub_types).to_numpy()
+    columns = ['match_id', 'team_name', 'player_id']
+
+    df_passes = df_events.loc[completed, columns + ['pass_recipient_id']]
+    edges = (df_passes.groupby(columns + ['pass_recipient_id'], observed=True, sort=False).size()
+             .rename('passes').reset_index().rename(columns={'pass_recipient_id': 'recipient_id'}))
+
+    is_receipt = df_events['type_name'].isin(RECEIPT_TYPES).to_numpy()
+    df_touches = df_events.loc[completed | is_receipt, columns + ['player_name', 'x', 'y']].assign(
+        passes=completed[completed | is_receipt])
+    nodes = df_touches.groupby(columns, observed=True, sort=False).agg(
+        player_name=('player_name', 'first'), x=('x', 'mean'), y=('y', 'mean'), passes=('passes', 'sum'))
+    nodes = nodes.reset_index()
+    for df in (nodes, edges):
+        df['team_name'] = df['team_name'].astype(str)
+    return PassNetwork(nodes, edges)
+
+
+def select_network(networks, match_id, team_name):
+    ''' Returns the pass network of one team in one match. '''
+    nodes = networks.nodes[(networks.nodes['match_id'] == match_id) & (networks.nodes['team_name'] == team_name)]
+    edges = networks.edges[(networks.edges['match_id'] == match_id) & (networks.edges['team_name'] == team_name)]
+    return PassNetwork(nodes.reset_index(drop=True), edges.reset_index(drop=True))
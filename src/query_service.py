@@ -0,0 +1,290 @@
+''' Local HTTP service that serves the aggregates of the dashboard as JSON from the shared data catalog, e.g.
+
+        GET /competitions/37/seasons/4/match-week-stats?team=Chelsea%20FCW&stat=ShotXG,GoalsScored
+
+    Every response carries an ETag derived from the data version and the request, so a client that sends it back
+    in If-None-Match gets a 304 without the response being built. Responses are cached per data version and
+    requests are served by a thread per connection.
+
+    Run from the src folder, e.g.: python query_service.py --port 8502 --refresh 4 '''
+import argparse
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlencode
+import pandas as pd
+import data_preparation as dp
+import match_cache as mc
+import spatial_bins as sb
+
+
+class RequestError(Exception):
+    ''' An error that is answered with the given HTTP status and message. '''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def get_param(params, name, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+
+def get_list_param(params, name):
+    ''' Returns the values of a parameter given as name=a,b or name=a&name=b, None if it is not given. '''
+    if name not in params:
+        return None
+    return [value for values in params[name] for value in values.split(',') if value != '']
+
+
+def get_int_param(params, name, default):
+    try:
+        return int(get_param(params, name, default))
+    except ValueError:
+        raise RequestError(400, f"{name} must be an integer")
+
+
+# Every window, grid and event type that is requested adds an entry to the catalog, which is kept and rebuilt
+# with every new data version, so the service only accepts a few of them
+WINDOWS = [3, 5, 10]
+GRIDS = ['positional_full', 'positional_horizontal', 'positional_vertical', 'uniform_6x4', 'uniform_12x8']
+
+
+def get_grid(name):
+    ''' Returns the grid of a name such as positional_full or uniform_6x4. '''
+    if name not in GRIDS:
+        raise RequestError(400, f"Unknown grid '{name}', use {', '.join(GRIDS)}")
+    if name.startswith('positional_'):
+        return sb.positional_grid(name.split('_')[1])
+    nx, ny = re.fullmatch(r'uniform_(\d+)x(\d+)', name).groups()
+    return sb.uniform_grid(int(nx), int(ny))
+
+
+def get_event_type(catalog, params, competition_id, season_id):
+    ''' Returns the type parameter, which must be the type_name of events of the season. '''
+    event_type = get_param(params, 'type', 'Pressure')
+    if event_type not in set(catalog.match_index(competition_id, season_id).df_events['type_name'].unique()):
+        raise RequestError(400, f"Unknown event type '{event_type}'")
+    return event_type
+
+
+def select_team(df, params):
+    ''' Returns the rows of the teams given by the team parameter, all rows if it is not given. '''
+    teams = get_list_param(params, 'team')
+    if teams is None:
+        return df
+    unknown = set(teams) - set(df.index.unique(level='team_name'))
+    if unknown:
+        raise RequestError(404, f"Unknown team(s): {', '.join(sorted(unknown))}")
+    return df[df.index.get_level_values('team_name').isin(teams)]
+
+
+####################################################################################
+# ENDPOINTS
+####################################################################################
+
+
+def get_variables(catalog, params):
+    return dp.get_variable_descriptions()
+
+
+def get_teams(catalog, params, competition_id, season_id):
+    df_matches = mc.get_season_matches(competition_id, season_id)
+    return sorted(set(df_matches['home_team_name']) | set(df_matches['away_team_name']))
+
+
+def get_calendar(catalog, params, competition_id, season_id):
+    return select_team(catalog.match_calendar(competition_id, season_id), params).reset_index()
+
+
+def get_match_week_stats(catalog, params, competition_id, season_id):
+    df = select_team(catalog.match_week_stats(competition_id, season_id), params)
+    stats = get_list_param(params, 'stat')
+    if stats is not None:
+        unknown = set(stats) - set(df.columns)
+        if unknown:
+            raise RequestError(400, f"Unknown stat(s): {', '.join(sorted(unknown))}")
+        df = df[stats]
+    return df.reset_index()
+
+
+def get_form(catalog, params, competition_id, season_id):
+    window = get_int_param(params, 'window', 5)
+    if window not in WINDOWS:
+        raise RequestError(400, f"window must be one of {', '.join(map(str, WINDOWS))}")
+    return select_team(catalog.rolling_form(competition_id, season_id, window).to_frame(), params).reset_index()
+
+
+def get_bins(catalog, params, competition_id, season_id):
+    ''' Returns the share of the events of the type per cell of the grid for every team, the heatmaps of the
+        dashboard use type=Pressure and grid=positional_full. '''
+    grid = get_grid(get_param(params, 'grid', 'positional_full'))
+    binned = catalog.spatial_bins(competition_id, season_id, get_event_type(catalog, params, competition_id,
+                                                                            season_id), grid)
+    df_cells = sb.get_cell_edges(grid)
+    df = pd.concat({team_name: df_cells.assign(value=statistic)
+                    for team_name, statistic in zip(binned.keys['team_name'].astype(str), binned.statistic)},
+                   names=['team_name', 'cell'])
+    return select_team(df, params).reset_index() if len(df) > 0 else df
+
+
+def get_simulation(catalog, params, competition_id, season_id):
+    return catalog.season_simulation(competition_id, season_id).table.reset_index()
+
+
+SEASON_PATH = r'/competitions/(?P<competition_id>\d+)/seasons/(?P<season_id>\d+)'
+
+ROUTES = [
+    (re.compile(r'/variables'), get_variables),
+    (re.compile(SEASON_PATH + r'/teams'), get_teams),
+    (re.compile(SEASON_PATH + r'/calendar'), get_calendar),
+    (re.compile(SEASON_PATH + r'/match-week-stats'), get_match_week_stats),
+    (re.compile(SEASON_PATH + r'/form'), get_form),
+    (re.compile(SEASON_PATH + r'/bins'), get_bins),
+    (re.compile(SEASON_PATH + r'/simulation'), get_simulation),
+]
+
+
+def to_json(data):
+    if isinstance(data, pd.DataFrame):
+        return data.to_json(orient='records', date_format='iso', double_precision=6)
+    return json.dumps(data)
+
+
+def build_response(catalog, path, params):
+    ''' Returns the JSON body of the request. '''
+    if path == '/version':
+        return json.dumps({'version': catalog.version})
+    for pattern, endpoint in ROUTES:
+        match = pattern.fullmatch(path)
+        if match is None:
+            continue
+        keys = {key: int(value) for key, value in match.groupdict().items()}
+        if 'season_id' in keys and len(mc.get_season_matches(keys['competition_id'], keys['season_id'])) == 0:
+            # the service never fetches, seasons are added by the refresh or the event_dataset script
+            raise RequestError(404, f"Season {keys['season_id']} of competition {keys['competition_id']} is "
+                                    f"not in the match cache")
+        return '{"version": %s, "data": %s}' % (json.dumps(catalog.version), to_json(endpoint(catalog, params,
+                                                                                            **keys)))
+    raise RequestError(404, f"Unknown path '{path}'")
+
+
+####################################################################################
+# SERVER
+####################################################################################
+
+
+class ResponseCache:
+    ''' The last max_size response bodies by (data version, request). '''
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._bodies:
+                self._bodies.move_to_end(key)
+            return self._bodies.get(key)
+
+    def put(self, key, body):
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_size:
+                self._bodies.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+def get_request_key(path, params):
+    ''' Returns the request with the parameters in a canonical order, so equal requests share their cache entry. '''
+    return path.rstrip('/') or '/', urlencode(sorted((name, value) for name, values in params.items()
+                                                     for value in values))
+
+
+def get_etag(version, request_key):
+    return '"%s"' % hashlib.sha1(f'{version} {request_key}'.encode('utf-8')).hexdigest()[:20]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # keep-alive, so a client can send many requests over one connection
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately, Nagle's algorithm would hold back the body until the client
+    # acknowledges the headers, which adds the delayed ACK time (~40ms) to every keep-alive request
+    disable_nagle_algorithm = True
+    quiet = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        request_key = get_request_key(url.path, parse_qs(url.query))
+        # the whole request uses the same version, even if a refresh swaps in a new one meanwhile
+        catalog = dp.shared.get()
+        etag = get_etag(catalog.version, request_key)
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            return self.send_body(304, b'', etag)
+
+        body = response_cache.get((catalog.version, request_key))
+        if body is None:
+            try:
+                body = build_response(catalog, request_key[0], parse_qs(request_key[1])).encode('utf-8')
+            except RequestError as e:
+                return self.send_body(e.status, json.dumps({'error': str(e)}).encode('utf-8'))
+            except Exception as e:
+                self.log_error('Failed to answer %s: %r', self.path, e)
+                return self.send_body(500, json.dumps({'error': 'Internal error'}).encode('utf-8'))
+            response_cache.put((catalog.version, request_key), body)
+        self.send_body(200, body, etag)
+
+    def send_body(self, status, body, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            # clients may keep the response but must revalidate it, as the data can change with every refresh
+            self.send_header('Cache-Control', 'no-cache')
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def serve(host='127.0.0.1', port=8502, quiet=True):
+    QueryHandler.quiet = quiet
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    print(f"Serving data version {dp.shared.get().version} on http://{host}:{server.server_port}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--competition', type=int, default=37)
+    parser.add_argument('--refresh', type=int, nargs='*', default=[], metavar='SEASON',
+                        help='seasons of the competition to refresh in the background')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    for season_id in args.refresh:
+        dp.shared.start_refresh(args.competition, season_id, [])
+    server = serve(args.host, args.port, quiet=not args.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
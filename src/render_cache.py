@@ -0,0 +1,110 @@
+import hashlib
+import io
+import json
+import os.path
+import os
+import pathlib
+import tempfile
+import urllib.request
+from functools import lru_cache
+import matplotlib.pyplot as plt
+from mplsoccer import FontManager
+import instrumentation as ins
+
+
+render_cache_folder = './data/render_cache'
+font_folder = './data/fonts'
+
+# The rendered figures are evicted (least recently used first) once the cache grows beyond this size
+render_cache_max_bytes = 256 * 1024 * 1024
+
+
+####################################################################################
+# RENDER CACHE
+####################################################################################
+
+
+def get_render_key(name, version, params):
+    ''' Returns the cache key of a figure, computed from the figure name, the dataset version and the plot
+        parameters. '''
+    content = json.dumps([name, version, params], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def evict(folder=render_cache_folder, max_bytes=render_cache_max_bytes):
+    ''' Removes the least recently used figures until the cache is within the size limit. '''
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def write_file(file, content):
+    ''' Writes the bytes to a temporary file of its own and then replaces the file at once, so sessions that
+        write the same file at the same time never clobber each other's temporary file. '''
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(file), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_file, file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def get_or_render(name, version, params, create_fig, fmt='png', folder=render_cache_folder,
+                  max_bytes=render_cache_max_bytes):
+    ''' Returns the rendered figure as png/svg bytes. The figure is only created with create_fig if it is not
+        in the cache yet, otherwise the cached file is read. '''
+    os.makedirs(folder, exist_ok=True)
+    file = os.path.join(folder, f'{get_render_key(name, version, params)}.{fmt}')
+    if os.path.isfile(file):
+        try:
+            with open(file, 'rb') as f:
+                content = f.read()
+            # mark the figure as recently used
+            os.utime(file)
+            ins.count('render_cache.hit')
+            return content
+        except FileNotFoundError:
+            # evicted by another session in the meantime
+            pass
+
+    ins.count('render_cache.miss')
+    with ins.span(f'render {name}'):
+        fig = create_fig()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, bbox_inches='tight', dpi=200)
+        plt.close(fig)
+    content = buffer.getvalue()
+
+    write_file(file, content)
+    evict(folder, max_bytes)
+    return content
+
+
+####################################################################################
+# FONTS
+####################################################################################
+
+
+@lru_cache(maxsize=None)
+def get_font(url, folder=font_folder):
+    ''' Returns a mplsoccer FontManager for the font url. The font file is downloaded once and then loaded from
+        the local folder. '''
+    os.makedirs(folder, exist_ok=True)
+    file = os.path.join(folder, url.split('/')[-1].split('?')[0])
+    if not os.path.isfile(file):
+        with urllib.request.urlopen(url) as response:
+            write_file(file, response.read())
+    return FontManager(pathlib.Path(file).absolute().as_uri())
@@ -0,0 +1,97 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+# The values of a team in one match, in the order they are stored in the form state
+MATCH_VALUES = ['GoalsFor', 'GoalsAgainst', 'ShotsFor', 'ShotsAgainst', 'XGFor', 'XGAgainst', 'Points']
+
+# The columns of the statistics of data_preparation.FORM_STATS the match values are taken from
+STAT_COLUMNS = {'GoalsFor': 'GoalsScored', 'GoalsAgainst': 'GoalsConceded', 'ShotsFor': 'Shots',
+                'ShotsAgainst': 'ShotsAgainst', 'XGFor': 'ShotXG', 'XGAgainst': 'ShotXGAgainst'}
+
+FORM_METRICS = ['RollingXGFor', 'RollingXGAgainst', 'RollingGoalsFor', 'RollingGoalsAgainst', 'RollingGoalDiff',
+                'RollingShots', 'RollingShotQuality', 'FormEWM', 'XGDiffEWM']
+
+
+class TeamForm:
+    ''' The form state of one team: the values of the last window matches with their running sums and the
+        exponentially weighted averages of all matches. Adding a match adds its values and subtracts the values of
+        the match that leaves the window, so an update takes constant time however long the season is. '''
+
+    def __init__(self, window=5, alpha=0.3):
+        self.window = window
+        self.alpha = alpha
+        self.matches = deque()
+        self.sums = np.zeros(len(MATCH_VALUES))
+        self.ewm = None
+        self.match_week = None
+
+    def update(self, values, match_week):
+        ''' Adds the values of the match, match_week is the match number of the team in the match calendar. '''
+        values = np.asarray(values, dtype=np.float64)
+        self.matches.append(values)
+        self.sums += values
+        if len(self.matches) > self.window:
+            self.sums -= self.matches.popleft()
+        # same as pandas' ewm(alpha=alpha, adjust=False)
+        self.ewm = values.copy() if self.ewm is None else self.alpha * values + (1 - self.alpha) * self.ewm
+        self.match_week = match_week
+        return self.metrics()
+
+    def metrics(self):
+        ''' Returns the form metrics after the last match. '''
+        mean = dict(zip(MATCH_VALUES, self.sums / len(self.matches)))
+        ewm = dict(zip(MATCH_VALUES, self.ewm))
+        shots = mean['ShotsFor']
+        return {
+            'MatchWeek': self.match_week,
+            'RollingXGFor': mean['XGFor'],
+            'RollingXGAgainst': mean['XGAgainst'],
+            'RollingGoalsFor': mean['GoalsFor'],
+            'RollingGoalsAgainst': mean['GoalsAgainst'],
+            'RollingGoalDiff': mean['GoalsFor'] - mean['GoalsAgainst'],
+            'RollingShots': shots,
+            'RollingShotQuality': mean['XGFor'] / shots if shots > 0 else np.nan,
+            'FormEWM': ewm['Points'],
+            'XGDiffEWM': ewm['XGFor'] - ewm['XGAgainst'],
+        }
+
+
+class RollingForm:
+    ''' Incremental rolling form metrics of all teams of a season. The matches must be added in the order they
+        were played; a match that was already added is skipped, so the events of a new match day can be added
+        without recomputing the season. '''
+
+    def __init__(self, window=5, alpha=0.3):
+        self.window = window
+        self.alpha = alpha
+        self.teams = {}
+        self.rows = {}
+        self.match_ids = set()
+
+    def update(self, df_match_stats):
+        ''' Adds the statistics of one or more matches, indexed by (team_name, match_id) as returned by
+            data_preparation.get_match_stats with FORM_STATS, with the MatchWeek of the team in the match calendar
+            as in data_preparation.update_rolling_form. '''
+        df_match_stats = df_match_stats.rename(columns={column: value for value, column in STAT_COLUMNS.items()})
+        new_match_ids = set()
+        for (team_name, match_id), row in zip(df_match_stats.index, df_match_stats.itertuples(index=False)):
+            if match_id in self.match_ids:
+                continue
+            new_match_ids.add(match_id)
+            row = row._asdict()
+            row['Points'] = 3 if row['GoalsFor'] > row['GoalsAgainst'] else int(row['GoalsFor'] == row['GoalsAgainst'])
+            team = self.teams.setdefault(team_name, TeamForm(self.window, self.alpha))
+            self.rows.setdefault(team_name, []).append(team.update([row[value] for value in MATCH_VALUES],
+                                                                   row['MatchWeek']))
+        self.match_ids |= new_match_ids
+
+    def to_frame(self, team_name=None):
+        ''' Returns the form metrics after each match of the team indexed by MatchWeek, or of all teams indexed by
+            (team_name, MatchWeek) if no team is given. '''
+        if team_name is not None:
+            return pd.DataFrame(self.rows.get(team_name, []), columns=['MatchWeek'] + FORM_METRICS) \
+                .set_index('MatchWeek')
+        df = pd.concat({team: self.to_frame(team) for team in self.rows}, names=['team_name'])
+        return df.sort_index()
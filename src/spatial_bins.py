@@ -0,0 +1,145 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from mplsoccer import Pitch
+
+
+# A grid consists of one or more rectangular sub-grids given by their x and y bin edges. The sub-grids must not
+# overlap, which allows irregular grids such as the Juego de posición zones.
+Grid = namedtuple('Grid', ['name', 'subgrids'])
+
+# The binned statistics of many groups: keys is a DataFrame with one row per group and statistic an array of
+# shape (groups, cells), where the cells are numbered sub-grid by sub-grid with the y bins varying fastest.
+BinnedEvents = namedtuple('BinnedEvents', ['grid', 'keys', 'statistic'])
+
+
+####################################################################################
+# GRIDS
+####################################################################################
+
+
+def uniform_grid(nx, ny, pitch_type='statsbomb'):
+    ''' Returns a grid with nx * ny equally sized bins over the pitch. '''
+    dim = Pitch(pitch_type=pitch_type).dim
+    x_edges = np.linspace(dim.left, dim.right, nx + 1)
+    y_edges = np.linspace(min(dim.bottom, dim.top), max(dim.bottom, dim.top), ny + 1)
+    return Grid(f'uniform_{nx}x{ny}', [(x_edges, y_edges)])
+
+
+def positional_grid(positional='full', pitch_type='statsbomb'):
+    ''' Returns the Juego de posición grid, with the same zones as mplsoccer's bin_statistic_positional. '''
+    dim = Pitch(pitch_type=pitch_type).dim
+    px, py = np.asarray(dim.positional_x), np.asarray(dim.positional_y)
+    if positional == 'full':
+        subgrids = [(px, py[[0, 1]]),               # wing lane on one side
+                    (px, py[[4, 5]]),               # wing lane on the other side
+                    (px[[1, 3, 5]], py[1:5]),       # middle of the pitch
+                    (px[[0, 1]], py[[1, 4]]),       # penalty area
+                    (px[[5, 6]], py[[1, 4]])]       # penalty area
+    elif positional == 'horizontal':
+        subgrids = [(px[[0, 6]], py)]
+    elif positional == 'vertical':
+        subgrids = [(px, py[[0, 5]])]
+    else:
+        raise ValueError("positional must be one of 'full', 'vertical' or 'horizontal'")
+    return Grid(f'positional_{positional}', subgrids)
+
+
+def zone_grid(zones, name='zones'):
+    ''' Returns a grid with one bin per (x_min, x_max, y_min, y_max) zone. '''
+    return Grid(name, [(np.array([x_min, x_max]), np.array([y_min, y_max])) for x_min, x_max, y_min, y_max in zones])
+
+
+def get_cell_count(grid):
+    return sum((len(x_edges) - 1) * (len(y_edges) - 1) for x_edges, y_edges in grid.subgrids)
+
+
+def get_cell_edges(grid):
+    ''' Returns one row per cell of the grid with its edges, in the order of the cell numbers. '''
+    rows = []
+    for x_edges, y_edges in grid.subgrids:
+        for i in range(len(x_edges) - 1):
+            for j in range(len(y_edges) - 1):
+                rows.append((x_edges[i], x_edges[i + 1], y_edges[j], y_edges[j + 1]))
+    return pd.DataFrame(rows, columns=['x_min', 'x_max', 'y_min', 'y_max'])
+
+
+def get_cells(grid, x, y):
+    ''' Returns the cell number of each x/y location, or -1 for locations outside of the grid.
+        Bins include their lower edge, the outer edges of the grid are included as well. '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x_max = max(x_edges[-1] for x_edges, _ in grid.subgrids)
+    y_max = max(y_edges[-1] for _, y_edges in grid.subgrids)
+    # locations on the outer edge are moved into the last bin
+    x = np.where(x == x_max, np.nextafter(x_max, -np.inf), x)
+    y = np.where(y == y_max, np.nextafter(y_max, -np.inf), y)
+
+    cells = np.full(len(x), -1, dtype=np.int64)
+    offset = 0
+    for x_edges, y_edges in grid.subgrids:
+        nx, ny = len(x_edges) - 1, len(y_edges) - 1
+        ix = np.searchsorted(x_edges, x, side='right') - 1
+        iy = np.searchsorted(y_edges, y, side='right') - 1
+        inside = (cells == -1) & (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        cells[inside] = offset + ix[inside] * ny + iy[inside]
+        offset += nx * ny
+    return cells
+
+
+####################################################################################
+# BINNING
+####################################################################################
+
+
+def bin_events(df, grid, group_cols=('team_name',), values=None, normalize=False):
+    ''' Counts the events (or sums the values column) per cell of the grid for all groups at once with a single
+        np.bincount. With normalize the statistic of each group is divided by the group total, which gives the
+        share of the events per cell. '''
+    group_cols = list(group_cols)
+    df = df.dropna(subset=['x', 'y'])
+    n_cells = get_cell_count(grid)
+    cells = get_cells(grid, df['x'].to_numpy(), df['y'].to_numpy())
+
+    if group_cols:
+        codes = df.groupby(group_cols, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+        keys = df[group_cols].drop_duplicates().reset_index(drop=True)
+    else:
+        codes, keys = np.zeros(len(df), dtype=np.int64), pd.DataFrame(index=[0])
+    n_groups = len(keys)
+
+    inside = cells >= 0
+    flat = codes[inside] * n_cells + cells[inside]
+    weights = None if values is None else df[values].to_numpy(dtype=np.float64)[inside]
+    statistic = np.bincount(flat, weights=weights, minlength=n_groups * n_cells).reshape(n_groups, n_cells)
+
+    if normalize:
+        totals = statistic.sum(axis=1, keepdims=True)
+        statistic = np.divide(statistic, totals, out=np.zeros(statistic.shape), where=totals > 0)
+    return BinnedEvents(grid, keys, statistic)
+
+
+def select(binned, **keys):
+    ''' Returns the statistic of the group with the given keys, e.g. select(binned, team_name='Arsenal WFC'). '''
+    mask = np.ones(len(binned.keys), dtype=bool)
+    for column, value in keys.items():
+        mask &= (binned.keys[column] == value).to_numpy()
+    if not mask.any():
+        return np.zeros(binned.statistic.shape[1])
+    return binned.statistic[np.flatnonzero(mask)[0]]
+
+
+def to_bin_statistic(grid, statistic):
+    ''' Converts the statistic of one group into the list of dictionaries used by mplsoccer's heatmap,
+        heatmap_positional and label_heatmap, so the plotting code only renders precomputed values. '''
+    stats = []
+    offset = 0
+    for x_edges, y_edges in grid.subgrids:
+        nx, ny = len(x_edges) - 1, len(y_edges) - 1
+        x_grid, y_grid = np.meshgrid(x_edges, y_edges)
+        cx, cy = np.meshgrid((x_edges[1:] + x_edges[:-1]) / 2, (y_edges[1:] + y_edges[:-1]) / 2)
+        stats.append({'statistic': statistic[offset:offset + nx * ny].reshape(nx, ny).T,
+                      'x_grid': x_grid, 'y_grid': y_grid, 'cx': cx, 'cy': cy,
+                      'binnumber': None, 'inside': None})
+        offset += nx * ny
+    return stats
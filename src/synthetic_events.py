@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import event_store as es
+
+
+# Event types with their share of the events of a StatsBomb match (roughly as in the 2018/19 WSL season)
+EVENT_TYPES = {
+    'Pass': 0.28, 'Ball Receipt': 0.26, 'Carry': 0.21, 'Pressure': 0.09, 'Ball Recovery': 0.03,
+    'Duel': 0.02, 'Clearance': 0.015, 'Block': 0.01, 'Dribble': 0.01, 'Shot': 0.008, 'Foul Committed': 0.007,
+    'Foul Won': 0.007, 'Interception': 0.006, 'Goal Keeper': 0.006, 'Miscontrol': 0.006, 'Dispossessed': 0.005,
+    'Dribbled Past': 0.005, 'Offside': 0.001, 'Substitution': 0.002,
+}
+SHOT_OUTCOMES = {'Off T': 0.33, 'Saved': 0.27, 'Blocked': 0.26, 'Goal': 0.11, 'Wayward': 0.02, 'Post': 0.01}
+PASS_SUB_TYPES = {'Throw-in': 0.08, 'Free Kick': 0.04, 'Goal Kick': 0.02, 'Corner': 0.02, 'Kick Off': 0.01}
+PASS_OUTCOMES = {'Incomplete': 0.18, 'Out': 0.03, 'Pass Offside': 0.005, 'Unknown': 0.005}
+
+# The players of a shot freeze frame: the goalkeeper, the outfield defenders and the teammates of the shooter
+FREEZE_FRAME_PLAYERS = [(1, 'Goalkeeper', False)] + [(4, 'Center Back', False)] * 5 + [(23, 'Center Forward', True)] * 3
+
+HEX_DIGITS = np.array([f'{i:02x}' for i in range(256)], dtype='S2')
+
+
+def get_team_names(n_teams):
+    # the first two teams use the names the dashboard knows, so every figure can be rendered
+    return (['Chelsea FCW', 'Arsenal WFC'] + [f'Team {i + 1:02d} WFC' for i in range(2, n_teams)])[:n_teams]
+
+
+def get_round_robin(n_teams):
+    ''' Returns the (match_week, home, away) of a double round robin between the teams, scheduled with the circle
+        method: every team plays once per match week (or has a bye if the number of teams is odd). '''
+    slots = list(range(n_teams)) + ([None] if n_teams % 2 else [])
+    rounds = []
+    for number in range(len(slots) - 1):
+        pairs = [(slots[i], slots[-1 - i]) for i in range(len(slots) // 2)]
+        # the team in the fixed slot alternates between home and away
+        if number % 2:
+            pairs[0] = pairs[0][::-1]
+        rounds.append([(home, away) for home, away in pairs if home is not None and away is not None])
+        slots = [slots[0], slots[-1]] + slots[1:-1]
+    # the second half of the season has the same matches with home and away swapped
+    rounds += [[(away, home) for home, away in pairs] for pairs in rounds]
+    return [(week, home, away) for week, pairs in enumerate(rounds, start=1) for home, away in pairs]
+
+
+def generate_matches(n_matches, n_teams=12, season_id=4, seed=0):
+    ''' Returns a match list like parser.match(...): a double round robin between the teams, repeated over as
+        many seasons as needed for n_matches, with one match week per round. '''
+    rng = np.random.default_rng(seed)
+    teams = get_team_names(n_teams)
+    schedule = get_round_robin(n_teams)
+    rows = []
+    for i in range(n_matches):
+        season, number = divmod(i, len(schedule))
+        match_week, home, away = schedule[number]
+        match_date = pd.Timestamp('2018-09-09') + pd.Timedelta(weeks=match_week - 1) + pd.DateOffset(years=season)
+        rows.append((100000 + i, match_date, match_week, season_id + season, teams[home], teams[away]))
+    df_matches = pd.DataFrame(rows, columns=['match_id', 'match_date', 'match_week', 'season_id', 'home_team_name',
+                                             'away_team_name'])
+    df_matches['home_score'] = rng.poisson(1.4, n_matches)
+    df_matches['away_score'] = rng.poisson(1.1, n_matches)
+    df_matches['last_updated'] = '2020-07-29T05:00:00'
+    return df_matches
+
+
+def get_event_ids(rng, n):
+    ''' Returns n random UUID-like event ids as in the id column of Sbopen.event, formatted without a loop. '''
+    digits = HEX_DIGITS[rng.integers(0, 256, size=(n, 16), dtype=np.uint8)]
+    groups = [np.ascontiguousarray(digits[:, start:stop]).view(f'S{2 * (stop - start)}').ravel()
+              for start, stop in [(0, 4), (4, 6), (6, 8), (8, 10), (10, 16)]]
+    ids = groups[0]
+    for group in groups[1:]:
+        ids = np.char.add(np.char.add(ids, b'-'), group)
+    return ids.astype(str).astype(object)
+
+
+def choice(rng, probabilities, size):
+    ''' Draws size values from the dict of value -> probability, the remaining probability is drawn as None. '''
+    values = list(probabilities) + [None]
+    p = list(probabilities.values())
+    p.append(max(0.0, 1.0 - sum(p)))
+    p = np.array(p) / sum(p)
+    return np.array(values, dtype=object)[rng.choice(len(values), size=size, p=p)]
+
+
+def generate_events(df_matches, events_per_match=3500, seed=0):
+    ''' Returns StatsBomb events for the matches, with the columns of Sbopen.event and add_match_date that the
+        analysis uses. All columns are drawn with vectorized NumPy operations. '''
+    rng = np.random.default_rng(seed)
+    n_matches = len(df_matches)
+    n = n_matches * events_per_match
+    match_rows = np.repeat(np.arange(n_matches), events_per_match)
+    index = np.tile(np.arange(1, events_per_match + 1), n_matches)
+
+    home = rng.random(n) < 0.52
+    team_name = np.where(home, df_matches['home_team_name'].to_numpy()[match_rows],
+                         df_matches['away_team_name'].to_numpy()[match_rows])
+    team_codes, team_names = pd.factorize(team_name)
+    # 18 players per team, the ids are unique per team
+    player_number = rng.integers(0, 18, n)
+    player_id = (team_codes * 100 + player_number + 1000).astype(np.float64)
+    position_id = (player_number % 25 + 1).astype(np.float64)
+    player_codes, player_ids = pd.factorize(player_id)
+
+    type_name = choice(rng, EVENT_TYPES, n)
+    is_pass = type_name == 'Pass'
+    is_shot = type_name == 'Shot'
+    outcome_name = np.full(n, None, dtype=object)
+    outcome_name[is_shot] = choice(rng, SHOT_OUTCOMES, is_shot.sum())
+    outcome_name[is_pass] = choice(rng, PASS_OUTCOMES, is_pass.sum())
+    sub_type_name = np.full(n, None, dtype=object)
+    sub_type_name[is_pass] = choice(rng, PASS_SUB_TYPES, is_pass.sum())
+    sub_type_name[is_shot] = 'Open Play'
+
+    minute = np.minimum(index * 95 // events_per_match, 94)
+    x = rng.uniform(0, 120, n)
+    y = rng.uniform(0, 80, n)
+    x[is_shot] = rng.uniform(90, 120, is_shot.sum())
+    y[is_shot] = rng.uniform(20, 60, is_shot.sum())
+    pass_length = np.where(is_pass, rng.gamma(2.5, 8.0, n), np.nan)
+    pass_angle = np.where(is_pass, rng.uniform(-np.pi, np.pi, n), np.nan)
+    end_x = np.where(is_pass, np.clip(x + pass_length * np.cos(pass_angle), 0, 120), np.nan)
+    end_y = np.where(is_pass, np.clip(y + pass_length * np.sin(pass_angle), 0, 80), np.nan)
+    end_x[is_shot] = 120
+    end_y[is_shot] = rng.uniform(30, 50, is_shot.sum())
+    xg = np.where(is_shot, rng.beta(0.8, 7.0, n), np.nan)
+    is_sub = type_name == 'Substitution'
+    replacement_id = np.where(is_sub, player_id + 11 - player_number % 11, np.nan)
+
+    df = pd.DataFrame({
+        'id': get_event_ids(rng, n),
+        'index': index,
+        'period': np.where(minute < 45, 1, 2),
+        'minute': minute,
+        'second': rng.integers(0, 60, n),
+        'possession': index // 20 + 1,
+        'duration': rng.exponential(1.2, n),
+        'match_id': df_matches['match_id'].to_numpy()[match_rows],
+        'type_name': type_name,
+        'sub_type_name': sub_type_name,
+        'outcome_name': outcome_name,
+        'play_pattern_name': 'Regular Play',
+        'team_name': team_name,
+        'possession_team_name': team_name,
+        'player_id': player_id,
+        'player_name': pd.Categorical.from_codes(player_codes, [f'Player {int(i)}' for i in player_ids]),
+        'position_id': position_id,
+        'x': x,
+        'y': y,
+        'end_x': end_x,
+        'end_y': end_y,
+        'under_pressure': np.where(rng.random(n) < 0.15, True, None),
+        'pass_length': pass_length,
+        'pass_angle': pass_angle,
+        'pass_recipient_id': np.where(is_pass, player_id + 1, np.nan),
+        'shot_statsbomb_xg': xg,
+        'substitution_replacement_id': replacement_id,
+        'match_week': df_matches['match_week'].to_numpy()[match_rows],
+        'match_date': df_matches['match_date'].to_numpy()[match_rows],
+    })
+    return es.apply_schema(df)
+
+
+def generate_freeze_frames(df_events, seed=0):
+    ''' Returns the freeze frames of the shots of the events like Sbopen.event: one row per player and shot with
+        the FREEZE_FRAME_PLAYERS. The goalkeeper stands on the goal line, the defenders between the shot and the
+        goal and the teammates anywhere in the final third. '''
+    rng = np.random.default_rng(seed)
+    df_shots = df_events.loc[df_events['type_name'] == 'Shot', ['match_id', 'id', 'x', 'y', 'team_name']]
+    n_players = len(FREEZE_FRAME_PLAYERS)
+    rows = np.repeat(np.arange(len(df_shots)), n_players)
+    n = len(rows)
+    position_id, position_name, teammate = (np.tile(np.array(values, dtype=object), len(df_shots))
+                                            for values in zip(*FREEZE_FRAME_PLAYERS))
+    is_goalkeeper = position_id == 1
+    shot_x = df_shots['x'].to_numpy(dtype=np.float64)[rows]
+    shot_y = df_shots['y'].to_numpy(dtype=np.float64)[rows]
+    # the defenders stand on the way to the goal, between 20% and 90% of the distance from the shot
+    share = rng.uniform(0.2, 0.9, n)
+    x = np.where(teammate.astype(bool), rng.uniform(80, 120, n), shot_x + share * (120 - shot_x))
+    y = np.where(teammate.astype(bool), rng.uniform(10, 70, n), shot_y + share * (40 - shot_y) + rng.normal(0, 3, n))
+    x[is_goalkeeper] = rng.uniform(117, 120, is_goalkeeper.sum())
+    y[is_goalkeeper] = rng.uniform(37, 43, is_goalkeeper.sum())
+    player_id = rng.integers(1000, 3000, n).astype(np.float64)
+
+    df = pd.DataFrame({
+        'teammate': teammate.astype(bool),
+        'match_id': df_shots['match_id'].to_numpy()[rows],
+        'id': df_shots['id'].to_numpy(dtype=object)[rows],
+        'x': x,
+        'y': np.clip(y, 0, 80),
+        'player_id': player_id,
+        'player_name': [f'Player {int(i)}' for i in player_id],
+        'position_id': position_id.astype(np.float64),
+        'position_name': position_name,
+        'event_freeze_id': np.tile(np.arange(1, n_players + 1), len(df_shots)),
+    })
+    return es.apply_schema(df)
+
+
+def generate_season_events(scale=1, n_teams=12, events_per_match=3500, seed=0):
+    ''' Returns the matches and events at the given scale. Scale 1 has as many matches as one team season,
+        scale 10 is roughly a league season and scale 100 several league seasons. '''
+    n_matches = scale * 2 * (n_teams - 1)
+    df_matches = generate_matches(n_matches, n_teams=n_teams, seed=seed)
+    return df_matches, generate_events(df_matches, events_per_match=events_per_match, seed=seed)
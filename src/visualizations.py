@@ -1,75 +1,121 @@
 import cmasher as cmr
 from highlight_text import ax_text
 import matplotlib.patheffects as path_effects
-from mplsoccer import Pitch, Sbopen, VerticalPitch, FontManager
+from mplsoccer import Pitch, VerticalPitch
 import numpy as np
 import pandas as pd
-import plotly.graph_objs as go
 import plotly.graph_objects as go
 import plotly.express as px
 import warnings
 import streamlit as st
+import event_query as eq
+import event_store as es
+import instrumentation as ins
+import render_cache as rc
+import spatial_bins as sb
+
+
+####################################################################################
+# CHARTS
+####################################################################################
+
+# Charts with more points than this are drawn with WebGL (Scattergl) instead of SVG
+WEBGL_POINTS = 1000
+
+# Decimals of the y values sent to the browser
+CHART_DECIMALS = 3
+
+
+def get_series_trace(x, y, name, color, webgl=False, decimals=CHART_DECIMALS):
+    ''' Returns a single lines+markers trace of a series with the y values rounded to the given decimals. '''
+    y = np.round(np.asarray(y, dtype=np.float64), decimals)
+    trace = go.Scattergl if webgl else go.Scatter
+    return trace(x=np.asarray(x), y=y, mode='lines+markers', name=name, line_color=color, marker_color=color)
+
+
+def create_line_chart(series, title, legend_title, x_title='Match Week'):
+    ''' Returns a line chart with one trace per (name, x, y) series. '''
+    colors = px.colors.qualitative.Dark24
+    points = sum(len(x) for _, x, _ in series)
+    webgl = points > WEBGL_POINTS
+    fig = go.Figure([get_series_trace(x, y, name, colors[i % len(colors)], webgl=webgl)
+                     for i, (name, x, y) in enumerate(series)])
+    fig.update_layout(title=title, xaxis_title=x_title, legend_title_text=legend_title, width=1200)
+    # a tick per match week as long as they fit
+    if max((len(x) for _, x, _ in series), default=0) <= 50:
+        fig.update_xaxes(tickmode='linear')
+    return fig
 
 
 @st.cache_data
 def plot_ind_match_week(df, variables_lst):
-    # Reset the index of the DataFrame and use the MatchWeek column as the x variable
-    df = df.reset_index()
-
-    # Create a line plot for each variable in the list
-    fig = px.line(df, x='MatchWeek', y=variables_lst, labels={'variable': 'Statistic'},
-                  color_discrete_sequence=px.colors.qualitative.Dark24)
+    ''' Plots the variables of a team, df is indexed by MatchWeek. '''
+    x = df.index.get_level_values('MatchWeek')
+    return create_line_chart([(var, x, df[var]) for var in variables_lst], 'Match week statistics', 'Statistic')
 
-    fig.update_layout(width=1200)
 
-    # Add scatter plots for each variable in the list
-    for var in variables_lst:
-        fig.add_trace(go.Scatter(x=df['MatchWeek'], y=df[var], mode='markers', showlegend=False,
-                                 marker_color=fig.data[variables_lst.index(var)].line.color))
+@st.cache_data
+def plot_match_week_team_comp(df, variable, team_names):
+    ''' Plots the variable of each of the teams, df is indexed by (team_name, MatchWeek) like the league match
+        week statistics. Only the column of the variable is sliced per team, df is not modified. '''
+    values = df[variable]
+    series = []
+    for team_name in team_names:
+        team_values = values.xs(team_name, level='team_name')
+        series.append((team_name, team_values.index, team_values))
+    return create_line_chart(series, 'Match week statistics', 'Team')
 
-    # Set the layout of the plot
-    fig.update_layout(title='Match week statistics', xaxis_title='Match Week')
-    fig.update_xaxes(tickmode='linear')
 
+@st.cache_data
+def plot_player_comparison(df_players, player_ids, stats):
+    ''' Plots the percentile rank of each of the players among all players of df_players for each statistic, df is
+        indexed by player_id like data_preparation.get_player_season_stats. The hover shows the actual values. '''
+    percentiles = (df_players[stats].rank(pct=True) * 100).round(1)
+    colors = px.colors.qualitative.Dark24
+    fig = go.Figure()
+    for i, player_id in enumerate(player_ids):
+        player = df_players.loc[player_id]
+        values = np.round(player[stats].to_numpy(dtype=np.float64), CHART_DECIMALS)
+        fig.add_trace(go.Scatterpolar(
+            r=percentiles.loc[player_id].tolist() + percentiles.loc[player_id].tolist()[:1],
+            theta=stats + stats[:1], fill='toself', opacity=0.6, line_color=colors[i % len(colors)],
+            name=f'{player.player_name} ({get_short_name(player.team_name)})',
+            customdata=np.r_[values, values[:1]],
+            hovertemplate='%{theta}: %{customdata} (percentile %{r})'))
+    fig.update_layout(title='Player comparison (percentile among all players)', legend_title='Player',
+                      polar=dict(radialaxis=dict(range=[0, 100])))
     return fig
 
 
-@st.cache_data
-def plot_match_week_team_comp(df1, df2, variable):
-    # Add a team_name column to each DataFrame
-    df1['team_name'] = 'Chelsea FCW'
-    df2['team_name'] = 'Arsenal WFC'
-
-    df1 = df1.reset_index()
-    df2 = df2.reset_index()
-    # Combine the DataFrames
-    df = pd.concat([df1, df2], ignore_index=False)
-
-    # Reset the index of the DataFrame and use the MatchWeek column as the x variable
-    # df = df.reset_index()
-    # df = df.set_index('MatchWeek')
-    fig = px.line(df, x='MatchWeek', y=variable, labels={'variable': 'Statistic'},
-                  color='team_name', color_discrete_sequence=px.colors.qualitative.Dark24)
-
-    # Add scatter plots for the variable
-    for i, sub_df in enumerate([df1, df2]):
-        fig.add_trace(go.Scatter(x=sub_df['MatchWeek'], y=sub_df[variable], mode='markers',
-                                 name=sub_df['team_name'].iloc[0], marker_color=fig.data[i].line.color,
-                                 showlegend=False))
-
-    # Set the layout of the plot
-    fig.update_layout(title='Match week statistics', xaxis_title='Match Week', width=1200)
-    fig.update_xaxes(tickmode='linear')
+def render_figure(create_fig, version, *args, fmt='png'):
+    ''' Returns the figure of create_fig as png/svg bytes from the render cache. The cache key consists of the
+        dataset version and the non-DataFrame arguments, so the events DataFrame is never hashed. '''
+    params = [arg for arg in args if not isinstance(arg, pd.DataFrame)]
+    with ins.span(f'figure {create_fig.__name__}', params=str(params)):
+        return rc.get_or_render(create_fig.__name__, version, params, lambda: create_fig(*args), fmt=fmt)
 
-    return fig
 
+def get_short_name(team_name):
+    ''' Returns the team name without the women's team suffix, e.g. Chelsea for Chelsea FCW. '''
+    words = team_name.split(' ')
+    if len(words) > 1 and words[-1] in ('WFC', 'FCW', 'LFC', 'Women', 'Ladies'):
+        words = words[:-1]
+    return ' '.join(words)
 
 
-@st.cache_data
-def create_pressure_maps(df, team_name):
-    # filter chelsea pressure events
-    mask_chelsea_pressure = (df.team_name == team_name) & (df.type_name == 'Pressure')
-    df = df.loc[mask_chelsea_pressure, ['x', 'y']]
+# The columns and rows the pitch maps use, see event_store.Projection
+PRESSURE_MAP_PROJECTION = es.Projection('pressure_map', ['team_name', 'type_name', 'x', 'y'],
+                                        [('type_name', '==', 'Pressure')])
+SHOT_MAP_PROJECTION = es.Projection('shot_map', ['team_name', 'type_name', 'outcome_name', 'x', 'y',
+                                                 'shot_statsbomb_xg'], [('type_name', '==', 'Shot')])
+# The columns of the match events the player pass maps use, the lineup comes from the MatchIndex
+PASS_MAP_COLUMNS = ['team_name', 'type_name', 'sub_type_name', 'player_id', 'outcome_name', 'x', 'y', 'end_x', 'end_y']
+
+
+def create_pressure_maps(df, team_name, bin_statistic=None):
+    ''' bin_statistic can be given as precomputed bins from spatial_bins.to_bin_statistic. '''
+    df = eq.query_frames("SELECT x, y FROM df WHERE team_name = $team_name AND type_name = 'Pressure'",
+                         {'team_name': team_name}, df=df)
 
     path_eff = [path_effects.Stroke(linewidth=3, foreground='black'), path_effects.Normal()]
 
@@ -80,40 +126,27 @@ def create_pressure_maps(df, team_name):
     fig.set_facecolor('#f7faf9')
 
     # heatmap and labels
-    bin_statistic = pitch.bin_statistic_positional(df.x, df.y, statistic='count', positional='full', normalize=True)
+    if bin_statistic is None:
+        grid = sb.positional_grid('full')
+        bin_statistic = sb.to_bin_statistic(grid, sb.bin_events(df, grid, group_cols=(), normalize=True).statistic[0])
     pitch.heatmap_positional(bin_statistic, ax=axs['pitch'], cmap='coolwarm', edgecolors='#f7faf9')
     pitch.scatter(df.x, df.y, c='white', s=2, ax=axs['pitch'])
     labels = pitch.label_heatmap(bin_statistic, color='#f4edf0', fontsize=18,
                                  ax=axs['pitch'], ha='center', va='center',
                                  str_format='{:.0%}', path_effects=path_eff)
 
-    if team_name == 'Chelsea FCW':
-        axs['title'].text(0.5, 0.5, "Pressure applied by Chelsea", color='#070807',
-                          va='center', ha='center', fontsize=20)
-    if team_name == 'Arsenal WFC':
-        axs['title'].text(0.5, 0.5, "Pressure applied by Arsenal", color='#070807',
-                          va='center', ha='center', fontsize=20)
+    axs['title'].text(0.5, 0.5, f"Pressure applied by {get_short_name(team_name)}", color='#070807',
+                      va='center', ha='center', fontsize=20)
     return fig
 
 
-@st.cache_data
 def create_shot_map(df, team_name):
-    if team_name == 'Chelsea FCW':
-        df_shots = df[(df.type_name == 'Shot') & (df.team_name == 'Chelsea FCW')].copy()
-        # subset the barca open play passes
-        df_pass = df[(df.type_name == 'Pass') &
-                     (df.team_name == 'Chelsea FCW') &
-                     (~df.sub_type_name.isin(['Throw-in', 'Corner', 'Free Kick', 'Kick Off']))].copy()
-
-    if team_name == 'Arsenal WFC':
-        df_shots = df[(df.type_name == 'Shot') & (df.team_name == 'Arsenal WFC')].copy()
-        # subset the barca open play passes
-        df_pass = df[(df.type_name == 'Pass') &
-                     (df.team_name == 'Arsenal WFC') &
-                     (~df.sub_type_name.isin(['Throw-in', 'Corner', 'Free Kick', 'Kick Off']))].copy()
-
-    # setup a mplsoccer FontManager to download google fonts (SigmarOne-Regular)
-    fm_rubik = FontManager('https://raw.githubusercontent.com/google/fonts/main/ofl/rubikmonoone/'
+    df_shots = eq.query_frames("SELECT x, y, shot_statsbomb_xg, coalesce(outcome_name = 'Goal', false) AS goal "
+                               "FROM df WHERE team_name = $team_name AND type_name = 'Shot'",
+                               {'team_name': team_name}, df=df)
+
+    # setup a mplsoccer FontManager for the google font (downloaded once and cached locally)
+    fm_rubik = rc.get_font('https://raw.githubusercontent.com/google/fonts/main/ofl/rubikmonoone/'
                            'RubikMonoOne-Regular.ttf')
 
     pitch = VerticalPitch(pad_top=0.5,  # only a small amount of space at the top of the pitch
@@ -124,8 +157,8 @@ def create_shot_map(df, team_name):
                           goal_type='line')
 
     # filter goals / non-shot goals
-    df_goals = df_shots[df_shots.outcome_name == 'Goal'].copy()
-    df_non_goal_shots = df_shots[df_shots.outcome_name != 'Goal'].copy()
+    df_goals = df_shots[df_shots.goal]
+    df_non_goal_shots = df_shots[~df_shots.goal]
 
     fig, ax = pitch.draw(figsize=(12, 10))
 
@@ -149,86 +182,62 @@ def create_shot_map(df, team_name):
                         # for other markers types see: https://matplotlib.org/api/markers_api.html
                         marker='o',
                         ax=ax)
-    if team_name == 'Chelsea FCW':
-        txt = ax.text(x=40, y=85, s='Chelsea shots all season',
-                      size=30,
-                      fontproperties=fm_rubik.prop, color=pitch.line_color,
-                      va='center', ha='center')
-    if team_name == 'Arsenal WFC':
-        txt = ax.text(x=40, y=85, s='Arsenal shots all season',
-                      size=30,
-                      fontproperties=fm_rubik.prop, color=pitch.line_color,
-                      va='center', ha='center')
+    txt = ax.text(x=40, y=85, s=f'{get_short_name(team_name)} shots all season',
+                  size=30,
+                  fontproperties=fm_rubik.prop, color=pitch.line_color,
+                  va='center', ha='center')
 
     return fig
 
 
-@st.cache_data
-def create_pass_map(match_day, location):
-    if match_day == 'first':
-        number = 19736
-    elif match_day == 'second':
-        number = 19785
-    parser = Sbopen()
-    events, related, freeze, tactics = parser.event(number)
-    lineup = parser.lineup(number)
-
-    # dataframe with player_id and when they were subbed off
-    time_off = events.loc[(events.type_name == 'Substitution'),
-                          ['player_id', 'minute']]
-    time_off.rename({'minute': 'off'}, axis='columns', inplace=True)
-    # dataframe with player_id and when they were subbed on
-    time_on = events.loc[(events.type_name == 'Substitution'),
-                         ['substitution_replacement_id', 'minute']]
-    time_on.rename({'substitution_replacement_id': 'player_id',
-                    'minute': 'on'}, axis='columns', inplace=True)
-    players_on = time_on.player_id
-    # merge on times subbed on/off
-    lineup = lineup.merge(time_on, on='player_id', how='left')
-    lineup = lineup.merge(time_off, on='player_id', how='left')
-    # filter the tactics lineup for the starting xi
-    starting_ids = events[events.type_name == 'Starting XI'].id
-    starting_xi = tactics[tactics.id.isin(starting_ids)]
-    starting_players = starting_xi.player_id
-
-    # filter the lineup for players that actually played
-    mask_played = ((lineup.on.notnull()) | (lineup.off.notnull()) | (lineup.player_id.isin(starting_players)))
-    lineup = lineup[mask_played].copy()
-
-    # get the first position for each player and add this to the lineup dataframe
-    player_positions = (events[['player_id', 'position_id']]
-                        .dropna(how='any', axis='rows')
-                        .drop_duplicates('player_id', keep='first'))
-    lineup = lineup.merge(player_positions, how='left', on='player_id')
+def create_shot_context_map(df_features, team_name):
+    ''' Creates the shot map of the team colored by the number of defenders between the shot and the goal.
+        df_features are the shot features of freeze_frames.get_shot_features. '''
+    df_shots = df_features[(df_features.team_name == team_name) & df_features.defenders_in_cone.notnull()]
+
+    fm_rubik = rc.get_font('https://raw.githubusercontent.com/google/fonts/main/ofl/rubikmonoone/'
+                           'RubikMonoOne-Regular.ttf')
+
+    pitch = VerticalPitch(pad_top=0.5, pad_bottom=-20, pad_left=-15, pad_right=-15, half=True, goal_type='line')
+    fig, ax = pitch.draw(figsize=(12, 10))
+
+    # 0, 1, 2 and 3+ defenders in the shooting cone
+    defenders = df_shots.defenders_in_cone.clip(upper=3)
+    cmap = cmr.get_sub_cmap('cmr.sunburst_r', 0.1, 0.8, N=4)
+    sc = pitch.scatter(df_shots.x, df_shots.y,
+                       # size varies between 100 and 1900 (points squared)
+                       s=(df_shots.shot_statsbomb_xg * 1900) + 100,
+                       c=defenders, cmap=cmap, vmin=-0.5, vmax=3.5,
+                       edgecolors=np.where(df_shots.outcome_name == 'Goal', '#b94b75', '#606060'),
+                       linewidth=np.where(df_shots.outcome_name == 'Goal', 3, 1),
+                       marker='o', ax=ax)
+    # the goalkeeper positions of the shots
+    pitch.scatter(df_shots.goalkeeper_x, df_shots.goalkeeper_y, s=20, c='#606060', marker='x', alpha=0.4, ax=ax)
+
+    cbar = fig.colorbar(sc, ax=ax, ticks=[0, 1, 2, 3], shrink=0.6, pad=0.01)
+    cbar.ax.set_yticklabels(['0', '1', '2', '3+'])
+    cbar.set_label('Defenders between the shot and the goal')
+    ax.text(x=40, y=85, s=f'{get_short_name(team_name)} shot context', size=30, fontproperties=fm_rubik.prop,
+            color=pitch.line_color, va='center', ha='center')
+    return fig
+
+
+def create_pass_map(events, lineup, team):
+    ''' Creates the player pass maps of the team for a single match. events and lineup are the events and the
+        lineup of the match, as returned by the MatchIndex. '''
+    opponent = [team_name for team_name in lineup.team_name.unique() if team_name != team][0]
 
     # add on the position abbreviation
     formation_dict = {1: 'GK', 2: 'RB', 3: 'RCB', 4: 'CB', 5: 'LCB', 6: 'LB', 7: 'RWB',
                       8: 'LWB', 9: 'RDM', 10: 'CDM', 11: 'LDM', 12: 'RM', 13: 'RCM',
                       14: 'CM', 15: 'LCM', 16: 'LM', 17: 'RW', 18: 'RAM', 19: 'CAM',
                       20: 'LAM', 21: 'LW', 22: 'RCF', 23: 'ST', 24: 'LCF', 25: 'SS'}
-    lineup['position_abbreviation'] = lineup.position_id.map(formation_dict)
+    lineup_team = lineup[lineup.team_name == team].copy()
+    lineup_team['position_abbreviation'] = lineup_team.position_id.map(formation_dict)
 
     # sort the dataframe so the players are
     # in the order of their position (if started), otherwise in the order they came on
-    lineup['start'] = lineup.player_id.isin(starting_players)
-    lineup.sort_values(['team_name', 'start', 'on', 'position_id'],
-                       ascending=[True, False, True, True], inplace=True)
-    if number == 19785:
-        # if you want the other team set team = team2
-        team1, team2 = lineup.team_name.unique()
-        if location == 'home':
-            team = team1
-        elif location == 'away':
-            team = team2
-        lineup_team = lineup[lineup.team_name == team].copy()
-    elif number == 19736:
-        # if you want the other team set team = team2
-        team1, team2 = lineup.team_name.unique()
-        if location == 'home':
-            team = team2
-        elif location == 'away':
-            team = team1
-        lineup_team = lineup[lineup.team_name == team].copy()
+    lineup_team.sort_values(['start', 'on', 'position_id'], ascending=[False, True, True], inplace=True)
 
     # filter the events to exclude some set pieces
     set_pieces = ['Throw-in', 'Free Kick', 'Corner', 'Kick Off', 'Goal Kick']
@@ -237,6 +246,9 @@ def create_pass_map(match_day, location):
     # for the player pass maps
     passes_excl_throw = events[(events.team_name == team) & (events.type_name == 'Pass') &
                                (events.sub_type_name != 'Throw-in')].copy()
+    # group the passes by player once instead of filtering them for each player
+    player_passes = dict(tuple(passes_excl_throw.groupby('player_id')))
+    no_passes = passes_excl_throw.iloc[:0]
 
     # identify how many players played and how many subs were used
     # we will use this in the loop for only plotting pass maps for as
@@ -254,7 +266,7 @@ def create_pass_map(match_day, location):
                      connectionstyle="arc3,rad=-0.8", fc="red", ec="red")
 
     # a fontmanager object for using a google font
-    fm_scada = FontManager('https://raw.githubusercontent.com/googlefonts/scada/main/fonts/ttf/Scada-Regular.ttf')
+    fm_scada = rc.get_font('https://raw.githubusercontent.com/googlefonts/scada/main/fonts/ttf/Scada-Regular.ttf')
 
     warnings.simplefilter("ignore", UserWarning)
 
@@ -272,7 +284,7 @@ def create_pass_map(match_day, location):
             # filter the complete/incomplete passes for each player (excudes throw-ins)
             lineup_player = lineup_team.iloc[idx]
             player_id = lineup_player.player_id
-            player_pass = passes_excl_throw[passes_excl_throw.player_id == player_id]
+            player_pass = player_passes.get(player_id, no_passes)
             complete_pass = player_pass[player_pass.outcome_name.isnull()]
             incomplete_pass = player_pass[player_pass.outcome_name.notnull()]
 
@@ -289,7 +301,7 @@ def create_pass_map(match_day, location):
             annotation_string = (f'{lineup_player.position_abbreviation} | '
                                  f'{lineup_player.player_name} | '
                                  f'<{len(complete_pass)}>/{total_pass} | '
-                                 f'{round(100 * len(complete_pass) / total_pass, 1)}%')
+                                 f'{round(100 * len(complete_pass) / max(total_pass, 1), 1)}%')
             ax_text(0, -5, annotation_string, ha='left', va='center', fontsize=13,
                     fontproperties=fm_scada.prop,  # using the fontmanager for the google font
                     highlight_textprops=[{"color": '#56ae6c'}], ax=ax)
@@ -320,7 +332,7 @@ def create_pass_map(match_day, location):
         ax.remove()
 
     # title text
-    axs['title'].text(0.5, 0.65, f'{team1} Pass Maps vs {team2}', fontsize=40,
+    axs['title'].text(0.5, 0.65, f'{team} Pass Maps vs {opponent}', fontsize=40,
                       fontproperties=fm_scada.prop, va='center', ha='center')
     SUB_TEXT = ('Player Pass Maps: exclude throw-ins only\n'
                 'Team heatmap: includes all attempted pass receipts')
@@ -328,3 +340,37 @@ def create_pass_map(match_day, location):
                       fontproperties=fm_scada.prop, va='center', ha='center')
 
     return fig
+
+
+def create_pass_network(nodes, edges, team, opponent):
+    ''' Creates the pass network of the team for a single match from the nodes and edges of a
+        possession_chains.PassNetwork. The players are placed at their average location, the line widths show the
+        number of completed passes between two players and the marker sizes the number of passes of the player. '''
+    # passes in both directions are combined into one line
+    edges = edges.assign(player_a=edges[['player_id', 'recipient_id']].min(axis=1),
+                         player_b=edges[['player_id', 'recipient_id']].max(axis=1))
+    edges = edges.groupby(['player_a', 'player_b'], as_index=False)['passes'].sum()
+    locations = nodes.set_index('player_id')[['x', 'y']]
+    edges = edges.join(locations, on='player_a').join(locations, on='player_b', rsuffix='_end').dropna()
+
+    fm_scada = rc.get_font('https://raw.githubusercontent.com/googlefonts/scada/main/fonts/ttf/Scada-Regular.ttf')
+    pitch = Pitch(pitch_type='statsbomb', pitch_color='#22312b', line_color='#c7d5cc')
+    fig, axs = pitch.grid(figheight=10, title_height=0.08, endnote_space=0, axis=False,
+                          title_space=0, grid_height=0.82, endnote_height=0.05)
+    fig.set_facecolor('#22312b')
+
+    max_passes = max(edges['passes'].max(), 1) if len(edges) else 1
+    pitch.lines(edges.x, edges.y, edges.x_end, edges.y_end, lw=edges.passes / max_passes * 12,
+                color='#BB7F8E', alpha=0.8, zorder=1, ax=axs['pitch'])
+    max_node = max(nodes['passes'].max(), 1) if len(nodes) else 1
+    pitch.scatter(nodes.x, nodes.y, s=300 + nodes.passes / max_node * 1200, color='#E4E4E4',
+                  edgecolors='#22312b', linewidth=1, alpha=1, zorder=2, ax=axs['pitch'])
+    for node in nodes.itertuples():
+        pitch.annotate(str(node.player_name).split(' ')[-1], xy=(node.x, node.y - 4), c='white', va='center',
+                       ha='center', size=11, fontproperties=fm_scada.prop, ax=axs['pitch'])
+
+    axs['title'].text(0.5, 0.7, f'{team} Pass Network vs {opponent}', color='#c7d5cc', va='center', ha='center',
+                      fontproperties=fm_scada.prop, fontsize=30)
+    axs['title'].text(0.5, 0.25, 'Completed open play passes, players at their average pass and receipt location',
+                      color='#c7d5cc', va='center', ha='center', fontproperties=fm_scada.prop, fontsize=16)
+    return fig
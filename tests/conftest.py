@@ -0,0 +1,5 @@
+import os.path
+import sys
+
+# the modules of the app are imported from the src folder, as when the scripts are run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,36 @@
+import os.path
+import pytest
+import event_fetcher as ef
+import local_parser as lp
+
+
+FIXTURE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'open_data')
+MATCH_IDS = [1001, 1002]
+
+
+def test_fetch_events_resumes_after_partial_run(tmp_path):
+    folder = str(tmp_path)
+    # a run that stopped after the first match
+    ef.fetch_events(lp.LocalSbopen(FIXTURE_FOLDER), MATCH_IDS[:1], folder, progress=None)
+
+    parser = lp.LocalSbopen(FIXTURE_FOLDER)
+    files = ef.fetch_events(parser, MATCH_IDS, folder, progress=None)
+    assert files == [ef.get_match_file(folder, match_id) for match_id in MATCH_IDS]
+    assert all(os.path.isfile(file) for match_id in MATCH_IDS for file in ef.get_match_files(folder, match_id))
+    assert dict(parser.requests) == {('event', 1002): 1}
+
+
+def test_fetch_events_retries_failed_requests(tmp_path):
+    folder = str(tmp_path)
+    parser = lp.LocalSbopen(FIXTURE_FOLDER, failures=2)
+    ef.fetch_events(parser, MATCH_IDS, folder, retries=3, backoff=0, progress=None)
+    assert all(os.path.isfile(ef.get_match_file(folder, match_id)) for match_id in MATCH_IDS)
+    assert dict(parser.requests) == {('event', match_id): 3 for match_id in MATCH_IDS}
+
+
+def test_fetch_events_gives_up_after_retries(tmp_path):
+    folder = str(tmp_path)
+    parser = lp.LocalSbopen(FIXTURE_FOLDER, failures=2)
+    with pytest.raises(ConnectionError):
+        ef.fetch_events(parser, MATCH_IDS, folder, retries=1, backoff=0, progress=None)
+    assert not any(os.path.isfile(ef.get_match_file(folder, match_id)) for match_id in MATCH_IDS)